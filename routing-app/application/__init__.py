@@ -3,8 +3,20 @@ Initialize the app
 '''
 
 import os
-from flask import Flask, render_template, request, jsonify
-from .python_scripts import routing
+import gzip
+import json
+import math
+import hashlib
+from time import time, perf_counter
+from flask import Flask, render_template, request, jsonify, abort, g
+from .python_scripts import (routing, graph_store, route_cache, route_pool, tiles, overrides,
+                             eta_model, polyline, metrics)
+from .python_scripts.memory import process_memory
+from .python_scripts.search import NoRouteError
+from .python_scripts.matrix import MatrixTooLargeError
+from .python_scripts.isochrone import IsochroneError
+from .python_scripts.weights import UnknownProfileError
+from . import commands
 
 # To run the app : source ./.env/Scripts/activate
 # then : python -m flask --app application run --debug
@@ -14,6 +26,50 @@ def create_app():
     Create and configure the app
     '''
     app = Flask(__name__, instance_relative_config=True)
+    app.config.from_mapping(
+        # (north, south, east, west) area of the graph kept in memory
+        GRAPH_BBOX=graph_store.ILE_DE_FRANCE_BBOX,
+        NETWORK_TYPE="bike",
+        # Folder of the precomputed structures of the graph (contraction hierarchy, ...)
+        GRAPH_DIR=os.path.join(app.instance_path, "graph"),
+        # Default way to snap the start and the end on the graph ("node" or "edge")
+        SNAP_MODE="node",
+        # Memory budget of the route cache (bytes), 0 disables the cache
+        ROUTE_CACHE_BYTES=route_cache.DEFAULT_CACHE_BYTES,
+        # Folder of the route cache shared by the workers, None to keep it in memory only
+        ROUTE_CACHE_DIR=None,
+        # Time (s) after which the search of alternative routes stops
+        ALTERNATIVES_TIME_BUDGET=0.5,
+        # Threads computing the routes, routes waiting for a thread and time (s) a request
+        # waits for its route (see route_pool), 0 threads to compute them in the requests
+        ROUTE_WORKERS=route_pool.DEFAULT_WORKERS,
+        ROUTE_QUEUE=route_pool.DEFAULT_MAX_QUEUE,
+        ROUTE_TIMEOUT=route_pool.DEFAULT_TIMEOUT,
+        # Build the spatial index and the reversed graph at startup instead of at the first
+        # request, to share them between the workers of gunicorn (see gunicorn.conf.py)
+        WARM_UP=False,
+        # Use the tiles of the graph (see build-tiles) loaded on demand instead of the resident
+        # graph, and the memory budget of the loaded tiles (bytes)
+        GRAPH_TILES=False,
+        TILES_CACHE_BYTES=tiles.DEFAULT_TILES_BYTES,
+        # Token of the admin requests (header X-Admin-Token), None to allow them without token
+        ADMIN_TOKEN=None,
+        # File of the ETA model of the routes (see build-eta-model), None for the one of the
+        # graph folder
+        ETA_MODEL=None,
+        # JSON responses larger than this size (bytes) are compressed with gzip when the
+        # client accepts it, 0 disables the compression
+        GZIP_MIN_BYTES=1024,
+        GZIP_LEVEL=6,
+        # Profile one computation of route in PROFILE_EVERY with cProfile, 0 to never profile,
+        # and folder of the profiles
+        PROFILE_EVERY=0,
+        PROFILE_DIR=os.path.join(app.instance_path, "profiles"),
+    )
+    # The configuration can be overridden in instance/config.py
+    app.config.from_pyfile('config.py', silent=True)
+    # and by the environment variables FLASK_<KEY> (for example FLASK_WARM_UP=true)
+    app.config.from_prefixed_env()
 
     # ensure the instance folder exists
     try:
@@ -21,6 +77,67 @@ def create_app():
     except OSError:
         pass
 
+    # First, so the times of the loading of the graph are in the metrics
+    metrics.configure_metrics(app.config["PROFILE_EVERY"], app.config["PROFILE_DIR"])
+    # Build the graph once, every request is then answered with it
+    if app.config["GRAPH_TILES"]:
+        graph_store.load_tiles(app.config["GRAPH_DIR"], app.config["TILES_CACHE_BYTES"])
+    else:
+        store = graph_store.load_store(app.config["GRAPH_BBOX"], app.config["NETWORK_TYPE"],
+                                       app.config["GRAPH_DIR"], app.config["WARM_UP"])
+        overrides.configure_overrides(store, os.path.join(app.config["GRAPH_DIR"],
+                                                          overrides.OVERRIDES_FILENAME))
+    route_cache.configure_cache(app.config["ROUTE_CACHE_BYTES"], app.config["ROUTE_CACHE_DIR"])
+    route_pool.configure_pool(app.config["ROUTE_WORKERS"], app.config["ROUTE_QUEUE"],
+                              app.config["ROUTE_TIMEOUT"])
+    eta_model.load_eta_model(app.config["ETA_MODEL"] or
+                             os.path.join(app.config["GRAPH_DIR"], eta_model.ETA_MODEL_FILENAME))
+    commands.init_app(app)
+    memory = process_memory()
+    print(f"Mémoire du processus {memory['pid']} : RSS {memory['rss']:.1f} Mo,"
+          f" dont {memory['shared']:.1f} Mo partagés")
+
+    # The overrides of the weights changed by the other workers or expired are applied first
+    @app.before_request
+    def sync_overrides():
+        g.request_start = perf_counter()
+        if overrides.get_overrides() is not None:
+            overrides.get_overrides().sync()
+
+    # Time and size of the responses, registered first to run after the compression
+    @app.after_request
+    def record_request(response):
+        endpoint = request.endpoint or "unknown"
+        stats = metrics.get_metrics()
+        if "request_start" in g:
+            stats.observe("http_request_duration_seconds", perf_counter() - g.request_start,
+                          endpoint=endpoint)
+        if not response.direct_passthrough and response.content_length is not None:
+            stats.observe("http_response_bytes", response.content_length, endpoint=endpoint)
+        return response
+
+    # The JSON responses get an ETag, the GET requests are answered by 304 when the client
+    # already has them (RFC 9110: not the POST requests), and they are compressed when large
+    @app.after_request
+    def compress(response):
+        if response.mimetype != "application/json" or response.status_code != 200 \
+                or response.direct_passthrough:
+            return response
+        if response.get_etag()[0] is None:
+            response.add_etag(weak=True)
+        if request.method in ("GET", "HEAD") \
+                and request.if_none_match.contains_weak(response.get_etag()[0]):
+            response.status_code = 304
+            response.set_data(b"")
+            return response
+        min_bytes = app.config["GZIP_MIN_BYTES"]
+        if min_bytes and response.content_length >= min_bytes \
+                and "gzip" in request.accept_encodings:
+            response.set_data(gzip.compress(response.get_data(), app.config["GZIP_LEVEL"]))
+            response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
     # Main page
     @app.route('/')
     def hello():
@@ -30,8 +147,137 @@ def create_app():
     @app.route('/calculate_road', methods=['POST'])
     def calculate_routing():
         road_markers = request.get_json()  # Récupère le dictionnaire JSON de la requête POST
-        #Par exemple, renvoyez-le en tant que réponse JSON
+        # Geometry as coordinates or encoded polyline, simplified at the zoom of the map
+        route_format, zoom = polyline.check_format(road_markers.get('format', 'coordinates'),
+                                                   road_markers.get('zoom'))
+        route = routing.get_routing(road_markers.get('start'), road_markers.get('end'),
+                                    road_markers.get('engine'),
+                                    road_markers.get('snap', app.config["SNAP_MODE"]),
+                                    road_markers.get('alternatives', 0),
+                                    app.config["ALTERNATIVES_TIME_BUDGET"],
+                                    road_markers.get('profile'))
+        route = polyline.compact_route(route, route_format, zoom)
+        response = jsonify(route)
+        # The ETag of a route does not depend on whether it was taken from the cache
+        response.set_etag(hashlib.sha1(json.dumps(dict(route, cached=None), sort_keys=True)
+                                       .encode()).hexdigest(), weak=True)
+        return response
+
+    # Requests answered with the resident graph only, refused with the tiled graph
+    def check_resident(name:str):
+        if graph_store.get_tiles() is not None:
+            raise graph_store.TiledGraphError(f"{name} n'est pas disponible avec le graphe"
+                                              " découpé en tuiles.")
+
+    # Travel time matrix between origins and destinations
+    @app.route('/matrix', methods=['POST'])
+    def travel_time_matrix():
+        check_resident("La matrice des temps de parcours")
+        points = request.get_json()
+        durations = routing.matrix(points.get('origins', []), points.get('destinations', []),
+                                   points.get('snap', app.config["SNAP_MODE"]))
+        # The unreachable destinations are null
+        return jsonify({"durations": [[value if math.isfinite(value) else None for value in row]
+                                      for row in durations.tolist()]})
+
+    # Area reachable from a point within a travel time
+    @app.route('/isochrone', methods=['POST'])
+    def reachable_area():
+        check_resident("L'isochrone")
+        query = request.get_json()
+        return jsonify(routing.get_isochrone(query.get('point'), query.get('minutes'),
+                                             query.get('snap', app.config["SNAP_MODE"])))
+
+    # Weight profiles of the routes, with their engines
+    @app.route('/profiles')
+    def profiles():
+        return jsonify(routing.get_profiles())
+
+    # Landmarks of the ALT engine, for inspection
+    @app.route('/landmarks')
+    def landmarks():
+        check_resident("La liste des landmarks")
+        return jsonify(routing.get_landmarks())
+
+    # Counters of the route cache
+    @app.route('/route_cache')
+    def cache_stats():
+        return jsonify(route_cache.get_cache().stats())
+
+    # Size and counters of the pool computing the routes
+    @app.route('/route_pool')
+    def pool_stats():
+        pool = route_pool.get_pool()
+        return jsonify(pool.stats() if pool is not None else {})
+
+    # Counters of the cache of the tiles, with the tiled graph
+    @app.route('/tiles')
+    def tiles_stats():
+        tiled = graph_store.get_tiles()
+        return jsonify(tiled.stats() if tiled is not None else {})
+
+    # Overrides of the weights of the graph (closures, road works, penalties)
+    def check_admin():
+        if overrides.get_overrides() is None:
+            abort(404)
+        token = app.config["ADMIN_TOKEN"]
+        if token is not None and request.headers.get("X-Admin-Token") != token:
+            abort(403)
+
+    @app.route('/admin/overrides', methods=['GET'])
+    def list_overrides():
+        check_admin()
+        return jsonify(overrides.get_overrides().list())
+
+    @app.route('/admin/overrides', methods=['POST'])
+    def add_override():
+        check_admin()
+        query = request.get_json()
+        # Expiry given as a duration (min) or as a timestamp
+        expires = query.get('expires')
+        if query.get('minutes') is not None:
+            try:
+                expires = time() + 60 * float(query['minutes'])
+            except (TypeError, ValueError):
+                raise overrides.OverrideError(f"Durée invalide : {query['minutes']}.") from None
+        override = overrides.get_overrides().add(query.get('ways'), query.get('bbox'),
+                                                 query.get('factor'), expires,
+                                                 query.get('reason', ""))
+        return jsonify(dict(override, factor=None if math.isinf(override["factor"])
+                            else override["factor"])), 201
+
+    @app.route('/admin/overrides/<override_id>', methods=['DELETE'])
+    def remove_override(override_id):
+        check_admin()
+        if not overrides.get_overrides().remove(override_id):
+            abort(404)
+        return jsonify({"removed": override_id})
+
+    # Metrics of the process answering the request, in the Prometheus text format
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return metrics.get_metrics().render(), 200, \
+            {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    # Memory of the process answering the request (MB)
+    @app.route('/memory')
+    def memory_stats():
+        return jsonify(process_memory())
+
+    # Errors of the routing due to the request, sent back to the user
+    def bad_request(error):
+        return jsonify({"error": str(error)}), 400
+
+    for error in (graph_store.OutOfGraphError, graph_store.TiledGraphError,
+                  graph_store.InvalidPointError, NoRouteError, routing.UnknownEngineError,
+                  routing.UnknownSnapModeError, routing.InvalidAlternativesError,
+                  MatrixTooLargeError, IsochroneError, overrides.OverrideError,
+                  UnknownProfileError, polyline.UnknownFormatError):
+        app.register_error_handler(error, bad_request)
 
-        return jsonify(routing.get_routing(road_markers.get('start'), road_markers.get('end')))
+    # Routes refused while the server is overloaded, the request can be sent again later
+    @app.errorhandler(route_pool.RouteUnavailableError)
+    def unavailable(error):
+        return jsonify({"error": str(error)}), 503, {"Retry-After": str(route_pool.RETRY_AFTER)}
 
     return app
\ No newline at end of file
@@ -0,0 +1,508 @@
+'''
+Command line tools of the app (offline preprocessing of the graph)
+'''
+
+import os
+import gzip
+import json
+import click
+from time import time
+import numpy as np
+from flask import current_app
+from .python_scripts import graph_store, route_cache, routing
+from .python_scripts.elevation import DEM, SAMPLE_STEP, add_elevation, sample_edges
+from .python_scripts.eta_model import (ETA_MODEL_FILENAME, FEATURES, SIGNAL_DELAY,
+                                       fit_eta_model, get_eta_model)
+from .python_scripts.contraction import CH_FILENAME, build_hierarchy, check_hierarchy
+from .python_scripts.landmarks import build_landmarks
+from .python_scripts.load_test import (compare_results, environment, random_workload,
+                                       read_workload, run_load, save_results)
+from .python_scripts.learned_speeds import (LEARNED_PROFILE, MIN_SAMPLES, aggregate_speeds,
+                                            profile_speeds, save_learned_speeds, track_files)
+from .python_scripts.osm_import import import_osm
+from .python_scripts.polyline import compact_route
+from .python_scripts.search import NoRouteError
+from .python_scripts.snapshot import current_snapshot, load_snapshot, save_snapshot
+from .python_scripts.tiles import TILE_SIZE, TILES_DIRNAME, build_tiles
+from .python_scripts.weights import DEFAULT_PROFILE, UnknownProfileError, save_rider_speeds
+
+# To build the hierarchy : python -m flask --app application build-ch
+
+
+@click.command("build-ch")
+def build_ch_command():
+    '''
+    Build the contraction hierarchy of the graph and save it in the graph folder.
+    '''
+    store = graph_store.get_store()
+    graph_dir = current_app.config["GRAPH_DIR"]
+    os.makedirs(graph_dir, exist_ok=True)
+
+    click.echo(f"Contraction of {store.graph.n_nodes} nodes...")
+    ch = build_hierarchy(store.graph)
+    ch.save(os.path.join(graph_dir, CH_FILENAME))
+    click.echo(f"Hierarchy saved in {graph_dir} ({ch.n_shortcuts} shortcuts).")
+
+
+@click.command("check-ch")
+@click.option("--pairs", default=100, help="Number of random origin-destination pairs.")
+@click.option("--seed", default=0, help="Seed of the random pairs.")
+def check_ch_command(pairs, seed):
+    '''
+    Compare the routes of the contraction hierarchy with the plain Dijkstra.
+    '''
+    store = graph_store.get_store()
+    if store.ch is None:
+        raise click.ClickException("No contraction hierarchy loaded, run build-ch first.")
+
+    stats = check_hierarchy(store.ch, store.graph, pairs, seed)
+    click.echo(f"Identical paths : {stats['same_path']}/{stats['pairs']}")
+    click.echo(f"Wrong costs : {stats['wrong_cost']}/{stats['pairs']}")
+    click.echo(f"Mean time : Dijkstra {1000*stats['dijkstra_time']:.2f} ms,"
+               f" CH {1000*stats['ch_time']:.2f} ms")
+    if stats["wrong_cost"]:
+        raise click.ClickException("The hierarchy does not give the shortest paths.")
+
+
+@click.command("build-landmarks")
+@click.option("--count", default=16, help="Number of landmarks.")
+@click.option("--profile", default=DEFAULT_PROFILE, help="Weight profile of the distance tables.")
+@click.option("--seed", default=0, help="Seed of the first landmark.")
+def build_landmarks_command(count, profile, seed):
+    '''
+    Select the landmarks of the ALT engine and save their distance tables in the graph folder.
+    '''
+    store = graph_store.get_store()
+    graph_dir = current_app.config["GRAPH_DIR"]
+    os.makedirs(graph_dir, exist_ok=True)
+    try:
+        graph = store.profile_graph(profile)
+    except UnknownProfileError as error:
+        raise click.ClickException(str(error)) from None
+
+    landmarks = build_landmarks(graph, count, profile, seed)
+    path = landmarks.save(graph_dir)
+    click.echo(f"{count} landmarks saved in {path} :")
+    for node in landmarks.nodes.tolist():
+        click.echo(f"  - node {store.graph.node_ids[node]}"
+                   f" ({store.graph.lat[node]:.5f}, {store.graph.lon[node]:.5f})")
+
+
+@click.command("build-rider-profile")
+@click.argument("name")
+@click.option("--speed", required=True, type=float,
+              help="Cruising speed of the rider on the flat (km/h).")
+def build_rider_profile_command(name, speed):
+    '''
+    Save the weight profile of a rider riding at most at a cruising speed, limited by the
+    speed of each edge, loaded by the app as the profile NAME.
+    '''
+    store = graph_store.get_store()
+    if store.edges.speeds is None:
+        raise click.ClickException("The speeds of the edges are unknown, build the graph again.")
+    graph_dir = current_app.config["GRAPH_DIR"]
+    os.makedirs(graph_dir, exist_ok=True)
+    try:
+        path = save_rider_speeds(graph_dir, name, store.graph.fingerprint(),
+                                 np.minimum(store.edges.speeds, speed))
+    except UnknownProfileError as error:
+        raise click.ClickException(str(error)) from None
+    click.echo(f"Profile {name} saved in {path}.")
+
+
+@click.command("learn-speeds")
+@click.option("--tracks", "tracks_dir", required=True,
+              type=click.Path(exists=True, file_okay=False),
+              help="Folder of the cleaned and map-matched JSON tracks.")
+@click.option("--workers", default=None, type=int, help="Number of processes (all the CPUs).")
+@click.option("--min-samples", default=MIN_SAMPLES,
+              help="Number of points of an edge to learn its speed.")
+@click.option("--profile", default=LEARNED_PROFILE, help="Name of the weight profile saved.")
+def learn_speeds_command(tracks_dir, workers, min_samples, profile):
+    '''
+    Learn the speed statistics of the edges of the current snapshot from a corpus of tracks,
+    and save the median speeds as a weight profile loaded by the app.
+    '''
+    graph_dir = current_app.config["GRAPH_DIR"]
+    path = current_snapshot(graph_dir)
+    if path is None:
+        raise click.ClickException("No snapshot in the graph folder, run build-snapshot first.")
+    graph, _, manifest = load_snapshot(path)
+    paths = track_files(tracks_dir)
+    click.echo(f"Matching {len(paths)} tracks on {graph.n_edges} edges...")
+    stats = aggregate_speeds(path, paths, graph.n_edges, workers, verbose=False)
+    save_learned_speeds(graph_dir, manifest["fingerprint"], stats)
+    speeds = profile_speeds(stats, min_samples)
+    try:
+        profile_path = save_rider_speeds(graph_dir, profile, manifest["fingerprint"], speeds)
+    except UnknownProfileError as error:
+        raise click.ClickException(str(error)) from None
+    click.echo(f"{stats['matched']}/{stats['points']} points matched in {stats['time']:.1f} s,"
+               f" speed learned on {int(np.isfinite(speeds).sum())} edges,"
+               f" profile {profile} saved in {profile_path}.")
+
+
+@click.command("build-eta-model")
+@click.option("--tracks", "tracks_dir", required=True,
+              type=click.Path(exists=True, file_okay=False),
+              help="Folder of the JSON tracks with their extracted variables.")
+@click.option("--signal-delay", default=SIGNAL_DELAY, help="Delay of a traffic signal (s).")
+def build_eta_model_command(tracks_dir, signal_delay):
+    '''
+    Learn the ETA model of the routes on the tracks and save it in the graph folder, loaded
+    by the app at startup.
+    '''
+    graph_dir = current_app.config["GRAPH_DIR"]
+    os.makedirs(graph_dir, exist_ok=True)
+    try:
+        model, stats = fit_eta_model(track_files(tracks_dir), signal_delay)
+    except ValueError as error:
+        raise click.ClickException(str(error)) from None
+    path = current_app.config["ETA_MODEL"] or os.path.join(graph_dir, ETA_MODEL_FILENAME)
+    model.save(path)
+    click.echo(f"Model learned on {stats['intervals']} intervals of {stats['tracks']} tracks"
+               f" (median error of the tracks {100 * stats['median_error']:.1f} %), saved in"
+               f" {path} :")
+    for feature, coefficient in zip(FEATURES, model.coefficients.tolist()):
+        click.echo(f"  - {feature} : {coefficient:.4f} s")
+
+
+@click.command("bench-eta")
+@click.option("--km", default=30., help="Length of the routes (km).")
+@click.option("--repeat", default=1000, help="Number of predictions.")
+@click.option("--seed", default=0, help="Seed of the random edges.")
+def bench_eta_command(km, repeat, seed):
+    '''
+    Measure the time of the ETA of a route: gather of the features of its edges and
+    prediction, on random edges of the graph as long as a route of --km.
+    '''
+    store = graph_store.get_store()
+    model = get_eta_model()
+    if model is None:
+        raise click.ClickException("No ETA model in the graph folder, run build-eta-model first.")
+    rng = np.random.default_rng(seed)
+    edges = rng.permutation(store.graph.n_edges)
+    edges = edges[:int(np.searchsorted(np.cumsum(store.edges.lengths[edges]), 1000 * km)) + 1]
+    timings = []
+    for _ in range(repeat):
+        dbt = time()
+        model.predict(*store.edges.route_features(edges))
+        timings.append(time()-dbt)
+    timings = 1000 * np.array(timings)
+    click.echo(f"ETA of {len(edges)} edges ({store.edges.lengths[edges].sum() / 1000:.1f} km) :"
+               f" median {np.median(timings):.3f} ms, p99 {np.percentile(timings, 99):.3f} ms")
+
+
+@click.command("compare-engines")
+@click.option("--od", "od_path", default=None, type=click.Path(exists=True),
+              help="JSON file of recorded requests [{\"start\": [lat, lon], \"end\": [lat, lon]}].")
+@click.option("--pairs", default=100, help="Number of random pairs, without --od.")
+@click.option("--seed", default=0, help="Seed of the random pairs.")
+def compare_engines_command(od_path, pairs, seed):
+    '''
+    Compare the number of nodes settled by the routing engines on the same pairs.
+    '''
+    store = graph_store.get_store()
+    graph = store.graph
+    if od_path is not None:
+        with open(od_path, "r", encoding="utf-8") as file:
+            requests = json.load(file)
+        points = [r["start"] for r in requests] + [r["end"] for r in requests]
+        nodes, _ = store.index.nearest_nodes(points)
+        od_pairs = list(zip(nodes[:len(requests)].tolist(), nodes[len(requests):].tolist()))
+    else:
+        rng = np.random.default_rng(seed)
+        od_pairs = rng.integers(0, graph.n_nodes, size=(pairs, 2)).tolist()
+
+    stats = routing.compare_engines(store, od_pairs)
+    click.echo(f"{'Engine':<12}{'Settled nodes':>15}{'Time (ms)':>12}{'Worse routes':>14}")
+    for engine, values in stats.items():
+        click.echo(f"{engine:<12}{values['settled_nodes']:>15.0f}{1000*values['time']:>12.2f}"
+                   f"{values['worse_routes']:>14}")
+
+
+@click.command("bench-payload")
+@click.option("--od", "od_path", default=None, type=click.Path(exists=True),
+              help="JSON file of recorded requests [{\"start\": [lat, lon], \"end\": [lat, lon]}].")
+@click.option("--pairs", default=100, help="Number of random pairs, without --od.")
+@click.option("--zooms", default="16,14,12", help="Zooms of the simplification, comma separated.")
+@click.option("--seed", default=0, help="Seed of the random pairs.")
+def bench_payload_command(od_path, pairs, zooms, seed):
+    '''
+    Compare the size of the responses of /calculate_road with the coordinates, the encoded
+    polyline and the simplified polylines, without and with gzip.
+    '''
+    store = graph_store.get_store()
+    graph = store.graph
+    if od_path is not None:
+        with open(od_path, "r", encoding="utf-8") as file:
+            requests = [(r["start"], r["end"]) for r in json.load(file)]
+    else:
+        rng = np.random.default_rng(seed)
+        requests = [([graph.lat[a], graph.lon[a]], [graph.lat[b], graph.lon[b]])
+                    for a, b in rng.integers(0, graph.n_nodes, size=(pairs, 2)).tolist()]
+    formats = [("coordinates", None), ("polyline", None)] \
+        + [("polyline", float(zoom)) for zoom in zooms.split(",")]
+    sizes = {fmt: [] for fmt in formats}
+    timings = {fmt: [] for fmt in formats}
+    for start, end in requests:
+        try:
+            route = routing.get_routing([float(x) for x in start], [float(x) for x in end])
+        except (NoRouteError, ValueError):
+            continue
+        for route_format, zoom in formats:
+            dbt = time()
+            payload = json.dumps(compact_route(route, route_format, zoom),
+                                 separators=(",", ":")).encode()
+            timings[(route_format, zoom)].append(time()-dbt)
+            sizes[(route_format, zoom)].append((len(payload), len(gzip.compress(payload, 6))))
+    if not sizes[formats[0]]:
+        raise click.ClickException("No route found.")
+
+    base = np.median([size for size, _ in sizes[formats[0]]])
+    click.echo(f"{len(sizes[formats[0]])} routes, median size of the responses :")
+    click.echo(f"{'Format':<20}{'JSON (kB)':>10}{'gzip (kB)':>10}{'Ratio':>8}{'Time (ms)':>11}")
+    for route_format, zoom in formats:
+        raw, compressed = np.median(sizes[(route_format, zoom)], axis=0)
+        name = route_format + (f" zoom {zoom:g}" if zoom is not None else "")
+        delay = np.median(timings[(route_format, zoom)])
+        click.echo(f"{name:<20}{raw / 1000:>10.1f}{compressed / 1000:>10.1f}"
+                   f"{base / compressed:>8.1f}{1000 * delay:>11.2f}")
+
+
+@click.command("bench-load")
+@click.option("--od", "od_path", default=None, type=click.Path(exists=True),
+              help="JSON file of recorded requests [{\"start\": [lat, lon], \"end\": [lat, lon]}].")
+@click.option("--pairs", default=200, help="Number of random pairs, without --od.")
+@click.option("--seed", default=0, help="Seed of the random pairs.")
+@click.option("--engines", default=None, help="Engines, comma separated (all the available ones).")
+@click.option("--cache", "cache_sizes", default="0,64",
+              help="Memory budgets of the route cache (MB), comma separated, 0 without cache.")
+@click.option("--concurrency", default="1,8", help="Numbers of clients, comma separated.")
+@click.option("--repeat", default=2, help="Number of times the workload is sent in each run.")
+@click.option("--output", default="load_test.json", type=click.Path(dir_okay=False),
+              help="JSON file of the results.")
+@click.option("--baseline", default=None, type=click.Path(exists=True),
+              help="Results of a previous load test (of another commit) to compare with.")
+def bench_load_command(od_path, pairs, seed, engines, cache_sizes, concurrency, repeat, output,
+                       baseline):
+    '''
+    Load test of /calculate_road on the graph snapshot, without network: the workload is
+    sent through the app by concurrent clients for each engine, route cache budget and
+    concurrency, and the latency (p50, p95, p99), the throughput and the peak memory of each
+    run are written in a JSON file.
+    '''
+    if current_snapshot(current_app.config["GRAPH_DIR"]) is None:
+        raise click.ClickException("No snapshot in the graph folder, run build-snapshot first.")
+    store = graph_store.get_store()
+    workload = read_workload(od_path) if od_path is not None \
+        else random_workload(store.graph, pairs, seed)
+    engines = engines.split(",") if engines else routing.available_engines(store)
+    for engine in engines:
+        if engine not in routing.available_engines(store):
+            raise click.ClickException(f"Unknown or unavailable engine {engine}.")
+    # Spatial index and reversed graph built before the first run
+    store.warm_up()
+    # The clients run in their own threads, out of the context of the command
+    app = current_app._get_current_object()
+
+    results = {"environment": environment(app),
+               "graph": {"version": store.version, "nodes": store.graph.n_nodes,
+                         "edges": store.graph.n_edges},
+               "workload": {"requests": len(workload), "source": od_path or f"random {seed}",
+                            "repeat": repeat},
+               "runs": []}
+    click.echo(f"{'Engine':<13}{'Cache (MB)':>11}{'Clients':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+               f"{'p99 (ms)':>10}{'Routes/s':>10}{'503':>6}{'Peak RSS (MB)':>15}")
+    for engine in engines:
+        for cache_mb in [float(size) for size in cache_sizes.split(",")]:
+            for clients in [int(clients) for clients in concurrency.split(",")]:
+                # Empty cache for each run
+                route_cache.configure_cache(int(cache_mb * 1024**2))
+                stats = run_load(app, workload, clients, repeat, {"engine": engine})
+                results["runs"].append(dict(engine=engine, cache_mb=cache_mb,
+                                            concurrency=clients, **stats))
+                click.echo(f"{engine:<13}{cache_mb:>11g}{clients:>9}{stats['p50_ms'] or 0:>10.2f}"
+                           f"{stats['p95_ms'] or 0:>10.2f}{stats['p99_ms'] or 0:>10.2f}"
+                           f"{stats['throughput'] or 0:>10.1f}{stats['unavailable']:>6}"
+                           f"{stats['peak_rss_mb']:>15.1f}")
+    route_cache.configure_cache(current_app.config["ROUTE_CACHE_BYTES"],
+                                current_app.config["ROUTE_CACHE_DIR"])
+    save_results(output, results)
+    click.echo(f"Results saved in {output}")
+
+    if baseline is not None:
+        with open(baseline, "r", encoding="utf-8") as file:
+            changes = compare_results(results, json.load(file))
+        click.echo(f"{'Run':<28}{'p95':>8}{'Routes/s':>10}")
+        for (engine, cache_mb, clients), latency, throughput, regression in changes:
+            name = f"{engine} {cache_mb:g} MB x{clients}"
+            click.echo(f"{name:<28}{latency:>8.2f}{throughput:>10.2f}"
+                       + ("  regression" if regression else ""))
+
+
+@click.command("bench-matrix")
+@click.option("--sizes", default="10,50,100,200",
+              help="Number of origins (and of destinations) of each matrix, comma separated.")
+@click.option("--seed", default=0, help="Seed of the random points.")
+def bench_matrix_command(sizes, seed):
+    '''
+    Measure the wall time of square travel time matrices of growing size.
+    '''
+    store = graph_store.get_store()
+    graph = store.graph
+    rng = np.random.default_rng(seed)
+    click.echo(f"{'Size':>6}{'Cells':>9}{'Time (s)':>10}{'us/cell':>9}{'Unreachable':>13}")
+    for size in [int(size) for size in sizes.split(",")]:
+        nodes = rng.integers(0, graph.n_nodes, size=2*size)
+        points = np.column_stack((graph.lat[nodes], graph.lon[nodes])).tolist()
+        dbt = time()
+        durations = routing.matrix(points[:size], points[size:])
+        delay = time()-dbt
+        click.echo(f"{size:>6}{size*size:>9}{delay:>10.3f}{1e6*delay/(size*size):>9.1f}"
+                   f"{int(np.count_nonzero(np.isinf(durations))):>13}")
+
+
+@click.command("build-snapshot")
+def build_snapshot_command():
+    '''
+    Save the graph in a binary snapshot of the graph folder, loaded when the app starts.
+    '''
+    store = graph_store.get_store()
+    path = save_snapshot(current_app.config["GRAPH_DIR"], store.graph, store.edges, store.bbox)
+    click.echo(f"Snapshot of {store.graph.n_nodes} nodes and {store.graph.n_edges} edges"
+               f" saved in {path}.")
+
+
+@click.command("build-elevation")
+@click.option("--dem", "dem_path", required=True, type=click.Path(exists=True),
+              help="DEM of the area of the graph (GeoTIFF).")
+@click.option("--step", default=SAMPLE_STEP, help="Distance between two samples (m).")
+def build_elevation_command(dem_path, step):
+    '''
+    Sample the DEM along every edge of the graph and save the climbs, descents and max grades
+    of the edges in a new snapshot, used by the least-climb profile.
+    '''
+    store = graph_store.get_store()
+    dem = DEM.read(dem_path)
+    stats = add_elevation(store.edges, dem, step, verbose=False)
+    path = save_snapshot(current_app.config["GRAPH_DIR"], store.graph, store.edges, store.bbox)
+    click.echo(f"Elevation of {stats['edges']} edges in {stats['time']:.2f} s"
+               f" ({stats['edges_per_s']:.0f} edges/s), total climb"
+               f" {stats['total_climb'] / 1000:.1f} km, saved in {path}.")
+
+
+@click.command("bench-elevation")
+@click.option("--dem", "dem_path", required=True, type=click.Path(exists=True),
+              help="DEM of the area of the graph (GeoTIFF).")
+@click.option("--steps", default="10,25,50",
+              help="Distances between two samples (m), comma separated.")
+@click.option("--repeat", default=3, help="Number of runs of each step.")
+def bench_elevation_command(dem_path, steps, repeat):
+    '''
+    Measure the throughput of the sampling of the DEM along the edges of the graph.
+    '''
+    store = graph_store.get_store()
+    dbt = time()
+    dem = DEM.read(dem_path)
+    click.echo(f"DEM of {dem.elevations.shape[0]} x {dem.elevations.shape[1]} pixels read in"
+               f" {time()-dbt:.2f} s")
+    n_edges = store.graph.n_edges
+    click.echo(f"{'Step (m)':>9}{'Time (s)':>10}{'Edges/s':>12}")
+    for step in [float(step) for step in steps.split(",")]:
+        timings = []
+        for _ in range(repeat):
+            dbt = time()
+            sample_edges(dem, store.edges.coords, store.edges.coord_offsets, step)
+            timings.append(time()-dbt)
+        delay = float(np.median(timings))
+        click.echo(f"{step:>9.0f}{delay:>10.3f}{n_edges / delay:>12.0f}")
+
+
+@click.command("bench-startup")
+@click.option("--repeat", default=3, help="Number of loads of each kind.")
+@click.option("--extract", default=None, type=click.Path(exists=True),
+              help="OSM extract to rebuild the graph from, instead of the osmnx download.")
+@click.option("--rebuild/--no-rebuild", default=True, help="Also time a rebuild of the graph.")
+def bench_startup_command(repeat, extract, rebuild):
+    '''
+    Compare the startup time of the graph loaded from the snapshot with a rebuild.
+    The first route after the load is timed too, it reads the pages of the mapped arrays
+    and builds the spatial index.
+    '''
+    path = current_snapshot(current_app.config["GRAPH_DIR"])
+    if path is None:
+        raise click.ClickException("No snapshot in the graph folder, run build-snapshot first.")
+
+    def first_route(store):
+        dbt = time()
+        start, end = store.index.snap([[store.graph.lat[0], store.graph.lon[0]],
+                                       [store.graph.lat[-1], store.graph.lon[-1]]])
+        try:
+            routing.shortest_path(store, start.seeds, end.seeds, "dijkstra")
+        except NoRouteError:
+            pass
+        return time()-dbt
+
+    timings = {}
+    for name, mmap in (("snapshot (mmap)", True), ("snapshot (read)", False)):
+        for _ in range(repeat):
+            dbt = time()
+            store = graph_store.GraphStore.from_snapshot(path, mmap)
+            timings.setdefault(name, []).append((time()-dbt, first_route(store)))
+    if rebuild:
+        for _ in range(repeat):
+            dbt = time()
+            if extract is not None:
+                graph, edges, bbox, _ = import_osm(extract, verbose=False)
+                store = graph_store.GraphStore(graph, edges, bbox)
+            else:
+                store = graph_store.GraphStore.from_bbox(current_app.config["GRAPH_BBOX"],
+                                                         current_app.config["NETWORK_TYPE"])
+            timings.setdefault("rebuild", []).append((time()-dbt, first_route(store)))
+
+    click.echo(f"{'Startup':<18}{'Load (s)':>10}{'First route (s)':>17}")
+    for name, values in timings.items():
+        load, route = np.median(values, axis=0)
+        click.echo(f"{name:<18}{load:>10.3f}{route:>17.3f}")
+
+
+@click.command("build-tiles")
+@click.option("--size", default=TILE_SIZE, help="Side of a tile (degrees).")
+def build_tiles_command(size):
+    '''
+    Split the graph of the current snapshot into tiles, with the overlay of their boundary
+    nodes, used by the app with GRAPH_TILES.
+    '''
+    path = current_snapshot(current_app.config["GRAPH_DIR"])
+    if path is None:
+        raise click.ClickException("No snapshot in the graph folder, run build-snapshot first.")
+    graph, edges, manifest = load_snapshot(path)
+    tiles = build_tiles(graph, edges, tuple(manifest["bbox"]),
+                        os.path.join(current_app.config["GRAPH_DIR"], TILES_DIRNAME), size)
+    sizes = [tile["n_nodes"] for tile in tiles["tiles"].values()]
+    click.echo(f"{len(sizes)} tiles of {min(sizes)} to {max(sizes)} nodes,"
+               f" {tiles['boundary_nodes']} boundary nodes and {tiles['overlay_edges']}"
+               " edges in the overlay.")
+
+
+def init_app(app):
+    '''
+    Register the commands in the app.
+    '''
+    app.cli.add_command(build_ch_command)
+    app.cli.add_command(check_ch_command)
+    app.cli.add_command(build_landmarks_command)
+    app.cli.add_command(build_rider_profile_command)
+    app.cli.add_command(learn_speeds_command)
+    app.cli.add_command(build_eta_model_command)
+    app.cli.add_command(bench_eta_command)
+    app.cli.add_command(compare_engines_command)
+    app.cli.add_command(bench_matrix_command)
+    app.cli.add_command(bench_payload_command)
+    app.cli.add_command(bench_load_command)
+    app.cli.add_command(build_snapshot_command)
+    app.cli.add_command(build_elevation_command)
+    app.cli.add_command(bench_elevation_command)
+    app.cli.add_command(bench_startup_command)
+    app.cli.add_command(build_tiles_command)
@@ -0,0 +1,107 @@
+'''
+Script for the alternative routes, computed with the plateau method
+'''
+from .search import _build_path, single_source
+
+# Maximum number of alternative routes of a request
+MAX_ALTERNATIVES = 3
+
+# Maximum cost of an alternative, relative to the cost of the best route
+MAX_STRETCH = 1.3
+
+# Maximum part of the length of the best route an alternative can share with a route
+# already chosen
+MAX_OVERLAP = 0.7
+
+# Minimum cost of the plateau of an alternative, relative to the cost of the best route
+MIN_PLATEAU = 0.15
+
+
+def _plateaus(reverse, forward:tuple, backward:tuple, max_cost:float) -> list:
+    '''
+    Return the plateaus of the forward and backward shortest path trees: the longest
+    chains of edges belonging to both trees. All the nodes of a plateau are on the same
+    route, the shortest path through any of them.
+    INPUT:
+        - reverse (CSRGraph) : the reversed graph.
+        - forward (tuple) : (dist, pred) of the forward tree (see search.single_source).
+        - backward (tuple) : (dist, pred) of the backward tree, on the reversed graph.
+        - max_cost (float) : maximum cost of the route through a plateau.
+    OUTPUT:
+        - plateaus (list) : (cost of the route, cost of the plateau, node of the plateau).
+    '''
+    (dist_f, pred_f), (dist_b, pred_b) = forward, backward
+    reverse_edges = reverse.edge_ids
+    # Next node of each plateau edge u -> v
+    following = {}
+    for v, (u, edge) in pred_f.items():
+        if v not in dist_f or u not in dist_b:
+            continue
+        back = pred_b.get(u)
+        if back is not None and back[0] == v and reverse_edges[back[1]] == edge \
+                and dist_f[u] + dist_b[u] <= max_cost:
+            following[u] = v
+
+    plateaus = []
+    heads = set(following) - set(following.values())
+    for head in heads:
+        tail = head
+        while tail in following:
+            tail = following[tail]
+        plateaus.append((dist_f[head] + dist_b[head], dist_f[tail] - dist_f[head], head))
+    return plateaus
+
+
+def alternative_routes(graph, source, target, best_edges:list, best_cost:float, lengths,
+                       k:int=MAX_ALTERNATIVES, deadline:float=None) -> list:
+    '''
+    Return up to k alternatives to the best route with the plateau method.
+    One forward tree from source and one backward tree from target, bounded by
+    MAX_STRETCH times the best cost, give all the candidates at once: the route through a
+    plateau is the forward path to the plateau followed by the backward path from it.
+    The candidates with the longest plateaus are kept if they don't share too much with
+    the routes already chosen.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - source (int or list) : index of the start node, or its seeds (see search.seeds).
+        - target (int or list) : index of the end node, or its seeds (see search.seeds).
+        - best_edges (list) : ids of the edges of the best route.
+        - best_cost (float) : cost of the best route.
+        - lengths (np.ndarray) : length of each edge (m).
+        - k (int) (default: MAX_ALTERNATIVES) : maximum number of alternatives.
+        - deadline (float) (default: None) : time (time.time()) at which the searches stop.
+    OUTPUT:
+        - alternatives (list) : (nodes, edges, cost, overlap) of each alternative, where
+                                overlap is the part of the length of the best route it shares.
+    '''
+    if k <= 0:
+        return []
+    max_cost = MAX_STRETCH * best_cost
+    reverse = graph.reverse()
+    forward = single_source(graph, source, max_cost, deadline)
+    backward = single_source(reverse, target, max_cost, deadline)
+
+    best_length = float(lengths[best_edges].sum())
+    chosen = [set(best_edges)]
+    alternatives = []
+    # Longest plateaus first
+    for cost, plateau, node in sorted(_plateaus(reverse, forward, backward, max_cost),
+                                      key=lambda candidate: -candidate[1]):
+        if plateau < MIN_PLATEAU * best_cost or len(alternatives) == k:
+            break
+        nodes_f, positions_f = _build_path(forward[1], node)
+        nodes_b, positions_b = _build_path(backward[1], node)
+        nodes = nodes_f + nodes_b[::-1][1:]
+        edges = graph.edge_ids[positions_f].tolist() \
+            + reverse.edge_ids[positions_b[::-1]].tolist()
+        if len(set(nodes)) < len(nodes):
+            # The route goes twice through a node
+            continue
+        edge_set = set(edges)
+        overlaps = [float(lengths[list(edge_set & route)].sum()) / max(best_length, 1.)
+                    for route in chosen]
+        if max(overlaps) > MAX_OVERLAP:
+            continue
+        chosen.append(edge_set)
+        alternatives.append((nodes, edges, cost, overlaps[0]))
+    return alternatives
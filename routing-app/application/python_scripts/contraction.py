@@ -0,0 +1,403 @@
+'''
+Script for the contraction hierarchies (CH) of the bike graph
+'''
+import copy
+import math
+from heapq import heappush, heappop
+from time import time
+import numpy as np
+
+from .search import NoRouteError, dijkstra, seeds
+
+# Name of the file of the hierarchy in the graph folder
+CH_FILENAME = "ch.npz"
+
+# Maximum number of nodes settled by a witness search
+WITNESS_SETTLED_LIMIT = 300
+
+
+class ContractionHierarchy:
+    '''
+    Contraction hierarchy of a CSR graph.
+    The edges of the hierarchy (original edges and shortcuts) are stored in flat arrays:
+    the source, target and weight of each edge, the id of the original edge (-1 for a
+    shortcut) and the two edges a shortcut is made of (-1 for an original edge).
+    The upward graph (edges towards nodes of higher rank) is stored in the CSR format for
+    the forward search, and the reversed downward graph for the backward search.
+    '''
+    ARRAYS = ["node_ids", "rank", "up_offsets", "up_targets", "up_edges",
+              "down_offsets", "down_targets", "down_edges",
+              "edge_sources", "edge_targets", "edge_weights",
+              "edge_original", "edge_first", "edge_second"]
+
+    def __init__(self, fingerprint:str, **arrays):
+        '''
+        INPUT:
+            - fingerprint (str) : fingerprint of the graph the hierarchy was built on.
+            - arrays (np.ndarray) : the arrays listed in ContractionHierarchy.ARRAYS.
+        '''
+        self.fingerprint = fingerprint
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        # Indexes used by customize, built at its first call
+        self._pairs = None
+        self._parents = None
+
+    @property
+    def n_shortcuts(self) -> int:
+        '''
+        Number of shortcuts of the hierarchy.
+        '''
+        return int(np.count_nonzero(self.edge_original < 0))
+
+    def save(self, path:str):
+        '''
+        Save the hierarchy in a .npz file.
+        '''
+        np.savez(path, fingerprint=np.array(self.fingerprint),
+                 **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path:str):
+        '''
+        Load a hierarchy saved with ContractionHierarchy.save.
+        '''
+        with np.load(path) as data:
+            return cls(str(data["fingerprint"]), **{name: data[name] for name in cls.ARRAYS})
+
+    def customizable(self):
+        '''
+        Return a copy of the hierarchy sharing its nodes and edges, with its own weights and
+        original edges, to customize it (see customize) while the queries use this one.
+        '''
+        ch = copy.copy(self)
+        ch.edge_weights = self.edge_weights.copy()
+        ch.edge_original = self.edge_original.copy()
+        return ch
+
+    def unpack(self, edge:int) -> list:
+        '''
+        Return the ids of the original edges of an edge of the hierarchy.
+        '''
+        edges = []
+        stack = [edge]
+        while stack:
+            edge = stack.pop()
+            if self.edge_original[edge] >= 0:
+                edges.append(int(self.edge_original[edge]))
+            else:
+                # The first part must be unpacked first
+                stack.append(int(self.edge_second[edge]))
+                stack.append(int(self.edge_first[edge]))
+        return edges
+
+
+def _witness_search(out_adj:dict, source:int, avoided:int, max_dist:float) -> dict:
+    '''
+    Local Dijkstra from source in the remaining graph without the node avoided.
+    The search stops at the distance max_dist or after WITNESS_SETTLED_LIMIT nodes.
+    OUTPUT:
+        - dist (dict) : upper bound of the distance from source to the reached nodes.
+    '''
+    dist = {source: 0.}
+    settled = set()
+    heap = [(0., source)]
+    while heap and len(settled) < WITNESS_SETTLED_LIMIT:
+        d, u = heappop(heap)
+        if u in settled:
+            continue
+        if d > max_dist:
+            break
+        settled.add(u)
+        for v, (w, _) in out_adj[u].items():
+            if v == avoided:
+                continue
+            nd = d + w
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                heappush(heap, (nd, v))
+    return dist
+
+
+def _shortcuts(out_adj:dict, in_adj:dict, v:int) -> list:
+    '''
+    Return the shortcuts needed to contract the node v.
+    OUTPUT:
+        - shortcuts (list) : list of (u, w, weight, first edge, second edge).
+    '''
+    shortcuts = []
+    for u, (w_in, e_in) in in_adj[v].items():
+        # Distances to beat from u, through v
+        through_v = {w: w_in + w_out for w, (w_out, _) in out_adj[v].items() if w != u}
+        if not through_v:
+            continue
+        dist = _witness_search(out_adj, u, v, max(through_v.values()))
+        for w, cost in through_v.items():
+            if dist.get(w, float('inf')) > cost:
+                shortcuts.append((u, w, cost, e_in, out_adj[v][w][1]))
+    return shortcuts
+
+
+def build_hierarchy(graph, fingerprint:str=None, verbose:bool=True) -> ContractionHierarchy:
+    '''
+    Contract the nodes of the graph one by one, in the order given by the edge difference,
+    and return the contraction hierarchy.
+    The edges of infinite weight (forbidden highways) are not part of the hierarchy.
+    INPUT:
+        - graph (CSRGraph) : the graph, with the weights of the metric.
+        - fingerprint (str) (default: graph.fingerprint()) : fingerprint stored in the hierarchy.
+        - verbose (bool) (default: True) : print the progress of the contraction.
+    OUTPUT:
+        - ch (ContractionHierarchy) : the hierarchy.
+    '''
+    n_nodes = graph.n_nodes
+    # Edges of the hierarchy : (source, target, weight, original edge, first edge, second edge)
+    edges = []
+    # Remaining graph : out_adj[u][v] = in_adj[v][u] = (weight, edge of the hierarchy)
+    out_adj = [{} for _ in range(n_nodes)]
+    in_adj = [{} for _ in range(n_nodes)]
+    offsets, targets, weights = graph.views()
+    for u in range(n_nodes):
+        for i in range(offsets[u], offsets[u+1]):
+            v, w = targets[i], float(weights[i])
+            # Only the lightest of the parallel edges is kept
+            if u == v or w == float('inf') or w >= out_adj[u].get(v, (float('inf'),))[0]:
+                continue
+            edges.append((u, v, w, int(graph.edge_ids[i]), -1, -1))
+            out_adj[u][v] = in_adj[v][u] = (w, len(edges)-1)
+
+    def priority(v):
+        # Edge difference plus the number of contracted neighbours
+        return len(_shortcuts(out_adj, in_adj, v)) - len(in_adj[v]) - len(out_adj[v]) \
+            + deleted[v]
+
+    deleted = np.zeros(n_nodes, dtype=np.int32)
+    rank = np.full(n_nodes, -1, dtype=np.int32)
+    up_out, up_in = [None]*n_nodes, [None]*n_nodes
+    heap = [(priority(v), v) for v in range(n_nodes)]
+    heap.sort()
+    order = 0
+    while heap:
+        prio, v = heappop(heap)
+        # Lazy update of the priority
+        new_prio = priority(v)
+        if heap and new_prio > heap[0][0]:
+            heappush(heap, (new_prio, v))
+            continue
+
+        for u, w, cost, first, second in _shortcuts(out_adj, in_adj, v):
+            if cost < out_adj[u].get(w, (float('inf'),))[0]:
+                edges.append((u, w, cost, -1, first, second))
+                out_adj[u][w] = in_adj[w][u] = (cost, len(edges)-1)
+
+        # The remaining edges of v all go to nodes of higher rank
+        up_out[v] = [(w, e) for w, (_, e) in out_adj[v].items()]
+        up_in[v] = [(u, e) for u, (_, e) in in_adj[v].items()]
+        for w in out_adj[v]:
+            del in_adj[w][v]
+            deleted[w] += 1
+        for u in in_adj[v]:
+            del out_adj[u][v]
+            deleted[u] += 1
+        out_adj[v], in_adj[v] = {}, {}
+        rank[v] = order
+        order += 1
+        if verbose and order % 10000 == 0:
+            print(f"  > {order}/{n_nodes} nodes contracted, {len(edges)} edges.")
+
+    def to_csr(adjacency):
+        counts = np.array([len(adj) for adj in adjacency], dtype=np.int64)
+        csr_offsets = np.zeros(n_nodes+1, dtype=np.int64)
+        np.cumsum(counts, out=csr_offsets[1:])
+        csr_targets = np.array([node for adj in adjacency for node, _ in adj], dtype=np.int32)
+        csr_edges = np.array([edge for adj in adjacency for _, edge in adj], dtype=np.int32)
+        return csr_offsets, csr_targets, csr_edges
+
+    up_offsets, up_targets, up_edges = to_csr(up_out)
+    down_offsets, down_targets, down_edges = to_csr(up_in)
+    edges = np.array(edges, dtype=np.float64).reshape(-1, 6)
+    return ContractionHierarchy(graph.fingerprint() if fingerprint is None else fingerprint,
+                                node_ids=graph.node_ids, rank=rank,
+                                up_offsets=up_offsets, up_targets=up_targets, up_edges=up_edges,
+                                down_offsets=down_offsets, down_targets=down_targets,
+                                down_edges=down_edges,
+                                edge_sources=edges[:, 0].astype(np.int32),
+                                edge_targets=edges[:, 1].astype(np.int32),
+                                edge_weights=edges[:, 2].astype(np.float32),
+                                edge_original=edges[:, 3].astype(np.int32),
+                                edge_first=edges[:, 4].astype(np.int32),
+                                edge_second=edges[:, 5].astype(np.int32))
+
+
+def customize(ch:ContractionHierarchy, graph, edges) -> int:
+    '''
+    Update the weights of the hierarchy after a change of the weights of some edges of the
+    graph, without contracting it again: the weights of the original edges of the hierarchy
+    are updated, then the weights of the shortcuts made of them, in the order of their
+    creation (a shortcut is always created after its two parts). Only the edges of the
+    hierarchy depending on the changed edges are visited.
+    The shortcuts and the order of the nodes are kept: an edge closed (infinite weight) is
+    never used, but a closure or a penalty on an edge of a witness path of the contraction can
+    make some routes longer than the shortest ones (see check-ch), or not found. The costs of
+    the customized hierarchy are then only upper bounds, checked by the app against the lower
+    bounds of the hierarchy of the weights without override (see routing.shortest_path).
+    INPUT:
+        - ch (ContractionHierarchy) : the hierarchy.
+        - graph (CSRGraph) : the graph the hierarchy was built on, with the new weights.
+        - edges (list) : ids of the edges whose weight has changed.
+    OUTPUT:
+        - updated (int) : number of edges of the hierarchy whose weight has changed.
+    '''
+    if ch._pairs is None:
+        original = np.flatnonzero(ch.edge_original >= 0)
+        ch._pairs = dict(zip(zip(ch.edge_sources[original].tolist(),
+                                 ch.edge_targets[original].tolist()), original.tolist()))
+        # Shortcuts made of each edge of the hierarchy, in the CSR format
+        shortcuts = np.flatnonzero(ch.edge_original < 0)
+        parts = np.concatenate((ch.edge_first[shortcuts], ch.edge_second[shortcuts]))
+        order = np.argsort(parts, kind="stable")
+        offsets = np.zeros(len(ch.edge_weights)+1, dtype=np.int64)
+        np.cumsum(np.bincount(parts, minlength=len(ch.edge_weights)), out=offsets[1:])
+        ch._parents = (offsets, np.concatenate((shortcuts, shortcuts))[order])
+
+    heap, queued = [], set()
+    for edge in set(int(edge) for edge in edges):
+        u, v = graph.edge_source(edge), int(graph.targets[edge])
+        h = ch._pairs.get((u, v))
+        if h is None:
+            # Edge of infinite weight in the graph the hierarchy was built on
+            continue
+        # The hierarchy keeps the lightest of the parallel edges
+        start, end = int(graph.offsets[u]), int(graph.offsets[u+1])
+        parallel = start + np.flatnonzero(graph.targets[start:end] == v)
+        lightest = int(parallel[np.argmin(graph.weights[parallel])])
+        ch.edge_original[h] = graph.edge_ids[lightest]
+        if ch.edge_weights[h] != graph.weights[lightest]:
+            ch.edge_weights[h] = graph.weights[lightest]
+            heappush(heap, h)
+            queued.add(h)
+
+    offsets, parents = ch._parents
+    updated = 0
+    while heap:
+        h = heappop(heap)
+        updated += 1
+        for s in parents[offsets[h]:offsets[h+1]].tolist():
+            weight = np.float32(float(ch.edge_weights[ch.edge_first[s]])
+                                + float(ch.edge_weights[ch.edge_second[s]]))
+            if weight != ch.edge_weights[s]:
+                ch.edge_weights[s] = weight
+                if s not in queued:
+                    heappush(heap, s)
+                    queued.add(s)
+    return updated
+
+
+def ch_query(ch:ContractionHierarchy, graph, source, target):
+    '''
+    Bidirectional upward Dijkstra on the contraction hierarchy.
+    INPUT:
+        - ch (ContractionHierarchy) : the hierarchy.
+        - graph (CSRGraph) : the graph the hierarchy was built on.
+        - source (int or list) : index of the start node, or its seeds (see search.seeds).
+        - target (int or list) : index of the end node, or its seeds (see search.seeds).
+    OUTPUT:
+        - nodes (list) : indexes of the nodes of the path.
+        - edges (list) : ids of the edges of the path.
+        - cost (float) : cost of the path.
+        - settled (int) : number of nodes settled by the two searches.
+    '''
+    inf = float('inf')
+    edge_weights = memoryview(ch.edge_weights)
+    sides = [(memoryview(ch.up_offsets), memoryview(ch.up_targets), memoryview(ch.up_edges)),
+             (memoryview(ch.down_offsets), memoryview(ch.down_targets), memoryview(ch.down_edges))]
+    dist, pred, settled, heaps = [{}, {}], [{}, {}], [set(), set()], [[], []]
+    for side, end in ((0, source), (1, target)):
+        for node, cost in seeds(end):
+            if cost < dist[side].get(node, inf):
+                dist[side][node] = cost
+                heappush(heaps[side], (cost, node))
+    best, meeting = inf, None
+    side = 0
+    while heaps[0] or heaps[1]:
+        # Alternate between the forward and the backward searches
+        if not heaps[side]:
+            side = 1 - side
+        d, u = heappop(heaps[side])
+        if d >= best:
+            # Nothing better can be found on this side
+            heaps[side] = []
+            side = 1 - side
+            continue
+        if u in settled[side]:
+            continue
+        settled[side].add(u)
+        if u in dist[1-side] and d + dist[1-side][u] < best:
+            best, meeting = d + dist[1-side][u], u
+        offsets, targets, edge_ids = sides[side]
+        for i in range(offsets[u], offsets[u+1]):
+            v, e = targets[i], edge_ids[i]
+            nd = d + edge_weights[e]
+            if nd < dist[side].get(v, inf):
+                dist[side][v] = nd
+                pred[side][v] = e
+                heappush(heaps[side], (nd, v))
+        side = 1 - side
+
+    if meeting is None:
+        raise NoRouteError("Aucun itinéraire n'a été trouvé entre le départ et l'arrivée.")
+
+    # Edges of the hierarchy from the start to meeting, then from meeting to the end
+    ch_edges = []
+    node = meeting
+    while node in pred[0]:
+        e = pred[0][node]
+        ch_edges.append(e)
+        node = int(ch.edge_sources[e])
+    start = node
+    ch_edges.reverse()
+    node = meeting
+    while node in pred[1]:
+        e = pred[1][node]
+        ch_edges.append(e)
+        node = int(ch.edge_targets[e])
+
+    edges = [edge for e in ch_edges for edge in ch.unpack(e)]
+    return [start] + graph.targets[edges].tolist(), edges, best, \
+        len(settled[0]) + len(settled[1])
+
+
+def check_hierarchy(ch:ContractionHierarchy, graph, n_pairs:int=100, seed:int=0) -> dict:
+    '''
+    Compare the CH queries with the plain Dijkstra on random origin-destination pairs.
+    INPUT:
+        - ch (ContractionHierarchy) : the hierarchy.
+        - graph (CSRGraph) : the graph the hierarchy was built on.
+        - n_pairs (int) (default: 100) : number of random pairs.
+        - seed (int) (default: 0) : seed of the random pairs.
+    OUTPUT:
+        - stats (dict) : number of pairs, of identical paths, of wrong costs and the
+                         mean time of the queries (s).
+    '''
+    rng = np.random.default_rng(seed)
+    stats = {"pairs": n_pairs, "same_path": 0, "wrong_cost": 0,
+             "dijkstra_time": 0., "ch_time": 0.}
+    for source, target in rng.integers(0, graph.n_nodes, size=(n_pairs, 2)).tolist():
+        results = []
+        for name, query in (("dijkstra", lambda: dijkstra(graph, source, target)),
+                            ("ch", lambda: ch_query(ch, graph, source, target))):
+            dbt = time()
+            try:
+                results.append(query())
+            except NoRouteError:
+                results.append(None)
+            stats[f"{name}_time"] += (time()-dbt) / n_pairs
+        expected, found = results
+        if expected is None or found is None:
+            stats["same_path"] += expected is found
+            stats["wrong_cost"] += expected is not found
+            continue
+        stats["same_path"] += expected[0] == found[0]
+        # Paths of equal costs can differ, not the costs
+        stats["wrong_cost"] += not math.isclose(expected[2], found[2], rel_tol=1e-4)
+    return stats
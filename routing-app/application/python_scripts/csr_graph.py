@@ -0,0 +1,210 @@
+'''
+Script for the compact (CSR) representation of the bike graph
+'''
+import hashlib
+import numpy as np
+
+from .weights import MAX_SPEED_KPH, custom_weight
+
+
+class CSRGraph:
+    '''
+    Directed graph stored as NumPy arrays in the CSR (compressed sparse row) format.
+    The outgoing edges of the node i are the positions offsets[i] to offsets[i+1]
+    of the arrays targets, weights and edge_ids.
+    '''
+    def __init__(self, node_ids, lat, lon, offsets, targets, weights, edge_ids,
+                 fingerprint:str=None, max_speed_kph:float=MAX_SPEED_KPH):
+        '''
+        INPUT:
+            - node_ids (np.ndarray) : OSM id of each node (int64).
+            - lat, lon (np.ndarray) : coordinates of each node (float64).
+            - offsets (np.ndarray) : start of the edges of each node, size n_nodes+1 (int64).
+            - targets (np.ndarray) : index of the target node of each edge (int32).
+            - weights (np.ndarray) : weight of each edge (float32).
+            - edge_ids (np.ndarray) : id of each edge (int32).
+            - fingerprint (str) (default: None) : fingerprint of the graph if it is known
+                                                  (see fingerprint).
+            - max_speed_kph (float) (default: MAX_SPEED_KPH) : maximum speed (km/h) of the
+              weights, the weight of an edge is at least the time to cover it at this speed
+              (lower bounds of the A* searches).
+        '''
+        self.node_ids = node_ids
+        self.lat = lat
+        self.lon = lon
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.edge_ids = edge_ids
+        self._index = None
+        self._reverse = None
+        self._reverse_positions = None
+        self._fingerprint = fingerprint
+        self.max_speed_kph = max_speed_kph
+        # Graph whose nodes and edges are shared, with other weights (see with_weights)
+        self._shared = None
+
+    @property
+    def n_nodes(self) -> int:
+        '''
+        Number of nodes of the graph.
+        '''
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        '''
+        Number of edges of the graph.
+        '''
+        return len(self.targets)
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        Memory used by the arrays of the graph (bytes).
+        '''
+        return sum(array.nbytes for array in (self.node_ids, self.lat, self.lon, self.offsets,
+                                              self.targets, self.weights, self.edge_ids))
+
+    @classmethod
+    def from_networkx(cls, G, weight=custom_weight):
+        '''
+        Build the CSR graph from an osmnx graph.
+        The weight of each edge is computed once with the weight function, which has the
+        same signature as the networkx weight functions.
+        The edges are sorted by source node, so the id of an edge is its position in the arrays.
+        INPUT:
+            - G (nx.MultiDiGraph) : the osmnx graph.
+            - weight (function) (default: custom_weight) : weight function of the edges.
+        OUTPUT:
+            - graph (CSRGraph) : the compact graph.
+        '''
+        node_ids = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+        index = {node: i for i, node in enumerate(node_ids.tolist())}
+        lat = np.array([data["y"] for _, data in G.nodes(data=True)], dtype=np.float64)
+        lon = np.array([data["x"] for _, data in G.nodes(data=True)], dtype=np.float64)
+
+        n_edges = G.number_of_edges()
+        sources = np.empty(n_edges, dtype=np.int32)
+        targets = np.empty(n_edges, dtype=np.int32)
+        weights = np.empty(n_edges, dtype=np.float32)
+        for i, (u, v, data) in enumerate(G.edges(data=True)):
+            sources[i] = index[u]
+            targets[i] = index[v]
+            weights[i] = weight(u, v, {0: data})
+
+        # Sort the edges by source node
+        order = np.argsort(sources, kind="stable")
+        offsets = np.zeros(len(node_ids)+1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=offsets[1:])
+
+        return cls(node_ids, lat, lon, offsets, targets[order], weights[order],
+                   np.arange(n_edges, dtype=np.int32))
+
+    def edge_source(self, edge:int) -> int:
+        '''
+        Return the index of the source node of an edge (given by its position).
+        '''
+        return int(np.searchsorted(self.offsets, edge, side="right") - 1)
+
+    def reverse(self):
+        '''
+        Return the reversed graph, used by the backward searches.
+        Its edge_ids are the ids of the edges in the forward graph.
+        The reversed graph is built once and then kept with the graph.
+        '''
+        if self._reverse is None and self._shared is not None:
+            # Same reversed edges as the shared graph, with the weights of this graph
+            shared = self._shared.reverse()
+            self._reverse = CSRGraph(self.node_ids, self.lat, self.lon, shared.offsets,
+                                     shared.targets, self.weights[shared.edge_ids],
+                                     shared.edge_ids, max_speed_kph=self.max_speed_kph)
+            self._reverse._reverse = self
+        if self._reverse is None:
+            sources = np.repeat(np.arange(self.n_nodes, dtype=np.int32), np.diff(self.offsets))
+            order = np.argsort(self.targets, kind="stable")
+            offsets = np.zeros(self.n_nodes+1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=self.n_nodes), out=offsets[1:])
+            self._reverse = CSRGraph(self.node_ids, self.lat, self.lon, offsets, sources[order],
+                                     self.weights[order], self.edge_ids[order],
+                                     max_speed_kph=self.max_speed_kph)
+            self._reverse._reverse = self
+        return self._reverse
+
+    def with_weights(self, weights, max_speed_kph:float=MAX_SPEED_KPH):
+        '''
+        Return a graph with the same nodes and edges and other weights (a weight profile).
+        The arrays of the nodes and of the edges are shared, not copied, with the reversed
+        graph too.
+        INPUT:
+            - weights (np.ndarray) : weight of each edge (float32), aligned on the edge ids.
+            - max_speed_kph (float) (default: MAX_SPEED_KPH) : maximum speed of the weights.
+        '''
+        graph = CSRGraph(self.node_ids, self.lat, self.lon, self.offsets, self.targets,
+                         weights, self.edge_ids, max_speed_kph=max_speed_kph)
+        graph._shared = self if self._shared is None else self._shared
+        return graph
+
+    def updated(self, edges, weights):
+        '''
+        Return a copy of the graph with new weights for some edges, in the reversed graph too
+        if it is built. The arrays of the nodes and of the edges are shared, the weights are
+        copied: the graph itself is not changed, so the searches in progress on it keep their
+        weights. The fingerprint of the graph is kept.
+        INPUT:
+            - edges (np.ndarray) : ids of the edges.
+            - weights (np.ndarray) : new weight of each edge.
+        '''
+        edges = np.asarray(edges, dtype=np.int64)
+        new_weights = self.weights.copy()
+        new_weights[edges] = weights
+        graph = CSRGraph(self.node_ids, self.lat, self.lon, self.offsets, self.targets,
+                         new_weights, self.edge_ids, self.fingerprint(), self.max_speed_kph)
+        graph._index = self._index
+        graph._shared = self._shared
+        if self._reverse is not None:
+            if self._reverse_positions is None:
+                # Position in the reversed graph of each edge
+                self._reverse_positions = np.empty(self.n_edges, dtype=np.int64)
+                self._reverse_positions[self._reverse.edge_ids] = np.arange(self.n_edges)
+            reverse = self._reverse
+            reverse_weights = reverse.weights.copy()
+            reverse_weights[self._reverse_positions[edges]] = weights
+            graph._reverse = CSRGraph(reverse.node_ids, reverse.lat, reverse.lon,
+                                      reverse.offsets, reverse.targets, reverse_weights,
+                                      reverse.edge_ids, max_speed_kph=reverse.max_speed_kph)
+            graph._reverse._reverse = graph
+            graph._reverse_positions = self._reverse_positions
+        return graph
+
+    def fingerprint(self) -> str:
+        '''
+        Return a hash of the nodes, edges and weights of the graph.
+        It is used to check that a precomputed structure matches the graph.
+        The hash is computed once and then kept with the graph.
+        '''
+        if self._fingerprint is None:
+            sha = hashlib.sha1()
+            for array in (self.node_ids, self.offsets, self.targets, self.weights):
+                sha.update(np.ascontiguousarray(array).tobytes())
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
+
+    def views(self) -> tuple:
+        '''
+        Return memoryviews of the offsets, targets and weights arrays.
+        Indexing a memoryview returns Python numbers without copying the arrays, which
+        is much faster than indexing the NumPy arrays in the loops of the searches.
+        '''
+        return memoryview(self.offsets), memoryview(self.targets), memoryview(self.weights)
+
+    def node_index(self, node_id:int) -> int:
+        '''
+        Return the index in the arrays of the node with the OSM id node_id.
+        '''
+        if self._index is None:
+            self._index = np.argsort(self.node_ids)
+        position = np.searchsorted(self.node_ids, node_id, sorter=self._index)
+        if position == len(self.node_ids) or self.node_ids[self._index[position]] != node_id:
+            raise KeyError(node_id)
+        return int(self._index[position])
@@ -0,0 +1,250 @@
+'''
+Script for the geometry and the attributes of the edges of the bike graph
+'''
+import numpy as np
+
+from .elevation import node_elevation_attributes
+
+# Name given to the edges without street name
+UNKNOWN_STREET = "Rue inconnue"
+
+
+class EdgeStore:
+    '''
+    Geometry and attributes of the edges, indexed by edge id (the position of the edge in
+    the arrays of the CSR graph).
+    The points of the edge e are coords[coord_offsets[e]:coord_offsets[e+1]], from its
+    source to its target. The names of the streets are stored once in names and the edges
+    keep the index of their name (-1 for no name).
+    '''
+    def __init__(self, coords, coord_offsets, lengths, name_ids, way_ids, names:list, weights,
+                 speeds=None, climbs=None, descents=None, max_grades=None,
+                 coord_elevations=None, signals=None):
+        '''
+        INPUT:
+            - coords (np.ndarray) : (lon, lat) of the points of all the edges, shape (M, 2).
+            - coord_offsets (np.ndarray) : start of the points of each edge, size n_edges+1.
+            - lengths (np.ndarray) : length of each edge (m) (float32).
+            - name_ids (np.ndarray) : index in names of the street of each edge (int32).
+            - way_ids (np.ndarray) : OSM id of the way of each edge (int64).
+            - names (list) : names of the streets.
+            - weights (np.ndarray) : weight of each edge, the weights of the CSR graph.
+            - speeds (np.ndarray) (default: None) : speed of each edge (km/h) (float32), used
+                                                    by the weight profiles.
+            - climbs (np.ndarray) (default: None) : climb of each edge (m) (float32), None if
+                                                    the elevation of the graph is unknown.
+            - descents (np.ndarray) (default: None) : descent of each edge (m) (float32).
+            - max_grades (np.ndarray) (default: None) : largest grade along each edge, in its
+                                                        direction (%) (float32).
+            - coord_elevations (np.ndarray) (default: None) : elevation of each point of coords
+                                                              (m) (float32).
+            - signals (np.ndarray) (default: None) : number of traffic signals at the end of
+                                                     each edge (uint8).
+        '''
+        self.coords = coords
+        self.coord_offsets = coord_offsets
+        self.lengths = lengths
+        self.name_ids = name_ids
+        self.way_ids = way_ids
+        self.names = names
+        self.weights = weights
+        self.speeds = speeds
+        self.climbs = climbs
+        self.descents = descents
+        self.max_grades = max_grades
+        self.coord_elevations = coord_elevations
+        self.signals = signals
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        Memory used by the arrays of the store (bytes).
+        '''
+        return sum(array.nbytes for array in (self.coords, self.coord_offsets, self.lengths,
+                                              self.name_ids, self.way_ids, self.speeds,
+                                              self.climbs, self.descents, self.max_grades,
+                                              self.coord_elevations, self.signals)
+                   if array is not None)
+
+    @classmethod
+    def from_networkx(cls, G, graph):
+        '''
+        Build the store from the osmnx graph, in the order of the edges of the CSR graph
+        built by CSRGraph.from_networkx.
+        The edges without geometry are straight lines between their nodes. The climbs of
+        the edges are computed if all the nodes have an elevation (osmnx elevation module),
+        else they can be sampled on a DEM (see elevation.add_elevation). The traffic signals
+        are the nodes tagged highway=traffic_signals.
+        INPUT:
+            - G (nx.MultiDiGraph) : the osmnx graph.
+            - graph (CSRGraph) : the CSR graph built from G.
+        OUTPUT:
+            - store (EdgeStore) : the store of the edges.
+        '''
+        index = {node: i for i, node in enumerate(graph.node_ids.tolist())}
+        n_edges = G.number_of_edges()
+        sources = np.empty(n_edges, dtype=np.int32)
+        lengths = np.empty(n_edges, dtype=np.float32)
+        speeds = np.empty(n_edges, dtype=np.float32)
+        name_ids = np.empty(n_edges, dtype=np.int32)
+        way_ids = np.empty(n_edges, dtype=np.int64)
+        sizes = np.empty(n_edges, dtype=np.int64)
+        signals = np.empty(n_edges, dtype=np.uint8)
+        signal_nodes = {node for node, highway in G.nodes(data="highway")
+                        if highway == "traffic_signals"}
+        names, name_index, points = [], {}, []
+        for i, (u, v, data) in enumerate(G.edges(data=True)):
+            sources[i] = index[u]
+            signals[i] = v in signal_nodes
+            lengths[i] = data.get("length", 0.)
+            speeds[i] = data.get("speed_kph", np.nan)
+            way = data.get("osmid", -1)
+            way_ids[i] = way[0] if isinstance(way, list) else way
+            name = data.get("name")
+            if isinstance(name, list):
+                name = name[0]
+            if isinstance(name, str):
+                if name not in name_index:
+                    name_index[name] = len(names)
+                    names.append(name)
+                name_ids[i] = name_index[name]
+            else:
+                name_ids[i] = -1
+            if "geometry" in data:
+                edge_points = list(data["geometry"].coords)
+            else:
+                edge_points = [(G.nodes[u]["x"], G.nodes[u]["y"]),
+                               (G.nodes[v]["x"], G.nodes[v]["y"])]
+            sizes[i] = len(edge_points)
+            points.extend(edge_points)
+
+        # Same order as the edges of the CSR graph
+        order = np.argsort(sources, kind="stable")
+        starts = np.zeros(n_edges+1, dtype=np.int64)
+        np.cumsum(sizes, out=starts[1:])
+        coords = np.array(points, dtype=np.float64).reshape(-1, 2)
+        coord_offsets = np.zeros(n_edges+1, dtype=np.int64)
+        np.cumsum(sizes[order], out=coord_offsets[1:])
+        coords = coords[_ranges(starts[order], sizes[order])]
+
+        attributes = {}
+        elevations = [data.get("elevation") for _, data in G.nodes(data=True)]
+        if elevations and all(elevation is not None for elevation in elevations):
+            attributes = node_elevation_attributes(elevations, graph, lengths[order],
+                                                   coord_offsets)
+        return cls(coords, coord_offsets, lengths[order], name_ids[order], way_ids[order], names,
+                   graph.weights, speeds[order], signals=signals[order], **attributes)
+
+    def street_name(self, edge:int) -> str:
+        '''
+        Return the name of the street of an edge.
+        '''
+        name_id = int(self.name_ids[edge])
+        return self.names[name_id] if name_id >= 0 else UNKNOWN_STREET
+
+    def route(self, edges:list, weights=None):
+        '''
+        Gather the geometry and the attributes of the edges of a path.
+        INPUT:
+            - edges (list) : ids of the edges of the path, at least one.
+            - weights (np.ndarray) (default: None) : weights of the edges (weight profile),
+                                                     the weights of the CSR graph by default.
+        OUTPUT:
+            - coordinates (list) : [lon, lat] of the points of the route.
+            - length (int) : length of the route (m).
+            - start_street (str) : name of the street of the first edge.
+            - end_street (str) : name of the street of the last edge.
+            - estimated_time (float) : sum of the weights of the edges (s), -1 if infinite.
+        '''
+        edges = np.asarray(edges, dtype=np.int64)
+        coordinates = self.coords[self._route_points(edges)].tolist()
+
+        length = float(self.lengths[edges].sum(dtype=np.float64))
+        weights = self.weights if weights is None else weights
+        estimated_time = float(weights[edges].sum(dtype=np.float64))
+        if np.isinf(estimated_time):
+            estimated_time = -1
+        return coordinates, int(length), self.street_name(edges[0]), \
+            self.street_name(edges[-1]), estimated_time
+
+    def _route_points(self, edges) -> np.ndarray:
+        '''
+        Return the positions in coords of the points of a path, the last point of an edge
+        being the first point of the next one.
+        '''
+        starts = self.coord_offsets[edges]
+        sizes = self.coord_offsets[edges+1] - starts - 1
+        sizes[-1] += 1
+        return _ranges(starts, sizes)
+
+    def route_elevations(self, edges:list) -> tuple:
+        '''
+        Gather the elevations of the points of a path (the points of EdgeStore.route) and its
+        total climb, from the arrays precomputed when the graph was built (see
+        elevation.add_elevation). The cost only depends on the length of the path.
+        INPUT:
+            - edges (list) : ids of the edges of the path, at least one.
+        OUTPUT:
+            - elevations (np.ndarray) : elevation of each point of the route (m), nan if unknown.
+            - climb (float) : sum of the climbs of the edges (m).
+        '''
+        edges = np.asarray(edges, dtype=np.int64)
+        elevations = self.coord_elevations[self._route_points(edges)]
+        return elevations, float(self.climbs[edges].sum(dtype=np.float64))
+
+    def route_features(self, edges:list) -> tuple:
+        '''
+        Gather the features of the edges of a path used by the ETA model (see
+        eta_model.ETAModel.predict), in one vectorized pass.
+        INPUT:
+            - edges (list) : ids of the edges of the path, at least one.
+        OUTPUT:
+            - lengths (np.ndarray) : length of each edge (m).
+            - grades (np.ndarray) : mean grade of each edge (%), 0 if the elevation is unknown.
+            - turns (np.ndarray) : angle of the turn at the start of each edge (degrees, 0 to
+                                   180), 0 for the first edge.
+            - signals (np.ndarray) : number of traffic signals at the end of each edge.
+        '''
+        edges = np.asarray(edges, dtype=np.int64)
+        lengths = self.lengths[edges].astype(np.float64)
+        if self.climbs is not None and self.descents is not None:
+            rises = self.climbs[edges].astype(np.float64) - self.descents[edges]
+            grades = 100 * rises / np.maximum(lengths, 1e-9)
+        else:
+            grades = np.zeros(len(edges))
+        # Direction of the first and the last segment of each edge
+        starts, ends = self.coord_offsets[edges], self.coord_offsets[edges+1]
+        first = self.coords[starts+1] - self.coords[starts]
+        last = self.coords[ends-1] - self.coords[ends-2]
+        scale = np.cos(np.radians(self.coords[starts, 1]))
+        headings = np.degrees(np.arctan2(first[:, 1], first[:, 0] * scale))
+        previous = np.degrees(np.arctan2(last[:, 1], last[:, 0] * scale))
+        turns = np.zeros(len(edges))
+        turns[1:] = np.abs((headings[1:] - previous[:-1] + 180) % 360 - 180)
+        signals = self.signals[edges] if self.signals is not None else np.zeros(len(edges))
+        return lengths, grades, turns, signals
+
+    def point_elevation(self, edge:int, fraction:float) -> float:
+        '''
+        Return the elevation (m) of the point at the fraction of an edge, interpolated between
+        the ends of the edge.
+        '''
+        first = float(self.coord_elevations[self.coord_offsets[edge]])
+        last = float(self.coord_elevations[self.coord_offsets[edge+1] - 1])
+        return first + fraction * (last - first)
+
+
+def _ranges(starts, sizes) -> np.ndarray:
+    '''
+    Return the concatenation of the ranges [starts[i], starts[i]+sizes[i]) as one array.
+    '''
+    sizes = np.asarray(sizes, dtype=np.int64)
+    nonempty = sizes > 0
+    starts, sizes = np.asarray(starts, dtype=np.int64)[nonempty], sizes[nonempty]
+    if len(sizes) == 0:
+        return np.empty(0, dtype=np.int64)
+    # Steps of 1 inside a range and a jump to the start of the next range at its first position
+    steps = np.ones(int(sizes.sum()), dtype=np.int64)
+    steps[0] = starts[0]
+    steps[np.cumsum(sizes)[:-1]] = starts[1:] - (starts[:-1] + sizes[:-1] - 1)
+    return np.cumsum(steps)
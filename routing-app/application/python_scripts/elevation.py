@@ -0,0 +1,217 @@
+'''
+Script for the elevation of the edges of the bike graph, sampled offline on a local DEM
+(digital elevation model, GeoTIFF) along the geometry of every edge
+'''
+from time import time
+import numpy as np
+
+# Radius of the Earth (m)
+EARTH_RADIUS = 6371009
+
+# Distance between two samples of the DEM along an edge (m), about the resolution of the
+# 25 m DEMs (BD ALTI)
+SAMPLE_STEP = 25
+
+# Samples closer than this distance (m) don't give a grade, too sensitive to the noise of
+# the DEM
+MIN_GRADE_DISTANCE = 5
+
+
+class DEM:
+    '''
+    Elevation raster kept as one array, with the affine transform from the coordinates of
+    its CRS to the positions of its pixels.
+    '''
+    def __init__(self, elevations, transform:tuple, nodata:float=None, crs=None):
+        '''
+        INPUT:
+            - elevations (np.ndarray) : elevation of each pixel (m), shape (rows, cols).
+            - transform (tuple) : (a, b, c, d, e, f) affine transform of the raster,
+                                  x = a * col + b * row + c and y = d * col + e * row + f.
+            - nodata (float) (default: None) : value of the pixels without elevation.
+            - crs (rasterio.crs.CRS) (default: None) : CRS of the raster, None for lon/lat.
+        '''
+        self.elevations = np.asarray(elevations, dtype=np.float32)
+        if nodata is not None:
+            self.elevations = np.where(self.elevations == nodata, np.nan, self.elevations)
+        self.transform = tuple(float(value) for value in transform[:6])
+        self.crs = crs
+
+    @classmethod
+    def read(cls, path:str):
+        '''
+        Read the first band of a GeoTIFF with rasterio (optional dependency), in one array.
+        '''
+        try:
+            import rasterio
+        except ImportError:
+            raise ImportError("The DEM are read with rasterio: pip install rasterio.") from None
+        with rasterio.open(path) as src:
+            crs = None if src.crs is None or src.crs.is_geographic else src.crs
+            return cls(src.read(1, out_dtype="float32"), tuple(src.transform), src.nodata, crs)
+
+    def sample(self, lon, lat) -> np.ndarray:
+        '''
+        Return the elevation (m) of points with a bilinear interpolation of the pixels, nan
+        outside of the raster.
+        INPUT:
+            - lon, lat (np.ndarray) : coordinates of the points.
+        '''
+        x, y = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        if self.crs is not None:
+            from rasterio.warp import transform
+            x, y = (np.asarray(values) for values in transform("EPSG:4326", self.crs, x, y))
+        # Position of the points in pixels, from the centers of the pixels
+        a, b, c, d, e, f = self.transform
+        det = a * e - b * d
+        col = (e * (x - c) - b * (y - f)) / det - 0.5
+        row = (a * (y - f) - d * (x - c)) / det - 0.5
+        rows, cols = self.elevations.shape
+        inside = (col >= -0.5) & (col <= cols - 0.5) & (row >= -0.5) & (row <= rows - 0.5)
+        col, row = np.clip(col, 0, cols - 1), np.clip(row, 0, rows - 1)
+        col0 = np.minimum(col.astype(np.int64), max(cols - 2, 0))
+        row0 = np.minimum(row.astype(np.int64), max(rows - 2, 0))
+        col1, row1 = np.minimum(col0 + 1, cols - 1), np.minimum(row0 + 1, rows - 1)
+        tx, ty = col - col0, row - row0
+        z = self.elevations
+        top = z[row0, col0] * (1 - tx) + z[row0, col1] * tx
+        bottom = z[row1, col0] * (1 - tx) + z[row1, col1] * tx
+        return np.where(inside, top * (1 - ty) + bottom * ty, np.nan)
+
+
+def sample_edges(dem:DEM, coords, coord_offsets, step:float=SAMPLE_STEP) -> dict:
+    '''
+    Sample the DEM along the geometry of every edge in one vectorized pass: each segment of
+    the geometries is cut in pieces of at most step meters, the elevations of all their ends
+    are interpolated at once, then summed edge by edge.
+    The samples outside of the DEM count as flat.
+    INPUT:
+        - dem (DEM) : the elevation raster.
+        - coords (np.ndarray) : (lon, lat) of the points of the edges (see EdgeStore).
+        - coord_offsets (np.ndarray) : start of the points of each edge, size n_edges+1.
+        - step (float) (default: SAMPLE_STEP) : maximum distance between two samples (m).
+    OUTPUT:
+        - attributes (dict) : float32 arrays of the edges:
+            - climbs : sum of the rises along the edge (m).
+            - descents : sum of the falls along the edge (m).
+            - max_grades : largest grade along the edge, in its direction (%), negative if
+                           the edge only goes down.
+            - coord_elevations : elevation of each point of the geometries (m), aligned on
+                                 coords, nan outside of the DEM.
+    '''
+    coords = np.asarray(coords, dtype=np.float64)
+    coord_offsets = np.asarray(coord_offsets, dtype=np.int64)
+    n_edges = len(coord_offsets) - 1
+    # Segments between the consecutive points of each edge
+    starts = np.ones(len(coords), dtype=bool)
+    starts[coord_offsets[1:] - 1] = False
+    starts = np.flatnonzero(starts[:-1])
+    segment_edges = np.searchsorted(coord_offsets, starts, side="right") - 1
+    a, b = coords[starts], coords[starts + 1]
+    dx = np.radians(b[:, 0] - a[:, 0]) * np.cos(np.radians((a[:, 1] + b[:, 1]) / 2))
+    lengths = EARTH_RADIUS * np.hypot(dx, np.radians(b[:, 1] - a[:, 1]))
+
+    # Pieces of the segments, the ends of the pieces of a segment are sampled with it
+    pieces = np.maximum(np.ceil(lengths / step), 1).astype(np.int64)
+    n_samples = pieces + 1
+    segment = np.repeat(np.arange(len(starts)), n_samples)
+    first = np.cumsum(n_samples) - n_samples
+    t = (np.arange(len(segment)) - first[segment]) / pieces[segment]
+    points = a[segment] + t[:, None] * (b - a)[segment]
+    elevations = dem.sample(points[:, 0], points[:, 1])
+
+    # Rise between the consecutive samples of a segment
+    rises = np.diff(elevations)
+    pairs = np.ones(len(rises), dtype=bool)
+    pairs[first[1:] - 1] = False
+    rises, pair_segments = rises[pairs], segment[:-1][pairs]
+    rises = np.nan_to_num(rises, nan=0.)
+    pair_edges = segment_edges[pair_segments]
+    distances = (lengths / pieces)[pair_segments]
+    grades = np.where(distances >= MIN_GRADE_DISTANCE,
+                      100 * rises / np.maximum(distances, MIN_GRADE_DISTANCE), -np.inf)
+
+    climbs = np.bincount(pair_edges, weights=np.maximum(rises, 0), minlength=n_edges)
+    descents = np.bincount(pair_edges, weights=np.maximum(-rises, 0), minlength=n_edges)
+    max_grades = np.full(n_edges, -np.inf)
+    np.maximum.at(max_grades, pair_edges, grades)
+    # Edges too short for a grade : their mean grade
+    short = np.isinf(max_grades)
+    edge_lengths = np.bincount(segment_edges, weights=lengths, minlength=n_edges)
+    max_grades[short] = np.where(edge_lengths[short] > 0, 100 * (climbs - descents)[short]
+                                 / np.maximum(edge_lengths[short], 1e-9), 0.)
+    return {"climbs": climbs.astype(np.float32),
+            "descents": descents.astype(np.float32),
+            "max_grades": max_grades.astype(np.float32),
+            "coord_elevations": dem.sample(coords[:, 0], coords[:, 1]).astype(np.float32)}
+
+
+def add_elevation(edges, dem:DEM, step:float=SAMPLE_STEP, verbose:bool=True) -> dict:
+    '''
+    Sample the DEM along the edges of the edge store and keep the climbs, the descents, the
+    max grades and the elevations of the points of the edges in the store. Done once when the
+    graph is built (see build-elevation and osm_import --dem), the arrays are then saved in
+    the snapshot.
+    OUTPUT:
+        - stats (dict) : number of edges, duration, throughput and total climb.
+    '''
+    dbt = time()
+    attributes = sample_edges(dem, edges.coords, edges.coord_offsets, step)
+    delay = time()-dbt
+    for name, values in attributes.items():
+        setattr(edges, name, values)
+    n_edges = len(edges.coord_offsets) - 1
+    stats = {"edges": n_edges,
+             "time": delay,
+             "edges_per_s": n_edges / max(delay, 1e-9),
+             "total_climb": float(attributes["climbs"].sum(dtype=np.float64))}
+    if verbose:
+        print(f"Altitude de {n_edges} arcs en {delay:.2f} s ({stats['edges_per_s']:.0f} arcs/s)")
+    return stats
+
+
+def node_elevation_attributes(elevations, graph, lengths, coord_offsets) -> dict:
+    '''
+    Return the climbs, descents and max grades of the edges and the elevations of the points
+    of their geometries from the elevation of their nodes only (osmnx elevation module),
+    with the same meaning as sample_edges. The elevation of the points inside an edge is
+    interpolated between its nodes.
+    INPUT:
+        - elevations (np.ndarray) : elevation of each node of the graph (m).
+        - graph (CSRGraph) : the graph.
+        - lengths (np.ndarray) : length of each edge (m).
+        - coord_offsets (np.ndarray) : start of the points of each edge (see EdgeStore).
+    '''
+    elevations = np.asarray(elevations, dtype=np.float64)
+    sources = np.repeat(np.arange(graph.n_nodes), np.diff(graph.offsets))
+    rises = elevations[graph.targets] - elevations[sources]
+    lengths = np.asarray(lengths, dtype=np.float64)
+    grades = np.where(lengths > 0, 100 * rises / np.maximum(lengths, 1e-9), 0.)
+    sizes = np.diff(coord_offsets)
+    point_edges = np.repeat(np.arange(len(sizes)), sizes)
+    positions = (np.arange(len(point_edges)) - np.asarray(coord_offsets)[point_edges]) \
+        / np.maximum(sizes - 1, 1)[point_edges]
+    return {"climbs": np.maximum(rises, 0).astype(np.float32),
+            "descents": np.maximum(-rises, 0).astype(np.float32),
+            "max_grades": grades.astype(np.float32),
+            "coord_elevations": (elevations[sources][point_edges]
+                                 + positions * rises[point_edges]).astype(np.float32)}
+
+
+def elevation_profile(coordinates:list, elevations) -> list:
+    '''
+    Return the elevation profile of a route : the distance from the start (m) and the
+    elevation (m, None if unknown) of each point of the route.
+    INPUT:
+        - coordinates (list) : [lon, lat] of the points of the route.
+        - elevations (np.ndarray) : elevation of each point (m).
+    '''
+    if not coordinates:
+        return []
+    points = np.radians(np.asarray(coordinates, dtype=np.float64))
+    dx = np.diff(points[:, 0]) * np.cos((points[1:, 1] + points[:-1, 1]) / 2)
+    steps = EARTH_RADIUS * np.hypot(dx, np.diff(points[:, 1]))
+    distances = np.concatenate(([0.], np.cumsum(steps)))
+    elevations = np.round(np.asarray(elevations, dtype=np.float64), 1)
+    return [[int(round(distance)), elevation if elevation == elevation else None]
+            for distance, elevation in zip(distances.tolist(), elevations.tolist())]
@@ -0,0 +1,180 @@
+'''
+Script for the ETA model of the routes: the travel time of a route predicted from the
+features of its edges, learned on the tracks of the cyclists (see pre-processing)
+'''
+import hashlib
+import json
+from datetime import datetime
+import numpy as np
+
+# Name of the file of the ETA model in the graph folder
+ETA_MODEL_FILENAME = "eta_model.npz"
+
+# Features of the model, summed over the edges of a route :
+#   - length : length (m).
+#   - climb, descent : meters of climb and of descent, from the length and the grade.
+#   - turns : number of U-turns equivalent to the turns sharper than MIN_TURN_ANGLE.
+#   - signals : number of traffic signals.
+FEATURES = ("length", "climb", "descent", "turns", "signals")
+
+# Turns below this angle (degrees) are not counted, the noise of the headings of the tracks
+MIN_TURN_ANGLE = 30
+
+# Delay of a traffic signal (s), not learned: the tracks don't give the signals
+SIGNAL_DELAY = 12
+
+# Intervals between two points of a track longer than this duration (s) are pauses, not
+# used to learn the model
+MAX_INTERVAL = 30
+
+# Coefficients of the model without learning (s per unit of each feature) : 15 km/h on the
+# flat, as custom_weight
+DEFAULT_COEFFICIENTS = (3.6 / 15, 0., 0., 0., SIGNAL_DELAY)
+
+
+class ETAModel:
+    '''
+    Linear model of the travel time: the time of a route is the sum over its edges of the
+    features of the edge times their coefficient, so the ETA of a route is one dot product of
+    the sums of its features.
+    '''
+    def __init__(self, coefficients, intercept:float=0.):
+        '''
+        INPUT:
+            - coefficients (array-like) : time of one unit of each feature of FEATURES (s).
+            - intercept (float) (default: 0.) : time added to every route (s).
+        '''
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.intercept = float(intercept)
+        # Version of the model, the cached routes of another model are not used
+        self.version = hashlib.sha1(self.coefficients.tobytes()
+                                    + np.float64(self.intercept).tobytes()).hexdigest()[:16]
+
+    def save(self, path:str):
+        '''
+        Save the model in a .npz file.
+        '''
+        np.savez(path, features=np.array(FEATURES), coefficients=self.coefficients,
+                 intercept=np.array(self.intercept))
+
+    @classmethod
+    def load(cls, path:str):
+        '''
+        Load a model saved with save.
+        '''
+        with np.load(path) as data:
+            if tuple(data["features"].tolist()) != FEATURES:
+                raise ValueError(f"The ETA model {path} has other features than {FEATURES}.")
+            return cls(data["coefficients"], float(data["intercept"]))
+
+    def predict(self, lengths, grades, turns, signals) -> float:
+        '''
+        Return the ETA of a route (s) from the features of its edges, in one vectorized call.
+        INPUT:
+            - lengths (np.ndarray) : length of each edge (m).
+            - grades (np.ndarray) : grade of each edge (%).
+            - turns (np.ndarray) : angle of the turn at the start of each edge (degrees).
+            - signals (np.ndarray) : number of traffic signals of each edge.
+        '''
+        return self.intercept + float(route_features(lengths, grades, turns, signals)
+                                      @ self.coefficients)
+
+
+def route_features(lengths, grades, turns, signals) -> np.ndarray:
+    '''
+    Return the sums of the FEATURES over the edges of a route.
+    '''
+    lengths = np.asarray(lengths, dtype=np.float64)
+    rises = lengths * np.asarray(grades, dtype=np.float64) / 100
+    turns = np.abs(np.asarray(turns, dtype=np.float64))
+    return np.array([lengths.sum(),
+                     rises[rises > 0].sum(),
+                     -rises[rises < 0].sum(),
+                     turns[turns >= MIN_TURN_ANGLE].sum() / 180,
+                     np.sum(signals, dtype=np.float64)])
+
+
+def track_intervals(path:str) -> tuple:
+    '''
+    Read the intervals between the consecutive points of a cleaned track (JSON of the points
+    with their time, cumulated_dist, slope and turns, see variables_extraction).
+    OUTPUT:
+        - features (np.ndarray) : FEATURES of each interval, shape (N, len(FEATURES)).
+        - durations (np.ndarray) : duration of each interval (s).
+    '''
+    with open(path, "r", encoding="utf-8") as file:
+        points = list(json.load(file).values())
+    if len(points) < 2:
+        return np.empty((0, len(FEATURES))), np.empty(0)
+    times = np.array([datetime.fromisoformat(point["time"]).timestamp() for point in points])
+    distances = np.array([point["cumulated_dist"] for point in points], dtype=np.float64)
+    slopes = np.array([point["slope"] for point in points], dtype=np.float64)
+    turns = np.array([point["turns"] for point in points], dtype=np.float64)
+
+    lengths = np.diff(distances)
+    rises = lengths * (slopes[1:] + slopes[:-1]) / 200
+    turns = np.abs(turns[1:])
+    features = np.column_stack((lengths, np.maximum(rises, 0), np.maximum(-rises, 0),
+                                np.where(turns >= MIN_TURN_ANGLE, turns, 0) / 180,
+                                np.zeros(len(lengths))))
+    durations = np.diff(times)
+    kept = (durations > 0) & (durations <= MAX_INTERVAL) & (lengths >= 0)
+    return features[kept], durations[kept]
+
+def fit_eta_model(paths:list, signal_delay:float=SIGNAL_DELAY) -> tuple:
+    '''
+    Learn the coefficients of the model by least squares on the intervals of the tracks:
+    the duration of an interval is the sum of its features times their coefficient, like
+    the ETA of a route. The signals are not in the tracks, their delay is given.
+    The sums of squares are accumulated track by track, the memory does not depend on the
+    size of the corpus.
+    INPUT:
+        - paths (list) : paths of the JSON tracks (see track_intervals).
+        - signal_delay (float) (default: SIGNAL_DELAY) : delay of a traffic signal (s).
+    OUTPUT:
+        - model (ETAModel) : the model.
+        - stats (dict) : number of tracks and intervals, and the relative error of the
+                         predicted duration of the tracks.
+    '''
+    learned = len(FEATURES) - 1
+    gram, moments = np.zeros((learned, learned)), np.zeros(learned)
+    totals, n_intervals = [], 0
+    for path in paths:
+        features, durations = track_intervals(path)
+        features = features[:, :learned]
+        gram += features.T @ features
+        moments += features.T @ durations
+        totals.append((features.sum(axis=0), durations.sum()))
+        n_intervals += len(durations)
+    if n_intervals < learned:
+        raise ValueError("Not enough points in the tracks to learn the ETA model.")
+    coefficients = np.linalg.lstsq(gram, moments, rcond=None)[0]
+    model = ETAModel(np.append(coefficients, signal_delay))
+
+    predicted = np.array([features @ coefficients for features, _ in totals])
+    durations = np.array([duration for _, duration in totals])
+    errors = np.abs(predicted - durations)[durations > 0] / durations[durations > 0]
+    return model, {"tracks": len(paths),
+                   "intervals": n_intervals,
+                   "median_error": float(np.median(errors)) if len(errors) else float('nan')}
+
+
+_MODEL = None
+
+def load_eta_model(path:str) -> ETAModel:
+    '''
+    Load the ETA model of the app, None if the file does not exist: the ETA of the routes is
+    then the cost of their search.
+    '''
+    global _MODEL
+    try:
+        _MODEL = ETAModel.load(path)
+    except FileNotFoundError:
+        _MODEL = None
+    return _MODEL
+
+def get_eta_model() -> ETAModel:
+    '''
+    Return the ETA model of the app, None if there is none.
+    '''
+    return _MODEL
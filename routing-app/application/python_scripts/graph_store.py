@@ -0,0 +1,395 @@
+'''
+Script keeping the bike graph in memory between the requests
+'''
+import copy
+import math
+import os
+from threading import Lock
+from time import perf_counter
+
+## for simple routing
+import osmnx as ox  #1.2.2
+
+from . import metrics
+from .csr_graph import CSRGraph
+from .edge_store import EdgeStore
+from .snapshot import current_snapshot, load_snapshot
+from .contraction import CH_FILENAME, ContractionHierarchy
+from .landmarks import LANDMARKS_FILENAME, Landmarks
+from .spatial_index import SpatialIndex
+from .tiles import TILES_DIRNAME, TiledGraph
+from .weights import (DEFAULT_PROFILE, PROFILES, RIDER_FILENAME, UnknownProfileError,
+                      load_rider_speeds, rider_weights)
+
+# Bounding box of the Île-de-France region (north, south, east, west)
+ILE_DE_FRANCE_BBOX = (49.24, 48.12, 3.56, 1.44)
+
+
+def _record(stage:str, dbt:float):
+    '''
+    Add the time since dbt (perf_counter) of a stage of the loading of the graph to the
+    metrics of the app (see metrics), with the endpoint "graph".
+    '''
+    metrics.get_metrics().observe("routing_stage_seconds", perf_counter() - dbt,
+                                  endpoint="graph", stage=stage)
+
+
+class OutOfGraphError(ValueError):
+    '''
+    Raised when a point is outside of the area covered by the loaded graph.
+    '''
+
+
+class TiledGraphError(ValueError):
+    '''
+    Raised when a request needs the resident graph while the app uses the tiled graph.
+    '''
+
+
+class InvalidPointError(ValueError):
+    '''
+    Raised when a point of a request is not a (lat, lon) pair of numbers.
+    '''
+
+
+def check_point(point, name:str):
+    '''
+    Raise an InvalidPointError if the point is not a (lat, lon) pair of finite numbers.
+    INPUT:
+        - point : the point of the request.
+        - name (str) : name of the point in the message ("Le point de départ", ...).
+    '''
+    if not isinstance(point, (list, tuple)) or len(point) != 2 \
+            or not all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                       and math.isfinite(value) for value in point):
+        raise InvalidPointError(f"{name} doit être une paire [lat, lon] de nombres.")
+
+
+class GraphStore:
+    '''
+    Bike graph of an area, built once and kept resident for all the requests.
+    '''
+    def __init__(self, graph, edges, bbox:tuple):
+        '''
+        INPUT:
+            - graph (CSRGraph) : compact graph used by the shortest path searches.
+            - edges (EdgeStore) : geometry and attributes of the edges used to build the routes.
+            - bbox (tuple) : (north, south, east, west) bounding box of the graph.
+        '''
+        self.bbox = bbox
+        self.graph = graph
+        self.edges = edges
+        self._index = None
+        # Version of the graph and of its weights, the cached routes of another version are
+        # not used
+        self.version = self.graph.fingerprint()[:16]
+        # Contraction hierarchy of the graph, if it has been built (see load_hierarchy), and
+        # its copy customized with the weights of the overrides, None without override (see
+        # publish)
+        self.ch = None
+        self.overridden_ch = None
+        # Landmarks of the ALT searches, by weight profile (see load_landmarks)
+        self.landmarks = {}
+        # Graph of each weight profile, sharing the nodes and the edges of the graph (see
+        # load_profiles), and its spatial index
+        self.profiles = {DEFAULT_PROFILE: self.graph}
+        self._indexes = {}
+        # Lock of the publication of new weights (see publish and snapshot)
+        self._lock = Lock()
+
+    @property
+    def index(self) -> SpatialIndex:
+        '''
+        Index snapping the points on the graph, built at its first use and then kept.
+        '''
+        if self._index is None:
+            dbt = perf_counter()
+            self._index = SpatialIndex(self.graph)
+            _record("index", dbt)
+        return self._index
+
+    @classmethod
+    def from_networkx(cls, G, bbox:tuple):
+        '''
+        Build the store from an osmnx graph, which is not kept once the arrays are extracted.
+        INPUT:
+            - G (nx.MultiDiGraph) : graph of the area, with the speeds of the edges.
+            - bbox (tuple) : (north, south, east, west) bounding box of the graph.
+        '''
+        graph = CSRGraph.from_networkx(G)
+        return cls(graph, EdgeStore.from_networkx(G, graph), bbox)
+
+    @classmethod
+    def from_snapshot(cls, path:str, mmap:bool=True):
+        '''
+        Load the store from a snapshot of the graph (see snapshot.save_snapshot), with its
+        arrays mapped from the disk.
+        '''
+        dbt = perf_counter()
+        graph, edges, manifest = load_snapshot(path, mmap)
+        _record("load", dbt)
+        return cls(graph, edges, tuple(manifest["bbox"]))
+
+    @classmethod
+    def from_bbox(cls, bbox:tuple, network_type:str="bike"):
+        '''
+        Download the graph of the bounding box and add the speeds of the edges.
+        INPUT:
+            - bbox (tuple) : (north, south, east, west) bounding box of the area.
+            - network_type (str) (default: "bike") : type of network to download.
+        OUTPUT:
+            - store (GraphStore) : the store of the graph.
+        '''
+        north, south, east, west = bbox
+        dbt = perf_counter()
+        G = ox.graph_from_bbox(north, south, east, west, network_type=network_type, simplify=False)
+        G = ox.add_edge_speeds(G)
+        _record("download", dbt)
+        return cls.from_networkx(G, bbox)
+
+    def warm_up(self):
+        '''
+        Build the structures otherwise built at the first request (spatial index, reversed
+        graph). Called in the master process of gunicorn before the workers are forked
+        (preload_app), they are then shared by all the workers instead of being built again
+        in each of them: the pages of the master are only copied when they are modified.
+        '''
+        dbt = perf_counter()
+        self.index
+        for graph in self.profiles.values():
+            graph.reverse()
+        _record("warm_up", dbt)
+
+    def load_profiles(self, graph_dir:str=None):
+        '''
+        Compute the weights of the weight profiles (see weights.PROFILES) available with the
+        attributes of the edges, and load the rider profiles saved in the folder graph_dir
+        (see weights.save_rider_speeds). The weights are computed once, with NumPy on all the
+        edges: a request then only chooses the graph of its profile.
+        '''
+        dbt = perf_counter()
+        for name, (weight, max_speed) in PROFILES.items():
+            weights = weight(self.graph.weights, self.edges)
+            if weights is self.graph.weights:
+                self.profiles[name] = self.graph
+            elif weights is not None:
+                self.profiles[name] = self.graph.with_weights(weights, max_speed)
+        if graph_dir is not None and os.path.isdir(graph_dir):
+            prefix, suffix = RIDER_FILENAME.split("{name}")
+            for filename in sorted(os.listdir(graph_dir)):
+                if not (filename.startswith(prefix) and filename.endswith(suffix)):
+                    continue
+                name, fingerprint, speeds = load_rider_speeds(os.path.join(graph_dir, filename))
+                if fingerprint != self.graph.fingerprint():
+                    print(f"Le profil {name} ne correspond pas au graphe, il est ignoré.")
+                    continue
+                self.profiles[name] = self.graph.with_weights(
+                    *rider_weights(self.graph.weights, self.edges, speeds))
+        _record("profiles", dbt)
+
+    def profile_graph(self, profile:str=DEFAULT_PROFILE):
+        '''
+        Return the graph of a weight profile.
+        Raise an UnknownProfileError if the profile does not exist or is not available.
+        '''
+        if profile not in self.profiles:
+            raise UnknownProfileError(f"Profil inconnu : {profile}"
+                                      f" (disponibles : {', '.join(self.profiles)}).")
+        return self.profiles[profile]
+
+    def profile_index(self, profile:str=DEFAULT_PROFILE) -> SpatialIndex:
+        '''
+        Return the spatial index giving the costs of the snapped points with the weights of
+        a profile, sharing the KD-trees of index.
+        '''
+        graph = self.profile_graph(profile)
+        if graph is self.graph:
+            return self.index
+        if profile not in self._indexes:
+            self._indexes[profile] = self.index.with_graph(graph)
+        return self._indexes[profile]
+
+    def load_hierarchy(self, graph_dir:str) -> bool:
+        '''
+        Load the contraction hierarchy saved in the folder graph_dir.
+        The hierarchy is ignored if it was built on another graph.
+        OUTPUT:
+            - loaded (bool) : True if the hierarchy has been loaded.
+        '''
+        path = os.path.join(graph_dir, CH_FILENAME)
+        if not os.path.exists(path):
+            return False
+        ch = ContractionHierarchy.load(path)
+        if ch.fingerprint != self.graph.fingerprint():
+            print("La hiérarchie de contraction ne correspond pas au graphe, elle est ignorée.")
+            return False
+        self.ch = ch
+        return True
+
+    def load_landmarks(self, graph_dir:str, profile:str=DEFAULT_PROFILE) -> bool:
+        '''
+        Load the landmarks of a weight profile saved in the folder graph_dir.
+        The landmarks are ignored if they were computed on another graph.
+        OUTPUT:
+            - loaded (bool) : True if the landmarks have been loaded.
+        '''
+        path = os.path.join(graph_dir, LANDMARKS_FILENAME.format(profile=profile))
+        if not os.path.exists(path) or profile not in self.profiles:
+            return False
+        landmarks = Landmarks.load(path)
+        if landmarks.fingerprint != self.profiles[profile].fingerprint():
+            print(f"Les landmarks du profil {profile} ne correspondent pas au graphe,"
+                  " ils sont ignorés.")
+            return False
+        self.landmarks[profile] = landmarks
+        return True
+
+    def publish(self, profiles:dict, overridden_ch, version:str):
+        '''
+        Replace the graphs of the weight profiles, the customized hierarchy and the version
+        of the store at once (see overrides). The structures are replaced, never changed, so
+        the requests keep the weights of the snapshot they started with (see snapshot).
+        INPUT:
+            - profiles (dict) : graph of each weight profile, with the new weights.
+            - overridden_ch (ContractionHierarchy) : hierarchy customized with the new
+                                                     weights, None for the weights of ch.
+            - version (str) : version of the new weights.
+        '''
+        # The snapping index keeps the edges of the weights without override
+        index = self.index
+        with self._lock:
+            self.profiles = profiles
+            self.graph = profiles[DEFAULT_PROFILE]
+            self.overridden_ch = overridden_ch
+            self.version = version
+            self._index = index.with_graph(self.graph)
+            self._indexes = {}
+
+    def snapshot(self):
+        '''
+        Return a copy of the store sharing all its structures, whose weights, hierarchies and
+        version stay the same while new weights are published (see publish). A request reads
+        all its structures from one snapshot.
+        '''
+        self.index
+        with self._lock:
+            return copy.copy(self)
+
+    def contains(self, point:list) -> bool:
+        '''
+        Return True if the point (lat, lon) is inside the area of the graph.
+        '''
+        north, south, east, west = self.bbox
+        return south <= point[0] <= north and west <= point[1] <= east
+
+    def check_points(self, start:list, end:list):
+        '''
+        Raise an InvalidPointError if the start or the end is not a (lat, lon) pair, and an
+        OutOfGraphError if it is outside of the area of the graph.
+        '''
+        check_point(start, "Le point de départ")
+        check_point(end, "Le point d'arrivée")
+        if not self.contains(start):
+            raise OutOfGraphError("Le point de départ est en dehors de la zone couverte.")
+        if not self.contains(end):
+            raise OutOfGraphError("Le point d'arrivée est en dehors de la zone couverte.")
+
+    def snap(self, start:list, end:list, mode:str="node", profile:str=DEFAULT_PROFILE) -> tuple:
+        '''
+        Snap the start and the end of a route on the graph in one query.
+        Raise an OutOfGraphError if a point is outside of the area or too far from the graph.
+        INPUT:
+            - start, end (list) : (lat, lon) of the start and of the end.
+            - mode (str) (default: "node") : snap on the nearest "node" or "edge".
+            - profile (str) (default: DEFAULT_PROFILE) : weight profile of the costs.
+        OUTPUT:
+            - start, end (SnappedPoint) : the snapped points.
+        '''
+        self.check_points(start, end)
+        snapped_start, snapped_end = self.profile_index(profile).snap([start, end], mode,
+                                                                      is_start=[True, False])
+        if snapped_start is None:
+            raise OutOfGraphError("Le point de départ est trop loin du réseau cyclable.")
+        if snapped_end is None:
+            raise OutOfGraphError("Le point d'arrivée est trop loin du réseau cyclable.")
+        return snapped_start, snapped_end
+
+    def snap_many(self, points:list, mode:str="node", is_start:bool=True) -> list:
+        '''
+        Snap many points on the graph in one query.
+        Raise an InvalidPointError if a point is not a (lat, lon) pair, and an OutOfGraphError
+        if it is outside of the area or too far from the graph.
+        INPUT:
+            - points (list) : (lat, lon) of the points.
+            - mode (str) (default: "node") : snap on the nearest "node" or "edge".
+            - is_start (bool) (default: True) : whether the points are starts or ends of routes.
+        OUTPUT:
+            - snapped (list) : SnappedPoint of each point.
+        '''
+        kind = "de départ" if is_start else "d'arrivée"
+        for i, point in enumerate(points):
+            check_point(point, f"Le point {kind} n°{i+1}")
+            if not self.contains(point):
+                raise OutOfGraphError(f"Le point {kind} n°{i+1} est en dehors de la zone"
+                                      " couverte.")
+        snapped = self.index.snap(points, mode, is_start) if len(points) else []
+        for i, point in enumerate(snapped):
+            if point is None:
+                raise OutOfGraphError(f"Le point {kind} n°{i+1} est trop loin du réseau"
+                                      " cyclable.")
+        return snapped
+
+
+_STORE = None
+
+def load_store(bbox:tuple=ILE_DE_FRANCE_BBOX, network_type:str="bike",
+               graph_dir:str=None, warm_up:bool=False) -> GraphStore:
+    '''
+    Build the graph of the bounding box and keep it as the resident graph.
+    If graph_dir holds a snapshot of the graph (see build-snapshot and osm_import), the
+    current snapshot is loaded instead, without network access. Its arrays are mapped from
+    the disk, so all the processes of the app share the same pages of memory.
+    The weight profiles are computed (see GraphStore.load_profiles) and the precomputed
+    structures saved in graph_dir (contraction hierarchy, landmarks) are loaded too.
+    With warm_up, the structures built at the first request are built now (see
+    GraphStore.warm_up).
+    '''
+    global _STORE
+    snapshot = current_snapshot(graph_dir) if graph_dir is not None else None
+    if snapshot is not None:
+        _STORE = GraphStore.from_snapshot(snapshot)
+    else:
+        _STORE = GraphStore.from_bbox(bbox, network_type)
+    _STORE.load_profiles(graph_dir)
+    if graph_dir is not None:
+        _STORE.load_hierarchy(graph_dir)
+        for profile in _STORE.profiles:
+            _STORE.load_landmarks(graph_dir, profile)
+    if warm_up:
+        _STORE.warm_up()
+    return _STORE
+
+_TILES = None
+
+def load_tiles(graph_dir:str, max_bytes:int) -> TiledGraph:
+    '''
+    Open the tiles of the graph saved in graph_dir (see build-tiles), used instead of the
+    resident graph: the tiles are then loaded on demand by the requests.
+    '''
+    global _TILES
+    _TILES = TiledGraph(os.path.join(graph_dir, TILES_DIRNAME), max_bytes)
+    return _TILES
+
+def get_tiles() -> TiledGraph:
+    '''
+    Return the tiled graph, None if the app uses the resident graph.
+    '''
+    return _TILES
+
+def get_store() -> GraphStore:
+    '''
+    Return the resident graph store.
+    '''
+    if _STORE is None:
+        raise RuntimeError("The graph store has not been loaded, call load_store() first.")
+    return _STORE
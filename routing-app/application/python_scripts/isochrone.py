@@ -0,0 +1,125 @@
+'''
+Script for the isochrones: the area reachable by bike from a point within a travel time
+'''
+import numpy as np
+from shapely.geometry import box, mapping
+from shapely.ops import transform, unary_union
+
+from .search import seeds, single_source
+
+# Maximum travel time of an isochrone (min)
+MAX_ISOCHRONE_MINUTES = 120
+
+# Size of the cells of the grid the reachable edges are rasterized on (m)
+CELL_SIZE = 50
+
+# Tolerance of the simplification of the polygon (m), smoothing the steps of the cells
+SIMPLIFY_TOLERANCE = 50
+
+
+class IsochroneError(ValueError):
+    '''
+    Raised when the travel time of an isochrone is not valid.
+    '''
+
+
+def reachable_segments(index, settled:dict, budget:float) -> np.ndarray:
+    '''
+    Return the projected segments reachable within the budget: the whole edges whose target
+    is reached in time, and the first part of the edges left on the way.
+    INPUT:
+        - index (SpatialIndex) : spatial index of the graph, with its projected nodes.
+        - settled (dict) : cost of each node reached within the budget.
+        - budget (float) : maximum cost (s).
+    OUTPUT:
+        - segments (np.ndarray) : (x, y) of the ends of the segments, shape (K, 2, 2).
+    '''
+    graph = index.graph
+    costs = np.full(graph.n_nodes, np.inf)
+    costs[np.fromiter(settled.keys(), dtype=np.int64, count=len(settled))] = \
+        np.fromiter(settled.values(), dtype=np.float64, count=len(settled))
+
+    source_costs = costs[index.sources]
+    reached = np.flatnonzero(source_costs <= budget)
+    weights = graph.weights[index.edges[reached]].astype(np.float64)
+    # Part of each edge covered before the end of the budget
+    fractions = np.ones(len(reached))
+    np.divide(budget - source_costs[reached], weights, out=fractions, where=weights > 0)
+    fractions = np.clip(fractions, 0, 1)[:, None]
+
+    a = index.xy[index.sources[reached]]
+    b = index.xy[index.targets[reached]]
+    return np.stack((a, a + fractions * (b - a)), axis=1)
+
+
+def _sample(segments:np.ndarray, step:float) -> np.ndarray:
+    '''
+    Return points along the segments, at most step apart, shape (N, 2).
+    '''
+    a, b = segments[:, 0], segments[:, 1]
+    n_steps = np.maximum(np.ceil(np.linalg.norm(b - a, axis=1) / step), 1).astype(np.int64)
+    segment = np.repeat(np.arange(len(segments)), n_steps + 1)
+    # Position of each point along its segment, from 0 to 1
+    firsts = np.repeat(np.cumsum(n_steps + 1) - (n_steps + 1), n_steps + 1)
+    positions = (np.arange(len(segment)) - firsts) / np.repeat(n_steps, n_steps + 1)
+    return a[segment] + positions[:, None] * (b - a)[segment]
+
+
+def reachable_area(segments:np.ndarray, cell:float=CELL_SIZE):
+    '''
+    Return the polygon covering the reachable segments.
+    The segments are rasterized on a grid of cells, widened by one cell on each side, then
+    the columns of the grid are merged in rectangles whose union is simplified: much faster
+    than the union of the buffers of thousands of segments.
+    INPUT:
+        - segments (np.ndarray) : projected segments, shape (K, 2, 2).
+        - cell (float) (default: CELL_SIZE) : size of the cells (m).
+    OUTPUT:
+        - area (Polygon or MultiPolygon) : projected area.
+    '''
+    points = _sample(segments, cell)
+    origin = points.min(axis=0) - 2 * cell
+    cells = np.floor((points - origin) / cell).astype(np.int64)
+    grid = np.zeros(tuple(cells.max(axis=0) + 3), dtype=bool)
+    grid[cells[:, 0], cells[:, 1]] = True
+    widened = grid.copy()
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            widened[1:-1, 1:-1] |= grid[1+di:grid.shape[0]-1+di, 1+dj:grid.shape[1]-1+dj]
+
+    # Runs of reachable cells in each column (the grid is bordered by empty cells)
+    changes = np.diff(widened.astype(np.int8), axis=1)
+    columns, starts = np.nonzero(changes == 1)
+    _, ends = np.nonzero(changes == -1)
+    x, y = origin
+    rectangles = [box(x + i * cell, y + (start + 1) * cell,
+                      x + (i + 1) * cell, y + (end + 1) * cell)
+                  for i, start, end in zip(columns.tolist(), starts.tolist(), ends.tolist())]
+    return unary_union(rectangles).simplify(SIMPLIFY_TOLERANCE)
+
+
+def isochrone(index, source, budget:float) -> tuple:
+    '''
+    Return the area reachable from source within the budget, around the reachable edges
+    (see reachable_area).
+    The bounded Dijkstra stops at the first node reached after the budget.
+    INPUT:
+        - index (SpatialIndex) : spatial index of the graph.
+        - source (int or list) : index of the start node, or its seeds (see search.seeds).
+        - budget (float) : maximum cost (s).
+    OUTPUT:
+        - polygon (dict) : GeoJSON geometry of the area, in (lon, lat).
+        - n_nodes (int) : number of nodes reached within the budget.
+    '''
+    settled, _ = single_source(index.graph, source, budget)
+    segments = reachable_segments(index, settled, budget)
+    if not len(segments):
+        # Only the start is reachable
+        start = index.xy[next(iter(settled), seeds(source)[0][0])]
+        segments = np.array([[start, start]])
+    area = reachable_area(segments)
+
+    def to_lon_lat(x, y):
+        lat_lon = index.unproject(np.column_stack((x, y)))
+        return lat_lon[:, 1], lat_lon[:, 0]
+    return mapping(transform(to_lon_lat, area)), len(settled)
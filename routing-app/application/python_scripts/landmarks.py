@@ -0,0 +1,136 @@
+'''
+Script for the landmarks of the ALT (A*, landmarks, triangle inequality) searches
+'''
+import os
+import numpy as np
+
+from .search import single_source
+
+# Name of the file of the landmarks of a weight profile in the graph folder
+LANDMARKS_FILENAME = "landmarks_{profile}.npz"
+
+
+class Landmarks:
+    '''
+    Landmarks of a graph with the distance tables of a weight profile.
+    forward[v, k] is the cost from the landmark k to the node v and backward[v, k] the cost
+    from the node v to the landmark k (inf if there is no path). The tables are stored node
+    by node so that the bounds of a node are read at once.
+    '''
+    def __init__(self, profile:str, fingerprint:str, nodes, forward, backward):
+        '''
+        INPUT:
+            - profile (str) : name of the weight profile of the tables.
+            - fingerprint (str) : fingerprint of the graph the tables were computed on.
+            - nodes (np.ndarray) : indexes of the landmarks (int32).
+            - forward, backward (np.ndarray) : distance tables, shape (n_nodes, K) (float32).
+        '''
+        self.profile = profile
+        self.fingerprint = fingerprint
+        self.nodes = nodes
+        self.forward = forward
+        self.backward = backward
+
+    def save(self, graph_dir:str) -> str:
+        '''
+        Save the landmarks in the graph folder and return the path of the file.
+        '''
+        path = os.path.join(graph_dir, LANDMARKS_FILENAME.format(profile=self.profile))
+        np.savez(path, profile=np.array(self.profile), fingerprint=np.array(self.fingerprint),
+                 nodes=self.nodes, forward=self.forward, backward=self.backward)
+        return path
+
+    @classmethod
+    def load(cls, path:str):
+        '''
+        Load landmarks saved with Landmarks.save.
+        '''
+        with np.load(path) as data:
+            return cls(str(data["profile"]), str(data["fingerprint"]), data["nodes"],
+                       data["forward"], data["backward"])
+
+    def bound_to(self, target:int):
+        '''
+        Return a function giving a lower bound of the cost from a node to target, from the
+        triangle inequalities d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L).
+        '''
+        return self._bound(target, to_target=True)
+
+    def bound_from(self, source:int):
+        '''
+        Return a function giving a lower bound of the cost from source to a node, from the
+        triangle inequalities d(s, v) >= d(L, v) - d(L, s) and d(s, v) >= d(s, L) - d(v, L).
+        '''
+        return self._bound(source, to_target=False)
+
+    def _bound(self, node:int, to_target:bool):
+        n_landmarks = len(self.nodes)
+        forward = memoryview(self.forward.reshape(-1))
+        backward = memoryview(self.backward.reshape(-1))
+        ref_forward = forward[node*n_landmarks:(node+1)*n_landmarks].tolist()
+        ref_backward = backward[node*n_landmarks:(node+1)*n_landmarks].tolist()
+        cache = {}
+
+        def bound(v:int) -> float:
+            if v in cache:
+                return cache[v]
+            v_forward = forward[v*n_landmarks:(v+1)*n_landmarks].tolist()
+            v_backward = backward[v*n_landmarks:(v+1)*n_landmarks].tolist()
+            best = 0.
+            for k in range(n_landmarks):
+                if to_target:
+                    lower = max(ref_forward[k] - v_forward[k], v_backward[k] - ref_backward[k])
+                else:
+                    lower = max(v_forward[k] - ref_forward[k], ref_backward[k] - v_backward[k])
+                # inf - inf gives nan, which is never larger than best
+                if lower > best:
+                    best = lower
+            cache[v] = best
+            return best
+        return bound
+
+
+def _distance_table(graph, source:int):
+    '''
+    Return the costs from source to all the nodes of the graph (inf if there is no path).
+    '''
+    dist, _ = single_source(graph, source)
+    table = np.full(graph.n_nodes, np.inf, dtype=np.float32)
+    table[np.fromiter(dist.keys(), dtype=np.int64, count=len(dist))] = \
+        np.fromiter(dist.values(), dtype=np.float64, count=len(dist))
+    return table
+
+
+def build_landmarks(graph, n_landmarks:int=16, profile:str="fastest", seed:int=0,
+                    fingerprint:str=None) -> Landmarks:
+    '''
+    Select the landmarks with the farthest-point selection and compute their distance tables.
+    Each new landmark is the node the farthest from the landmarks already selected, the first
+    one is the node the farthest from a random node.
+    INPUT:
+        - graph (CSRGraph) : the graph, with the weights of the profile.
+        - n_landmarks (int) (default: 16) : number of landmarks.
+        - profile (str) (default: "fastest") : name of the weight profile of the weights.
+        - seed (int) (default: 0) : seed of the random first node.
+        - fingerprint (str) (default: graph.fingerprint()) : fingerprint stored with the tables.
+    OUTPUT:
+        - landmarks (Landmarks) : the landmarks and their tables.
+    '''
+    rng = np.random.default_rng(seed)
+    reverse = graph.reverse()
+    nodes = []
+    forward = np.empty((n_landmarks, graph.n_nodes), dtype=np.float32)
+    backward = np.empty((n_landmarks, graph.n_nodes), dtype=np.float32)
+    # Distance of each node to the closest landmark, nodes out of reach are never selected
+    closest = _distance_table(graph, int(rng.integers(graph.n_nodes)))
+    for k in range(n_landmarks):
+        node = int(np.argmax(np.where(np.isinf(closest), -1, closest)))
+        nodes.append(node)
+        forward[k] = _distance_table(graph, node)
+        backward[k] = _distance_table(reverse, node)
+        # A copy at the first landmark, the marks of the landmarks must not reach the tables
+        closest = forward[k].copy() if k == 0 else np.minimum(closest, forward[k])
+        closest[nodes] = -1
+    return Landmarks(profile, graph.fingerprint() if fingerprint is None else fingerprint,
+                     np.array(nodes, dtype=np.int32),
+                     np.ascontiguousarray(forward.T), np.ascontiguousarray(backward.T))
@@ -0,0 +1,230 @@
+'''
+Script for the speeds of the cyclists learned on each edge of the bike graph from the
+corpus of cleaned and map-matched tracks (see pre-processing/variables_extraction)
+'''
+import json
+import os
+from multiprocessing import Pool
+from time import time
+import numpy as np
+
+from .snapshot import load_snapshot
+from .spatial_index import SpatialIndex
+
+# Name of the file of the speed statistics of the edges in the graph folder
+LEARNED_SPEEDS_FILENAME = "learned_speeds.npz"
+
+# Name of the weight profile of the learned speeds (see weights.save_rider_speeds)
+LEARNED_PROFILE = "learned"
+
+# Width of the bins of the speed histograms of the edges (km/h) and largest speed kept,
+# the speeds above are counted in the last bin
+SPEED_BIN = 0.5
+MAX_TRACK_SPEED = 50
+
+# Quantiles of the speeds given for each edge, the first one is the median
+QUANTILES = (0.5, 0.1, 0.25, 0.75, 0.9)
+
+# Points further than this distance (m) from the graph are not on its edges (track matched
+# on another network)
+MAX_MATCH_DISTANCE = 15
+
+# Number of points of an edge below which its speed is not learned
+MIN_SAMPLES = 5
+
+# Number of (edge, bin) counts received from the workers before they are merged
+MERGE_EVERY = 1_000_000
+
+# Spatial index and reverse edges of the graph of each worker process (see _init_worker)
+_WORKER = {}
+
+
+def track_files(folder:str) -> list:
+    '''
+    Return the paths of the JSON tracks of a folder, sorted.
+    '''
+    return sorted(os.path.join(folder, filename) for filename in os.listdir(folder)
+                  if filename.endswith(".json"))
+
+def read_track(path:str) -> np.ndarray:
+    '''
+    Read a cleaned and map-matched track (JSON of the points "point0", "point1", ... with
+    their lat, lon and speed in m/s, see filter_unrealistic_accelerations).
+    OUTPUT:
+        - points (np.ndarray) : (lat, lon, speed (km/h)) of the points with a speed, shape (N, 3).
+    '''
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    points = [(point["lat"], point["lon"], point["speed"]) for point in data.values()
+              if point.get("speed") is not None]
+    points = np.array(points, dtype=np.float64).reshape(-1, 3)
+    points[:, 2] *= 3.6
+    return points
+
+
+def reverse_edges(graph) -> np.ndarray:
+    '''
+    Return the id of the reverse edge of each edge (from its target to its source), -1 if
+    the edge is one way.
+    '''
+    sources = np.repeat(np.arange(graph.n_nodes, dtype=np.int64), np.diff(graph.offsets))
+    targets = np.asarray(graph.targets, dtype=np.int64)
+    keys = sources * graph.n_nodes + targets
+    order = np.argsort(keys, kind="stable")
+    reverse_keys = targets * graph.n_nodes + sources
+    positions = np.minimum(np.searchsorted(keys[order], reverse_keys), len(keys) - 1)
+    found = keys[order][positions] == reverse_keys
+    return np.where(found, order[positions], -1)
+
+def match_points(index:SpatialIndex, reverse, points) -> tuple:
+    '''
+    Match the points of a track on the edges of the graph: the nearest edge of each point,
+    in the direction of the track (the reverse edge when the track goes the other way).
+    INPUT:
+        - index (SpatialIndex) : index of the graph.
+        - reverse (np.ndarray) : reverse edge of each edge (see reverse_edges).
+        - points (np.ndarray) : (lat, lon, speed) of the points of the track, in order.
+    OUTPUT:
+        - edges (np.ndarray) : edge of each point closer than MAX_MATCH_DISTANCE to the graph.
+        - speeds (np.ndarray) : speed of these points (km/h).
+    '''
+    if len(points) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    edges, _, distances = index.nearest_edges(points[:, :2])
+    # Direction of the track at each point, from the previous point to the next one
+    xy = index.project(points[:, 0], points[:, 1])
+    padded = np.concatenate((xy[:1], xy, xy[-1:]))
+    heading = padded[2:] - padded[:-2]
+    graph = index.graph
+    sources = np.searchsorted(graph.offsets, edges, side="right") - 1
+    direction = index.xy[graph.targets[edges]] - index.xy[sources]
+    backward = (np.einsum("ij,ij->i", heading, direction) < 0) & (reverse[edges] >= 0)
+    edges = np.where(backward, reverse[edges], edges)
+    matched = distances <= MAX_MATCH_DISTANCE
+    return edges[matched], points[matched, 2]
+
+
+def speed_bins(speeds) -> np.ndarray:
+    '''
+    Return the bin of the histograms of each speed (km/h).
+    '''
+    n_bins = int(MAX_TRACK_SPEED / SPEED_BIN)
+    return np.clip((np.asarray(speeds) / SPEED_BIN).astype(np.int64), 0, n_bins - 1)
+
+def _init_worker(snapshot:str):
+    '''
+    Load the graph of the snapshot (mapped from the disk) and build its index once in each
+    worker process.
+    '''
+    graph, _, _ = load_snapshot(snapshot)
+    _WORKER["index"] = SpatialIndex(graph)
+    _WORKER["reverse"] = reverse_edges(graph)
+
+def _count_track(path:str) -> tuple:
+    '''
+    Return the (edge, bin) keys of the histograms of the points of a track with their
+    counts, and the number of points read.
+    '''
+    points = read_track(path)
+    edges, speeds = match_points(_WORKER["index"], _WORKER["reverse"], points)
+    n_bins = int(MAX_TRACK_SPEED / SPEED_BIN)
+    keys, counts = np.unique(edges * n_bins + speed_bins(speeds), return_counts=True)
+    return keys, counts.astype(np.int64), len(points)
+
+def _merge(keys:list, counts:list) -> tuple:
+    '''
+    Merge lists of (edge, bin) keys and their counts into one sorted array of unique keys.
+    '''
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    return keys, np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+
+
+def aggregate_speeds(snapshot:str, paths:list, n_edges:int, workers:int=None,
+                     verbose:bool=True) -> dict:
+    '''
+    Learn the speed statistics of the edges from a corpus of tracks.
+    The tracks are matched on the graph in parallel, one track at a time by each worker, and
+    only the histograms of the speeds of the edges (SPEED_BIN wide) are sent back and merged:
+    the memory is bounded by the number of distinct (edge, bin) pairs, whatever the size of
+    the corpus. The quantiles are then interpolated in the histograms.
+    INPUT:
+        - snapshot (str) : folder of the snapshot of the graph (see save_snapshot).
+        - paths (list) : paths of the JSON tracks (see read_track).
+        - n_edges (int) : number of edges of the graph.
+        - workers (int) (default: None) : number of processes, the number of CPUs by default.
+        - verbose (bool) (default: True) : print the progress.
+    OUTPUT:
+        - stats (dict) : arrays of the edges:
+            - quantiles (np.ndarray) : QUANTILES of the speed of each edge (km/h), shape
+                                       (n_edges, len(QUANTILES)) (float32), nan without points.
+            - counts (np.ndarray) : number of points on each edge (int32).
+          and the number of tracks, points and matched points, and the duration.
+    '''
+    dbt = time()
+    keys, counts = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    pending, n_points = 0, 0
+    with Pool(workers, initializer=_init_worker, initargs=(snapshot,)) as pool:
+        for i, (track_keys, track_counts, size) in enumerate(
+                pool.imap_unordered(_count_track, paths, chunksize=8)):
+            keys.append(track_keys)
+            counts.append(track_counts)
+            pending += len(track_keys)
+            n_points += size
+            if pending >= MERGE_EVERY:
+                merged_keys, merged_counts = _merge(keys, counts)
+                keys, counts = [merged_keys], [merged_counts]
+                pending = 0
+            if verbose and (i + 1) % 1000 == 0:
+                print(f"{i + 1}/{len(paths)} traces")
+    keys, counts = _merge(keys, counts)
+
+    quantiles, edge_counts = histogram_quantiles(keys, counts, n_edges)
+    return {"quantiles": quantiles,
+            "counts": edge_counts,
+            "tracks": len(paths),
+            "points": n_points,
+            "matched": int(edge_counts.sum(dtype=np.int64)),
+            "time": time()-dbt}
+
+def histogram_quantiles(keys, counts, n_edges:int) -> tuple:
+    '''
+    Return the QUANTILES of the speed of each edge and its number of points from the sorted
+    (edge, bin) keys of the histograms and their counts, interpolated linearly in the bins.
+    '''
+    n_bins = int(MAX_TRACK_SPEED / SPEED_BIN)
+    edges, bins = keys // n_bins, keys % n_bins
+    edge_counts = np.bincount(edges, weights=counts, minlength=n_edges)
+    quantiles = np.full((n_edges, len(QUANTILES)), np.nan, dtype=np.float32)
+    if len(keys) == 0:
+        return quantiles, edge_counts.astype(np.int32)
+    # Cumulated counts of all the histograms, each edge owns a range of it
+    cumulated = np.cumsum(counts, dtype=np.float64)
+    present = np.unique(edges)
+    first = np.searchsorted(edges, present)
+    before = np.where(first > 0, cumulated[np.maximum(first - 1, 0)], 0.)
+    for j, quantile in enumerate(QUANTILES):
+        targets = before + quantile * edge_counts[present]
+        positions = np.minimum(np.searchsorted(cumulated, targets), len(keys) - 1)
+        start = cumulated[positions] - counts[positions]
+        fraction = np.clip((targets - start) / counts[positions], 0, 1)
+        quantiles[present, j] = (bins[positions] + fraction) * SPEED_BIN
+    return quantiles, edge_counts.astype(np.int32)
+
+
+def save_learned_speeds(graph_dir:str, fingerprint:str, stats:dict) -> str:
+    '''
+    Save the speed statistics of the edges in the graph folder and return the path of the
+    file.
+    '''
+    path = os.path.join(graph_dir, LEARNED_SPEEDS_FILENAME)
+    np.savez(path, fingerprint=np.array(fingerprint), quantile_levels=np.array(QUANTILES),
+             quantiles=stats["quantiles"], counts=stats["counts"])
+    return path
+
+def profile_speeds(stats:dict, min_samples:int=MIN_SAMPLES) -> np.ndarray:
+    '''
+    Return the speed of each edge for a weight profile: the median speed of the edges with
+    at least min_samples points, nan for the others (they keep the weight of the graph).
+    '''
+    median = stats["quantiles"][:, QUANTILES.index(0.5)]
+    return np.where(stats["counts"] >= min_samples, median, np.nan).astype(np.float32)
@@ -0,0 +1,179 @@
+'''
+Script for the load tests of /calculate_road: a workload of recorded or random routes sent
+to the app by concurrent clients, with the latency, the throughput and the peak memory of
+each run
+'''
+import json
+import os
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from threading import Event, Thread
+from time import perf_counter
+import numpy as np
+
+from .memory import process_memory
+
+# Version of the format of the results, the results of another format are not compared
+RESULTS_VERSION = 1
+
+# Percentiles of the latency given for each run
+PERCENTILES = (50, 95, 99)
+
+# Interval between two readings of the memory of the process during a run (s)
+MEMORY_INTERVAL = 0.02
+
+# Changes of the latency (p95) and of the throughput beyond this ratio are reported as
+# regressions when comparing two results
+REGRESSION_RATIO = 1.1
+
+
+def read_workload(path:str) -> list:
+    '''
+    Read a recorded workload: JSON list of the bodies of the requests of /calculate_road,
+    at least {"start": [lat, lon], "end": [lat, lon]}.
+    '''
+    with open(path, "r", encoding="utf-8") as file:
+        workload = json.load(file)
+    if not workload or any("start" not in body or "end" not in body for body in workload):
+        raise ValueError(f"The workload {path} needs a start and an end in each request.")
+    return workload
+
+def random_workload(graph, pairs:int, seed:int=0) -> list:
+    '''
+    Return a synthetic workload of routes between random nodes of the graph, always the same
+    for a seed.
+    '''
+    rng = np.random.default_rng(seed)
+    nodes = rng.integers(0, graph.n_nodes, size=(pairs, 2))
+    return [{"start": [float(graph.lat[a]), float(graph.lon[a])],
+             "end": [float(graph.lat[b]), float(graph.lon[b])]} for a, b in nodes.tolist()]
+
+
+class PeakMemory:
+    '''
+    Largest resident memory (MB) of the process while the block runs, read every
+    MEMORY_INTERVAL seconds by a thread.
+    '''
+    def __enter__(self):
+        self.peak = process_memory()["rss"]
+        self._stop = Event()
+        self._thread = Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        return self
+
+    def _watch(self):
+        while not self._stop.wait(MEMORY_INTERVAL):
+            self.peak = max(self.peak, process_memory()["rss"])
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, process_memory()["rss"])
+
+
+def run_load(app, workload:list, concurrency:int, repeat:int=1, fields:dict=None) -> dict:
+    '''
+    Send the requests of the workload to /calculate_road of the app, with concurrency
+    clients at the same time (one thread and one test client each), through the whole app:
+    route pool, cache, compression and metrics.
+    INPUT:
+        - app (Flask) : the app (see create_app).
+        - workload (list) : bodies of the requests (see read_workload).
+        - concurrency (int) : number of requests in progress at the same time.
+        - repeat (int) (default: 1) : number of times the workload is sent, the next times
+                                      can be answered by the route cache.
+        - fields (dict) (default: None) : fields added to every request (engine, ...).
+    OUTPUT:
+        - stats (dict) : number of requests by kind of answer, PERCENTILES and mean of the
+                         latency of the routes (ms), throughput (routes/s) and peak memory
+                         of the process (MB).
+    '''
+    bodies = [dict(body, **(fields or {})) for body in workload] * repeat
+
+    def send(body:dict) -> tuple:
+        client = app.test_client()
+        dbt = perf_counter()
+        response = client.post('/calculate_road', json=body)
+        delay = perf_counter() - dbt
+        cached = response.status_code == 200 and response.get_json()["cached"]
+        return response.status_code, delay, cached
+
+    with PeakMemory() as memory, ThreadPoolExecutor(concurrency) as executor:
+        dbt = perf_counter()
+        answers = list(executor.map(send, bodies))
+        elapsed = perf_counter() - dbt
+
+    latencies = np.array([delay for status, delay, _ in answers if status == 200])
+    statuses = np.array([status for status, _, _ in answers])
+    stats = {"requests": len(answers),
+             "routes": len(latencies),
+             "cached": sum(cached for _, _, cached in answers),
+             # Requests refused (no route, point out of the graph), refused by the overloaded
+             # route pool, and failed
+             "refused": int(np.sum((statuses >= 400) & (statuses < 500))),
+             "unavailable": int(np.sum(statuses == 503)),
+             "errors": int(np.sum((statuses >= 500) & (statuses != 503))),
+             "elapsed_s": round(elapsed, 3),
+             "throughput": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+             "peak_rss_mb": round(memory.peak, 1)}
+    for percentile in PERCENTILES:
+        stats[f"p{percentile}_ms"] = round(1000 * float(np.percentile(latencies, percentile)), 2) \
+            if len(latencies) else None
+    stats["mean_ms"] = round(1000 * float(latencies.mean()), 2) if len(latencies) else None
+    return stats
+
+
+def environment(app) -> dict:
+    '''
+    Return what the results depend on besides the code: the commit, the machine and the
+    configuration of the app.
+    '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "route_workers": app.config["ROUTE_WORKERS"],
+            "route_queue": app.config["ROUTE_QUEUE"],
+            "snap": app.config["SNAP_MODE"]}
+
+def save_results(path:str, results:dict):
+    '''
+    Write the results of a load test in a JSON file.
+    '''
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(dict(results, version=RESULTS_VERSION), file, indent=2)
+
+def compare_results(results:dict, baseline:dict) -> list:
+    '''
+    Compare the runs of a load test with the same runs (engine, cache, concurrency) of
+    a baseline, for example the results of the previous commit.
+    OUTPUT:
+        - changes (list) : (run, ratio of the p95 latency, ratio of the throughput,
+                            regression) of the runs found in the baseline.
+    '''
+    if baseline.get("version") != RESULTS_VERSION:
+        raise ValueError("The baseline has another format of results.")
+
+    def run_key(run:dict) -> tuple:
+        return run["engine"], run["cache_mb"], run["concurrency"]
+
+    previous = {run_key(run): run for run in baseline["runs"]}
+    changes = []
+    for run in results["runs"]:
+        old = previous.get(run_key(run))
+        if old is None or not old["p95_ms"] or not old["throughput"] or not run["p95_ms"]:
+            continue
+        latency = run["p95_ms"] / old["p95_ms"]
+        throughput = run["throughput"] / old["throughput"]
+        changes.append((run_key(run), latency, throughput,
+                        latency > REGRESSION_RATIO or throughput < 1 / REGRESSION_RATIO))
+    return changes
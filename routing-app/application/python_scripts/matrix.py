@@ -0,0 +1,142 @@
+'''
+Script for the travel time matrices between many origins and destinations
+'''
+from heapq import heappush, heappop
+import numpy as np
+
+from .search import seeds
+
+# Maximum number of cells of a matrix (origins x destinations)
+MAX_MATRIX_CELLS = 250000
+
+
+class MatrixTooLargeError(ValueError):
+    '''
+    Raised when the requested matrix has too many cells.
+    '''
+
+
+def check_matrix_size(n_sources:int, n_targets:int):
+    '''
+    Raise a MatrixTooLargeError if the matrix has more than MAX_MATRIX_CELLS cells.
+    '''
+    if n_sources * n_targets > MAX_MATRIX_CELLS:
+        raise MatrixTooLargeError(f"La matrice demandée est trop grande"
+                                  f" ({n_sources} x {n_targets},"
+                                  f" au plus {MAX_MATRIX_CELLS} cases).")
+
+
+def one_to_many(graph, source, targets:list) -> np.ndarray:
+    '''
+    Dijkstra from source to several targets at once, stopping when all the nodes of the
+    targets are settled.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - source (int or list) : index of the start node, or its seeds (see search.seeds).
+        - targets (list) : index of each end node, or its seeds (see search.seeds).
+    OUTPUT:
+        - costs (np.ndarray) : cost from source to each target (inf if unreachable).
+    '''
+    offsets, targets_view, weights = graph.views()
+    inf = float('inf')
+    ends = [seeds(target) for target in targets]
+    remaining = {node for end in ends for node, _ in end}
+    dist, settled, heap = {}, set(), []
+    for node, cost in seeds(source):
+        if cost < dist.get(node, inf):
+            dist[node] = cost
+            heappush(heap, (cost, node))
+    while heap and remaining:
+        d, u = heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        remaining.discard(u)
+        for i in range(offsets[u], offsets[u+1]):
+            v = targets_view[i]
+            nd = d + weights[i]
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                heappush(heap, (nd, v))
+
+    return np.array([min((dist[node] + cost for node, cost in end if node in settled),
+                         default=inf) for end in ends], dtype=np.float32)
+
+
+def _upward_search(offsets, targets, edge_ids, edge_weights, source) -> dict:
+    '''
+    Return the cost of all the nodes reached by the upward search of a hierarchy.
+    '''
+    inf = float('inf')
+    dist, settled, heap = {}, {}, []
+    for node, cost in seeds(source):
+        if cost < dist.get(node, inf):
+            dist[node] = cost
+            heappush(heap, (cost, node))
+    while heap:
+        d, u = heappop(heap)
+        if u in settled:
+            continue
+        settled[u] = d
+        for i in range(offsets[u], offsets[u+1]):
+            v = targets[i]
+            nd = d + edge_weights[edge_ids[i]]
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                heappush(heap, (nd, v))
+    return settled
+
+
+def ch_many_to_many(ch, sources:list, targets:list) -> np.ndarray:
+    '''
+    Bucket-based many-to-many on a contraction hierarchy.
+    The backward upward search of each target leaves (target, cost) in a bucket at each
+    node it settles, then the forward upward search of each source scans the buckets of the
+    nodes it settles: every source-target pair meets at the highest node of its path.
+    INPUT:
+        - ch (ContractionHierarchy) : the hierarchy.
+        - sources (list) : index of each start node, or its seeds (see search.seeds).
+        - targets (list) : index of each end node, or its seeds (see search.seeds).
+    OUTPUT:
+        - costs (np.ndarray) : cost between each source and each target, shape
+                               (len(sources), len(targets)), inf if unreachable.
+    '''
+    edge_weights = memoryview(ch.edge_weights)
+    up = (memoryview(ch.up_offsets), memoryview(ch.up_targets), memoryview(ch.up_edges))
+    down = (memoryview(ch.down_offsets), memoryview(ch.down_targets), memoryview(ch.down_edges))
+
+    buckets = {}
+    for j, target in enumerate(targets):
+        for node, cost in _upward_search(*down, edge_weights, target).items():
+            buckets.setdefault(node, []).append((j, cost))
+
+    costs = np.empty((len(sources), len(targets)), dtype=np.float32)
+    for i, source in enumerate(sources):
+        row = [float('inf')] * len(targets)
+        for node, cost in _upward_search(*up, edge_weights, source).items():
+            for j, bucket_cost in buckets.get(node, ()):
+                if cost + bucket_cost < row[j]:
+                    row[j] = cost + bucket_cost
+        costs[i] = row
+    return costs
+
+
+def travel_time_matrix(graph, sources:list, targets:list, ch=None) -> np.ndarray:
+    '''
+    Return the matrix of the costs between sources and targets, with the buckets of the
+    contraction hierarchy if it is given, else with one one-to-many Dijkstra per source.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - sources (list) : index of each start node, or its seeds (see search.seeds).
+        - targets (list) : index of each end node, or its seeds (see search.seeds).
+        - ch (ContractionHierarchy) (default: None) : hierarchy of the graph.
+    OUTPUT:
+        - costs (np.ndarray) : float32 matrix of shape (len(sources), len(targets)).
+    '''
+    check_matrix_size(len(sources), len(targets))
+    if ch is not None:
+        return ch_many_to_many(ch, sources, targets)
+    costs = np.empty((len(sources), len(targets)), dtype=np.float32)
+    for i, source in enumerate(sources):
+        costs[i] = one_to_many(graph, source, targets)
+    return costs
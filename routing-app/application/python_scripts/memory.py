@@ -0,0 +1,70 @@
+'''
+Script for the memory used by the processes of the app
+
+To check the memory of the workers of gunicorn : python -m application.python_scripts.memory <master pid>
+'''
+import os
+import sys
+
+
+def process_memory(pid:int=None) -> dict:
+    '''
+    Return the memory used by a process (MB), read in /proc (Linux only):
+        - rss : resident memory, the pages shared with other processes included.
+        - pss : proportional memory, each shared page divided by the number of processes
+                sharing it. The sum of the pss of the workers is the real memory used.
+        - shared : resident memory shared with other processes (mapped files, pages of the
+                   master process not modified since the fork).
+        - private : resident memory used by this process only.
+    INPUT:
+        - pid (int) (default: None) : id of the process, the current process by default.
+    '''
+    pid = os.getpid() if pid is None else pid
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    memory = {"pid": pid, "rss": 0., "pss": 0., "shared": 0., "private": 0.}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as file:
+            for line in file:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    # Values in kB
+                    memory[fields[key]] += int(value.split()[0]) / 1024
+    except OSError:
+        # Without /proc, only the peak resident memory of the current process is known
+        import resource
+        memory["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return memory
+
+def children(pid:int) -> list:
+    '''
+    Return the ids of the child processes of a process (Linux only).
+    '''
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as file:
+            return [int(child) for child in file.read().split()]
+    except OSError:
+        return []
+
+def workers_memory(master_pid:int) -> list:
+    '''
+    Return the memory of the master process and of each of its workers.
+    '''
+    return [process_memory(pid) for pid in [master_pid] + children(master_pid)]
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit("Usage : python -m application.python_scripts.memory <master pid>")
+    memories = workers_memory(int(sys.argv[1]))
+    print(f"{'Process':<10}{'RSS (MB)':>10}{'PSS (MB)':>10}{'Shared (MB)':>13}{'Private (MB)':>14}")
+    for i, memory in enumerate(memories):
+        name = "master" if i == 0 else f"worker {i}"
+        print(f"{name:<10}{memory['rss']:>10.1f}{memory['pss']:>10.1f}{memory['shared']:>13.1f}"
+              f"{memory['private']:>14.1f}")
+    print(f"{'total':<10}{sum(m['rss'] for m in memories):>10.1f}"
+          f"{sum(m['pss'] for m in memories):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
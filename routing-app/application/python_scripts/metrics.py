@@ -0,0 +1,192 @@
+'''
+Script for the metrics of the app (time of each stage of the routes, settled nodes, cache,
+size of the responses) kept in histograms in the process and given in the Prometheus text
+format, and for the sampled profiling of the routes
+'''
+import cProfile
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+# Upper bounds of the buckets of the histograms of durations (s), of settled nodes and of
+# sizes of the responses (bytes)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                   5, 10)
+SETTLED_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+PAYLOAD_BUCKETS = (256, 1024, 4096, 16_384, 65_536, 262_144, 1_048_576)
+
+# Metrics of the app : name -> (type, help, buckets of the histograms)
+METRICS = {
+    "routing_stage_seconds": ("histogram", "Time of each stage of the requests of routing"
+                              " and of the loading of the graph.", LATENCY_BUCKETS),
+    "routing_settled_nodes": ("histogram", "Nodes settled by the search of a route.",
+                              SETTLED_BUCKETS),
+    "routing_cache_requests_total": ("counter", "Routes taken from the route cache (hit) or"
+                                     " computed (miss).", None),
+    "http_request_duration_seconds": ("histogram", "Time to answer a request.",
+                                      LATENCY_BUCKETS),
+    "http_response_bytes": ("histogram", "Size of the body of the responses, compressed.",
+                            PAYLOAD_BUCKETS),
+    "routing_profiles_total": ("counter", "Computations profiled with cProfile.", None),
+}
+
+# Number of profiles kept per process, the oldest ones are overwritten
+MAX_PROFILES = 100
+
+
+class Histogram:
+    '''
+    Cumulative histogram with fixed buckets, as the Prometheus histograms: one count per
+    bucket, the sum and the number of values.
+    '''
+    def __init__(self, buckets:tuple):
+        self.buckets = buckets
+        # Count of the values of each bucket, the last one is above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+
+    def observe(self, value:float):
+        '''
+        Add a value to the histogram.
+        '''
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    '''
+    Metrics of the process (see METRICS), by name and labels. A value costs one lock and one
+    bisection, so the metrics stay on under load. The computations of routes can be profiled
+    with cProfile, one computation in profile_every.
+    '''
+    def __init__(self, profile_every:int=0, profile_dir:str=None):
+        '''
+        INPUT:
+            - profile_every (int) (default: 0) : profile one computation in profile_every,
+                                                 0 to never profile.
+            - profile_dir (str) (default: None) : folder of the profiles (.prof files).
+        '''
+        self.profile_every = profile_every if profile_dir is not None else 0
+        self.profile_dir = profile_dir
+        self._lock = Lock()
+        # Values by (name, labels), labels being a sorted tuple of (label, value)
+        self._histograms = {}
+        self._counters = {}
+        self._calls = 0
+        self.profiles = 0
+        if self.profile_every:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def observe(self, name:str, value:float, **labels):
+        '''
+        Add a value to a histogram of METRICS.
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    def inc(self, name:str, value:float=1, **labels):
+        '''
+        Increment a counter of METRICS.
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name:str, **labels):
+        '''
+        Add the duration of the block (s) to a histogram of METRICS.
+        '''
+        dbt = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - dbt, **labels)
+
+    def profiled(self, function, *args):
+        '''
+        Return function(*args), computed under cProfile one call in profile_every: the
+        profile is written in profile_dir, as <function>-<pid>-<number>.prof, the number
+        going round MAX_PROFILES.
+        '''
+        if not self.profile_every:
+            return function(*args)
+        with self._lock:
+            self._calls += 1
+            sampled = self._calls % self.profile_every == 0
+            if sampled:
+                number = self.profiles % MAX_PROFILES
+                self.profiles += 1
+        if not sampled:
+            return function(*args)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            profile.dump_stats(os.path.join(self.profile_dir,
+                                            f"{function.__name__}-{os.getpid()}-{number}.prof"))
+            self.inc("routing_profiles_total")
+
+    def render(self) -> str:
+        '''
+        Return the metrics in the Prometheus text format.
+        '''
+        with self._lock:
+            histograms = {key: (list(histogram.counts), histogram.sum)
+                          for key, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, (kind, description, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            for (key_name, labels), (counts, total) in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulated = 0
+                for bound, count in zip(buckets + ("+Inf",), counts):
+                    cumulated += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))}"
+                                 f" {cumulated}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulated}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels:tuple) -> str:
+    '''
+    Return the labels of a metric in the Prometheus text format, {label="value",...}.
+    '''
+    if not labels:
+        return ""
+    escaped = (f'{label}="' + str(value).replace("\\", "\\\\").replace('"', '\\"')
+               .replace("\n", "\\n") + '"' for label, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+_METRICS = Metrics()
+
+def configure_metrics(profile_every:int=0, profile_dir:str=None) -> Metrics:
+    '''
+    Replace the metrics of the app by new empty metrics, profiling one computation of route
+    in profile_every in profile_dir.
+    '''
+    global _METRICS
+    _METRICS = Metrics(profile_every, profile_dir)
+    return _METRICS
+
+def get_metrics() -> Metrics:
+    '''
+    Return the metrics of the app.
+    '''
+    return _METRICS
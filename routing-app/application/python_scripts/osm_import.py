@@ -0,0 +1,428 @@
+'''
+Script for the offline import of the bike graph from an OSM extract (XML or PBF)
+
+To import an extract : python -m application.python_scripts.osm_import ile-de-france.osm.pbf
+'''
+import argparse
+import bz2
+import gzip
+import os
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from time import time
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .csr_graph import CSRGraph
+from .elevation import DEM, add_elevation
+from .edge_store import EdgeStore
+from .snapshot import save_snapshot
+from .weights import FORBIDDEN_HIGHWAYS, MAX_SPEED_KPH
+
+# Highways excluded from the bike network, as the "bike" network of osmnx, with the
+# highways forbidden to bikes dropped at import instead of getting an infinite weight
+EXCLUDED_HIGHWAYS = {"abandoned", "bus_guideway", "construction", "corridor", "elevator",
+                     "escalator", "footway", "no", "planned", "platform", "proposed",
+                     "raceway", "razed", "rest_area", "services", "steps"} \
+    | set(FORBIDDEN_HIGHWAYS)
+
+# Values of the oneway tag, as osmnx
+ONEWAY_VALUES = {"yes", "true", "1"}
+REVERSE_ONEWAY_VALUES = {"-1", "reverse"}
+
+# Radius of the Earth used for the lengths of the edges (m), as osmnx
+EARTH_RADIUS = 6371009
+
+# Number of nodes read before filtering them, bounds the memory of the second pass
+NODE_CHUNK_SIZE = 1000000
+
+
+def is_bike_way(tags:dict) -> bool:
+    '''
+    Return True if a way with these tags can be used by bikes.
+    '''
+    highway = tags.get("highway")
+    if highway is None or highway in EXCLUDED_HIGHWAYS or "motor" in highway:
+        return False
+    return tags.get("area") != "yes" and tags.get("bicycle") != "no" \
+        and tags.get("service") != "private" and tags.get("access") != "private"
+
+def parse_maxspeed(value:str) -> float:
+    '''
+    Return the speed (km/h) of a maxspeed tag, the mean of its values if there are several
+    (nan if there is no number, as "FR:urban").
+    '''
+    speeds = []
+    for part in value.split(";"):
+        match = re.match(r"\s*([0-9]+(?:[.,][0-9]+)?)\s*(mph)?", part)
+        if match:
+            speed = float(match.group(1).replace(",", "."))
+            speeds.append(speed * 1.609344 if match.group(2) else speed)
+    return sum(speeds) / len(speeds) if speeds else float('nan')
+
+
+class WayCollector:
+    '''
+    Bike ways of the extract, kept in flat arrays rather than in Python objects.
+    '''
+    def __init__(self):
+        self.refs = array('q')
+        self.offsets = array('q', [0])
+        self.highway_ids = array('i')
+        self.name_ids = array('i')
+        self.way_ids = array('q')
+        self.maxspeeds = array('f')
+        self.oneways = array('b')
+        self.highways, self.names = {}, {}
+        self.n_read = 0
+
+    def __len__(self) -> int:
+        return len(self.highway_ids)
+
+    def add(self, refs:list, tags:dict, way_id:int=-1):
+        '''
+        Keep the way if it can be used by bikes.
+        '''
+        self.n_read += 1
+        if len(refs) < 2 or not is_bike_way(tags):
+            return
+        self.refs.extend(refs)
+        self.offsets.append(len(self.refs))
+        self.way_ids.append(way_id)
+        self.highway_ids.append(self.highways.setdefault(tags["highway"], len(self.highways)))
+        name = tags.get("name")
+        self.name_ids.append(-1 if name is None else self.names.setdefault(name, len(self.names)))
+        maxspeed = tags.get("maxspeed")
+        self.maxspeeds.append(float('nan') if maxspeed is None else parse_maxspeed(maxspeed))
+        oneway = tags.get("oneway")
+        if oneway in ONEWAY_VALUES or tags.get("junction") == "roundabout":
+            self.oneways.append(1)
+        elif oneway in REVERSE_ONEWAY_VALUES:
+            self.oneways.append(-1)
+        else:
+            self.oneways.append(0)
+
+
+class NodeCollector:
+    '''
+    Coordinates of the nodes of the bike ways. The nodes are read by chunks of
+    NODE_CHUNK_SIZE and only the wanted ones are kept, with the ids of the traffic signals.
+    '''
+    def __init__(self, wanted:np.ndarray):
+        '''
+        INPUT:
+            - wanted (np.ndarray) : sorted OSM ids of the nodes to keep.
+        '''
+        self.wanted = wanted
+        self._ids, self._lat, self._lon = array('q'), array('d'), array('d')
+        self._chunks = []
+        self._signals = array('q')
+        self.n_read = 0
+
+    def add(self, node_id:int, lat:float, lon:float, signal:bool=False):
+        self.n_read += 1
+        if signal:
+            self._signals.append(node_id)
+        self._ids.append(node_id)
+        self._lat.append(lat)
+        self._lon.append(lon)
+        if len(self._ids) >= NODE_CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        ids = np.frombuffer(self._ids, dtype=np.int64)
+        keep = np.isin(ids, self.wanted, assume_unique=True)
+        self._chunks.append((ids[keep].copy(), np.frombuffer(self._lat)[keep].copy(),
+                             np.frombuffer(self._lon)[keep].copy()))
+        self._ids, self._lat, self._lon = array('q'), array('d'), array('d')
+
+    def result(self) -> tuple:
+        '''
+        Return the OSM ids, latitudes and longitudes of the kept nodes, sorted by id.
+        '''
+        self._flush()
+        ids, lat, lon = (np.concatenate(arrays) for arrays in zip(*self._chunks))
+        order = np.argsort(ids)
+        return ids[order], lat[order], lon[order]
+
+    def signal_ids(self) -> np.ndarray:
+        '''
+        Return the OSM ids of the wanted nodes tagged highway=traffic_signals, sorted.
+        '''
+        ids = np.unique(np.frombuffer(self._signals, dtype=np.int64))
+        return ids[np.isin(ids, self.wanted, assume_unique=True)]
+
+
+def _open(path:str):
+    '''
+    Open an OSM XML file, compressed with gzip or bzip2 or not.
+    '''
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+def _read_xml(path:str, ways:WayCollector=None, nodes:NodeCollector=None):
+    '''
+    Stream the ways or the nodes of an OSM XML file. The elements are cleared as soon as
+    they are read so the memory does not depend on the size of the file.
+    '''
+    with _open(path) as file:
+        root = None
+        for event, elem in ET.iterparse(file, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event != "end":
+                continue
+            if elem.tag == "way" and ways is not None:
+                ways.add([int(nd.get("ref")) for nd in elem.iter("nd")],
+                         {tag.get("k"): tag.get("v") for tag in elem.iter("tag")},
+                         int(elem.get("id")))
+            elif elem.tag == "node" and nodes is not None:
+                nodes.add(int(elem.get("id")), float(elem.get("lat")), float(elem.get("lon")),
+                          any(tag.get("k") == "highway" and tag.get("v") == "traffic_signals"
+                              for tag in elem.iter("tag")))
+            elif elem.tag not in ("node", "way", "relation"):
+                continue
+            root.clear()
+
+def _read_pbf(path:str, ways:WayCollector=None, nodes:NodeCollector=None):
+    '''
+    Stream the ways or the nodes of an OSM PBF file with pyosmium (optional dependency).
+    '''
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("The PBF extracts are read with pyosmium: pip install osmium,"
+                          " or convert the extract to OSM XML.") from None
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, way):
+            if ways is not None:
+                ways.add([node.ref for node in way.nodes], {tag.k: tag.v for tag in way.tags},
+                         way.id)
+
+        def node(self, node):
+            if nodes is not None and node.location.valid():
+                nodes.add(node.id, node.location.lat, node.location.lon,
+                          node.tags.get("highway") == "traffic_signals")
+
+    Handler().apply_file(path)
+
+
+def build_graph(ways:WayCollector, node_ids, lat, lon, bbox:tuple=None,
+                largest_component:bool=True, signal_ids=None) -> tuple:
+    '''
+    Build the CSR graph and the edge store of the bike ways, one edge per segment of a way
+    (the graph is not simplified), in both directions unless the way is oneway.
+    The speeds of the edges are imputed as osmnx's add_edge_speeds: the maxspeed of the way,
+    else the mean speed of its highway type, else the mean of these means. The weights are
+    the ones of custom_weight.
+    INPUT:
+        - ways (WayCollector) : the bike ways.
+        - node_ids, lat, lon (np.ndarray) : OSM ids (sorted) and coordinates of the nodes.
+        - bbox (tuple) (default: None) : (north, south, east, west), the nodes outside are
+                                         dropped. By default, the bounding box of the nodes.
+        - largest_component (bool) (default: True) : keep only the largest weakly connected
+                                                     component, as osmnx.
+        - signal_ids (np.ndarray) (default: None) : sorted OSM ids of the traffic signals.
+    OUTPUT:
+        - graph (CSRGraph) : the graph.
+        - edges (EdgeStore) : the geometry and the attributes of the edges.
+        - bbox (tuple) : bounding box of the graph.
+    '''
+    refs = np.frombuffer(ways.refs, dtype=np.int64)
+    offsets = np.frombuffer(ways.offsets, dtype=np.int64)
+    sizes = np.diff(offsets)
+    # Segments between the consecutive nodes of each way
+    way = np.repeat(np.arange(len(sizes)), sizes - 1)
+    first = np.ones(len(refs), dtype=bool)
+    first[offsets[1:] - 1] = False
+    u_ids, v_ids = refs[:-1][first[:-1]], refs[1:][first[:-1]]
+
+    # Index of the nodes, -1 for the nodes missing in the extract or outside of the bbox
+    if bbox is not None:
+        north, south, east, west = bbox
+        inside = (lat <= north) & (lat >= south) & (lon <= east) & (lon >= west)
+        node_ids, lat, lon = node_ids[inside], lat[inside], lon[inside]
+    if len(node_ids) == 0:
+        raise ValueError(f"No node of the bike ways of the extract in the bounding box {bbox}.")
+    def index(ids):
+        positions = np.minimum(np.searchsorted(node_ids, ids), len(node_ids) - 1)
+        return np.where(node_ids[positions] == ids, positions, -1)
+    u, v = index(u_ids), index(v_ids)
+    keep = (u >= 0) & (v >= 0) & (u != v)
+    if not keep.any():
+        raise ValueError("No segment of the bike ways of the extract has its two nodes in the"
+                         " area, the graph would be empty.")
+    u, v, way = u[keep], v[keep], way[keep]
+
+    # Directions allowed by the oneway tags
+    oneway = np.frombuffer(ways.oneways, dtype=np.int8)[way]
+    forward, backward = oneway >= 0, oneway <= 0
+    sources = np.concatenate((u[forward], v[backward]))
+    targets = np.concatenate((v[forward], u[backward]))
+    way = np.concatenate((way[forward], way[backward]))
+
+    if largest_component and len(sources):
+        n = len(node_ids)
+        adjacency = coo_matrix((np.ones(len(sources)), (sources, targets)), shape=(n, n))
+        _, labels = connected_components(adjacency, directed=True, connection="weak")
+        kept = labels == np.argmax(np.bincount(labels))
+        in_component = kept[sources]
+        sources, targets, way = sources[in_component], targets[in_component], way[in_component]
+    # Only the nodes of the edges are kept
+    used = np.zeros(len(node_ids), dtype=bool)
+    used[sources] = used[targets] = True
+    new_index = np.cumsum(used) - 1
+    node_ids, lat, lon = node_ids[used], lat[used], lon[used]
+    sources, targets = new_index[sources].astype(np.int32), new_index[targets].astype(np.int32)
+
+    # Great-circle length of the edges
+    lat_u, lon_u = np.radians(lat[sources]), np.radians(lon[sources])
+    lat_v, lon_v = np.radians(lat[targets]), np.radians(lon[targets])
+    a = np.sin((lat_v - lat_u) / 2)**2 \
+        + np.cos(lat_u) * np.cos(lat_v) * np.sin((lon_v - lon_u) / 2)**2
+    lengths = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    # Speeds imputed by highway type
+    highway = np.frombuffer(ways.highway_ids, dtype=np.int32)[way]
+    speeds = np.frombuffer(ways.maxspeeds, dtype=np.float32)[way].astype(np.float64)
+    known = np.isfinite(speeds)
+    n_types = len(ways.highways)
+    counts = np.bincount(highway[known], minlength=n_types)
+    totals = np.bincount(highway[known], weights=speeds[known], minlength=n_types)
+    type_speeds = np.full(n_types, np.nan)
+    np.divide(totals, counts, out=type_speeds, where=counts > 0)
+    fallback = np.nanmean(type_speeds) if np.isfinite(type_speeds).any() else MAX_SPEED_KPH
+    type_speeds[~np.isfinite(type_speeds)] = fallback
+    speeds[~known] = type_speeds[highway[~known]]
+    # Same cost as custom_weight, the forbidden highways are already dropped
+    weights = lengths / (np.minimum(speeds, MAX_SPEED_KPH) / 3.6)
+
+    # Edges sorted by source node, the id of an edge is its position
+    order = np.argsort(sources, kind="stable")
+    sources, targets, way = sources[order], targets[order], way[order]
+    csr_offsets = np.zeros(len(node_ids)+1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=csr_offsets[1:])
+    graph = CSRGraph(node_ids, lat, lon, csr_offsets, targets, weights[order].astype(np.float32),
+                     np.arange(len(targets), dtype=np.int32))
+
+    # Traffic signals at the end of the edges
+    signals = np.isin(node_ids[targets], signal_ids if signal_ids is not None else []) \
+        .astype(np.uint8)
+
+    # The edges are straight lines between their nodes
+    coords = np.empty((2 * len(targets), 2), dtype=np.float64)
+    coords[0::2, 0], coords[0::2, 1] = lon[sources], lat[sources]
+    coords[1::2, 0], coords[1::2, 1] = lon[targets], lat[targets]
+    edges = EdgeStore(coords, np.arange(0, 2 * len(targets) + 1, 2, dtype=np.int64),
+                      lengths[order].astype(np.float32),
+                      np.frombuffer(ways.name_ids, dtype=np.int32)[way].copy(),
+                      np.frombuffer(ways.way_ids, dtype=np.int64)[way].copy(),
+                      list(ways.names), graph.weights, speeds[order].astype(np.float32),
+                      signals=signals)
+
+    if bbox is None:
+        bbox = (float(lat.max()), float(lat.min()), float(lon.max()), float(lon.min()))
+    return graph, edges, bbox
+
+
+def import_osm(path:str, bbox:tuple=None, largest_component:bool=True,
+               verbose:bool=True) -> tuple:
+    '''
+    Import the bike graph of an OSM extract in two streaming passes: the bike ways first,
+    then the coordinates of their nodes only.
+    INPUT:
+        - path (str) : path of the extract (.osm, .osm.gz, .osm.bz2 or .osm.pbf).
+        - bbox (tuple) (default: None) : (north, south, east, west) area to keep.
+        - largest_component (bool) (default: True) : keep only the largest component.
+        - verbose (bool) (default: True) : print the progress and the throughput.
+    OUTPUT:
+        - graph (CSRGraph) : the graph.
+        - edges (EdgeStore) : the geometry and the attributes of the edges.
+        - bbox (tuple) : bounding box of the graph.
+        - stats (dict) : sizes, durations and throughput of the import.
+    '''
+    read = _read_pbf if path.endswith(".pbf") else _read_xml
+    dbt = time()
+    ways = WayCollector()
+    read(path, ways=ways)
+    ways_time = time()-dbt
+    if verbose:
+        print(f"Voies lues : {ways.n_read} ({len(ways)} cyclables) en {ways_time:.1f} s")
+
+    dbt = time()
+    nodes = NodeCollector(np.unique(np.frombuffer(ways.refs, dtype=np.int64)))
+    read(path, nodes=nodes)
+    node_ids, lat, lon = nodes.result()
+    nodes_time = time()-dbt
+    if verbose:
+        print(f"Noeuds lus : {nodes.n_read} ({len(node_ids)} gardés) en {nodes_time:.1f} s")
+
+    dbt = time()
+    graph, edges, bbox = build_graph(ways, node_ids, lat, lon, bbox, largest_component,
+                                     nodes.signal_ids())
+    build_time = time()-dbt
+    total_time = ways_time + nodes_time + build_time
+    size = os.path.getsize(path)
+    stats = {"file_mb": size / 1024**2,
+             "ways_read": ways.n_read,
+             "bike_ways": len(ways),
+             "nodes_read": nodes.n_read,
+             "nodes": graph.n_nodes,
+             "edges": graph.n_edges,
+             "time": total_time,
+             # Both passes read the whole file
+             "mb_per_s": 2 * size / 1024**2 / max(ways_time + nodes_time, 1e-9),
+             "elements_per_s": (ways.n_read + nodes.n_read) / max(ways_time + nodes_time, 1e-9),
+             "peak_rss_mb": _peak_rss_mb()}
+    if verbose:
+        print(f"Graphe : {graph.n_nodes} noeuds, {graph.n_edges} arcs en {build_time:.1f} s")
+        print(f"Temps total de l'import : {total_time:.1f} s ({stats['mb_per_s']:.1f} Mo/s,"
+              f" {stats['elements_per_s']:.0f} éléments/s, mémoire max"
+              f" {stats['peak_rss_mb']:.0f} Mo)")
+    return graph, edges, bbox, stats
+
+def _peak_rss_mb() -> float:
+    '''
+    Return the peak resident memory of the process (MB), nan if it is not available.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the bike graph of an OSM extract.")
+    parser.add_argument("extract", help="OSM extract (.osm, .osm.gz, .osm.bz2 or .osm.pbf).")
+    parser.add_argument("--graph-dir", default=os.path.join("instance", "graph"),
+                        help="Graph folder of the snapshot (default: instance/graph).")
+    parser.add_argument("--bbox", default=None,
+                        help="Area to keep: north,south,east,west (default: all the extract).")
+    parser.add_argument("--all-components", action="store_true",
+                        help="Keep all the components, not only the largest one.")
+    parser.add_argument("--dem", default=None,
+                        help="DEM of the area (GeoTIFF) giving the climbs of the edges.")
+    args = parser.parse_args()
+
+    bbox = tuple(float(value) for value in args.bbox.split(",")) if args.bbox else None
+    try:
+        graph, edges, bbox, _ = import_osm(args.extract, bbox, not args.all_components)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.dem is not None:
+        add_elevation(edges, DEM.read(args.dem))
+    path = save_snapshot(args.graph_dir, graph, edges, bbox)
+    print(f"Graphe enregistré dans {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+'''
+Script for the temporary overrides of the weights of the graph (closures, road works, penalties)
+'''
+import hashlib
+import json
+import math
+import os
+import secrets
+from threading import RLock
+from time import time
+import numpy as np
+
+from .contraction import customize
+from .edge_store import _ranges
+from .weights import DEFAULT_PROFILE
+
+# Name of the file of the overrides in the graph folder, shared by the workers of the app
+OVERRIDES_FILENAME = "overrides.json"
+
+
+class OverrideError(ValueError):
+    '''
+    Raised when an override of the weights is not valid.
+    '''
+
+
+class WeightOverrides:
+    '''
+    Overrides of the weights of the resident graph. An override multiplies the weight of its
+    edges (the edges of some OSM ways, or the edges with an end in a bounding box) by a factor,
+    inf for a closure, until its expiry time.
+    Only the edges of the added, removed or expired overrides are updated, in copies of the
+    graphs of all the weight profiles and of the contraction hierarchy (see
+    contraction.customize), published in the store with its new version at once (see
+    GraphStore.publish): the requests in progress keep the previous weights, and the cached
+    routes of the previous weights are not used.
+    The overrides are saved in a file shared by the workers of the app: each worker applies
+    the changes of the file at its next request (see sync).
+    '''
+    def __init__(self, store, path:str=None):
+        '''
+        INPUT:
+            - store (GraphStore) : the graph store.
+            - path (str) (default: None) : file of the overrides shared by the workers.
+        '''
+        self.store = store
+        self.path = path
+        self.base_version = store.graph.fingerprint()[:16]
+        # Overrides by id, and the edges of each override
+        self.overrides = {}
+        self._edges = {}
+        # Graphs of the weight profiles without override, never changed (the new weights are
+        # published in copies), and overrides of each overridden edge
+        self._original = dict(store.profiles)
+        self._covering = {}
+        self._ways = None
+        self._mtime = None
+        self._next_expiry = float('inf')
+        self._lock = RLock()
+
+    def select_edges(self, ways:list=None, bbox:list=None) -> np.ndarray:
+        '''
+        Return the ids of the edges of OSM ways, or of the edges with an end in a bounding box.
+        INPUT:
+            - ways (list) (default: None) : OSM ids of the ways.
+            - bbox (list) (default: None) : (north, south, east, west) bounding box.
+        OUTPUT:
+            - edges (np.ndarray) : ids of the edges, sorted.
+        '''
+        graph = self.store.graph
+        selected = []
+        if ways:
+            if self._ways is None:
+                # Edges sorted by way, built at the first override by way
+                order = np.argsort(self.store.edges.way_ids, kind="stable")
+                self._ways = (order, np.asarray(self.store.edges.way_ids)[order])
+            order, sorted_ways = self._ways
+            ways = np.asarray(ways, dtype=np.int64)
+            starts = np.searchsorted(sorted_ways, ways, side="left")
+            ends = np.searchsorted(sorted_ways, ways, side="right")
+            selected.append(order[_ranges(starts, ends - starts)])
+        if bbox:
+            north, south, east, west = bbox
+            index = self.store.index
+            # Nodes in the circle around the bounding box, then in the bounding box
+            center = index.project([(north + south) / 2], [(east + west) / 2])[0]
+            radius = float(np.linalg.norm(index.project([north], [east])[0]
+                                          - index.project([south], [west])[0])) / 2
+            nodes = np.asarray(index.node_tree.query_ball_point(center, radius + 1),
+                               dtype=np.int64)
+            nodes = nodes[(graph.lat[nodes] <= north) & (graph.lat[nodes] >= south)
+                          & (graph.lon[nodes] <= east) & (graph.lon[nodes] >= west)]
+            reverse = graph.reverse()
+            # Edges leaving the nodes, and edges reaching them
+            selected.append(graph.edge_ids[_ranges(graph.offsets[nodes],
+                                                   np.diff(graph.offsets)[nodes])])
+            selected.append(reverse.edge_ids[_ranges(reverse.offsets[nodes],
+                                                     np.diff(reverse.offsets)[nodes])])
+        if not selected:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(selected).astype(np.int64))
+
+    def add(self, ways:list=None, bbox:list=None, factor:float=float('inf'),
+            expires:float=None, reason:str="", override_id:str=None) -> dict:
+        '''
+        Add an override of the weights and apply it to the graph.
+        INPUT:
+            - ways (list) (default: None) : OSM ids of the ways of the override.
+            - bbox (list) (default: None) : (north, south, east, west) area of the override.
+            - factor (float) (default: inf) : factor of the weights, at least 1, inf to close
+                                              the edges.
+            - expires (float) (default: None) : time (time.time()) at which the override is
+                                                removed, None to keep it until it is removed.
+            - reason (str) (default: "") : description of the override (road works, ...).
+            - override_id (str) (default: None) : id of the override, a new one by default.
+        OUTPUT:
+            - override (dict) : the override, with its id and its number of edges.
+        '''
+        try:
+            ways = [int(way) for way in ways] if ways else []
+            bbox = [float(value) for value in bbox] if bbox else []
+            factor = float('inf') if factor is None else float(factor)
+            expires = None if expires is None else float(expires)
+        except (TypeError, ValueError):
+            raise OverrideError("Modification des poids invalide.") from None
+        if not ways and not bbox:
+            raise OverrideError("Une modification des poids doit donner des voies ou une zone.")
+        if bbox and (len(bbox) != 4 or bbox[0] < bbox[1] or bbox[2] < bbox[3]):
+            raise OverrideError("La zone doit être donnée par (nord, sud, est, ouest).")
+        if not factor >= 1:
+            # Lower weights would make the lower bounds of A* and ALT wrong
+            raise OverrideError("Le facteur des poids doit être supérieur ou égal à 1.")
+        if expires is not None and expires <= time():
+            raise OverrideError("La date d'expiration est déjà passée.")
+        edges = self.select_edges(ways, bbox)
+        if not len(edges):
+            raise OverrideError("Aucun arc du graphe ne correspond à la modification des poids.")
+
+        with self._lock:
+            self.sync()
+            override = {"id": override_id or secrets.token_hex(6),
+                        "ways": ways,
+                        "bbox": bbox,
+                        "factor": factor,
+                        "expires": expires,
+                        "reason": reason,
+                        "created": time(),
+                        "edges": len(edges)}
+            self._add(override, edges)
+            self._save()
+        return override
+
+    def remove(self, override_id:str) -> bool:
+        '''
+        Remove an override and restore the weights of its edges.
+        OUTPUT:
+            - removed (bool) : False if there is no override of this id.
+        '''
+        with self._lock:
+            self.sync()
+            if override_id not in self.overrides:
+                return False
+            self._remove(override_id)
+            self._save()
+        return True
+
+    def list(self) -> list:
+        '''
+        Return the active overrides, the infinite factors (closures) as None.
+        '''
+        with self._lock:
+            self.sync()
+            return [dict(override, factor=None if math.isinf(override["factor"])
+                         else override["factor"]) for override in self.overrides.values()]
+
+    def sync(self):
+        '''
+        Remove the expired overrides and apply the changes of the shared file since the last
+        call. Called before each request, it only reads the date of the file when nothing
+        has changed.
+        '''
+        with self._lock:
+            now = time()
+            if now >= self._next_expiry:
+                for override_id in [override_id for override_id, override
+                                    in self.overrides.items()
+                                    if override["expires"] is not None
+                                    and override["expires"] <= now]:
+                    self._remove(override_id)
+            if self.path is None:
+                return
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            overrides = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, encoding="utf-8") as file:
+                        overrides = {override["id"]: override for override in json.load(file)}
+                except (OSError, ValueError):
+                    return
+            for override_id in set(self.overrides) - set(overrides):
+                self._remove(override_id)
+            for override_id in set(overrides) - set(self.overrides):
+                override = overrides[override_id]
+                if override["expires"] is None or override["expires"] > now:
+                    factor = override["factor"]
+                    override["factor"] = float('inf') if factor is None else float(factor)
+                    self._add(override, self.select_edges(override["ways"], override["bbox"]))
+
+    def _add(self, override:dict, edges:np.ndarray):
+        '''
+        Keep an override and publish the weights of its edges.
+        '''
+        for edge in edges.tolist():
+            self._covering.setdefault(edge, set()).add(override["id"])
+        self.overrides[override["id"]] = override
+        self._edges[override["id"]] = edges
+        self._update(edges)
+
+    def _remove(self, override_id:str):
+        '''
+        Forget an override and publish the weights of its edges without it.
+        '''
+        edges = self._edges.pop(override_id)
+        for edge in edges.tolist():
+            self._covering[edge].discard(override_id)
+            if not self._covering[edge]:
+                del self._covering[edge]
+        del self.overrides[override_id]
+        self._update(edges)
+
+    def _update(self, edges:np.ndarray):
+        '''
+        Compute the weights of edges from their weights without override and their overrides,
+        in copies of the graphs of the weight profiles and of the hierarchy, then publish them
+        in the store with the new version at once, and update the next expiry time.
+        Without override, the graphs and the hierarchy without override are published again.
+        '''
+        ids = sorted(self.overrides)
+        if not ids:
+            self.store.publish(dict(self._original), None, self.base_version)
+            self._next_expiry = float('inf')
+            return
+
+        base = np.column_stack([graph.weights[edges] for graph in self._original.values()]) \
+            .astype(np.float64)
+        factors = np.ones(len(edges))
+        for i, edge in enumerate(edges.tolist()):
+            for override_id in self._covering.get(edge, ()):
+                factors[i] *= self.overrides[override_id]["factor"]
+        # A closed edge of length 0 is closed too
+        weights = np.where(np.isinf(factors)[:, None], np.inf, base * factors[:, None])
+        profiles = {name: self.store.profiles[name].updated(edges,
+                                                            weights[:, k].astype(np.float32))
+                    for k, name in enumerate(self._original)}
+        ch = None
+        if self.store.ch is not None:
+            # Customized from the hierarchy of the previous overrides, out of the requests
+            ch = (self.store.overridden_ch or self.store.ch).customizable()
+            customize(ch, profiles[DEFAULT_PROFILE], edges)
+        self.store.publish(profiles, ch, self.base_version + "-"
+                           + hashlib.sha1(json.dumps(ids).encode()).hexdigest()[:8])
+        self._next_expiry = min((override["expires"] for override in self.overrides.values()
+                                 if override["expires"] is not None), default=float('inf'))
+
+    def _save(self):
+        '''
+        Write the overrides in the shared file, in a temporary file renamed at the end.
+        '''
+        if self.path is None:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            json.dump([dict(override, factor=None if math.isinf(override["factor"])
+                            else override["factor"]) for override in self.overrides.values()],
+                      file, indent=2)
+        os.replace(tmp, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+
+_OVERRIDES = None
+
+def configure_overrides(store, path:str=None) -> WeightOverrides:
+    '''
+    Create the overrides of the weights of the resident graph. The overrides already saved
+    in the shared file are applied at the first request (see WeightOverrides.sync), so the
+    commands of the app (build-ch, build-snapshot, ...) use the weights without override.
+    '''
+    global _OVERRIDES
+    _OVERRIDES = WeightOverrides(store, path)
+    return _OVERRIDES
+
+def get_overrides() -> WeightOverrides:
+    '''
+    Return the overrides of the weights of the resident graph, None if there are none.
+    '''
+    return _OVERRIDES
@@ -0,0 +1,175 @@
+'''
+Script for the compact geometry of the routes sent to the map: simplification at the scale
+of the zoom of the map and encoded polylines
+'''
+import math
+import numpy as np
+
+# Radius of the Earth (m)
+EARTH_RADIUS = 6371009
+
+# Formats of the geometry of the routes : list of [lon, lat] or encoded polyline (the format
+# of the Google Maps APIs, precision 1e-5 degree)
+ROUTE_FORMATS = ("coordinates", "polyline")
+POLYLINE_PRECISION = 5
+
+# Size of a pixel of the tiles at the zoom 0 and at the equator (m), halved at each zoom
+PIXEL_SIZE_ZOOM0 = 2 * math.pi * 6378137 / 256
+
+# Largest gap (pixels) between a route and its simplification
+TOLERANCE_PIXELS = 0.5
+
+# Zooms of the maps (Leaflet, OpenStreetMap tiles)
+MAX_ZOOM = 19
+
+
+class UnknownFormatError(ValueError):
+    '''
+    Raised when the requested format of the routes does not exist or the zoom is invalid.
+    '''
+
+
+def zoom_tolerance(zoom:float, lat:float) -> float:
+    '''
+    Return the tolerance of the simplification of a route at a zoom of the map (m): the
+    routes are simplified below TOLERANCE_PIXELS pixels.
+    '''
+    return TOLERANCE_PIXELS * PIXEL_SIZE_ZOOM0 * math.cos(math.radians(lat)) / 2**zoom
+
+def simplify(coordinates, tolerance:float) -> np.ndarray:
+    '''
+    Douglas-Peucker simplification of a line: the points further than tolerance from the
+    simplified line are kept. The ranges still to split are kept in a stack and the
+    distances of all the points of a range to its chord are computed at once with NumPy.
+    INPUT:
+        - coordinates (array-like) : [lon, lat] of the points of the line.
+        - tolerance (float) : largest distance between the line and its simplification (m).
+    OUTPUT:
+        - kept (np.ndarray) : sorted indexes of the points kept, with the first and the last.
+    '''
+    points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or tolerance <= 0:
+        return np.arange(len(points))
+    # Local equirectangular projection (m)
+    lat0 = math.radians(float(points[:, 1].mean()))
+    xy = EARTH_RADIUS * np.radians(points) * np.array([math.cos(lat0), 1.])
+
+    kept = np.zeros(len(points), dtype=bool)
+    kept[0] = kept[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a, b = xy[first], xy[last]
+        ab = b - a
+        squared = float(ab @ ab)
+        inner = xy[first+1:last] - a
+        if squared > 0:
+            # Distance to the segment [a, b]
+            t = np.clip(inner @ ab / squared, 0, 1)
+            gaps = np.linalg.norm(inner - t[:, None] * ab, axis=1)
+        else:
+            gaps = np.linalg.norm(inner, axis=1)
+        farthest = int(np.argmax(gaps))
+        if gaps[farthest] > tolerance:
+            split = first + 1 + farthest
+            kept[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(kept)
+
+
+def encode(coordinates, precision:int=POLYLINE_PRECISION) -> str:
+    '''
+    Encode a line as an encoded polyline, in one vectorized pass: the differences of the
+    rounded (lat, lon) of the consecutive points are zigzag encoded, then cut in chunks of 5
+    bits written as characters from "?".
+    INPUT:
+        - coordinates (array-like) : [lon, lat] of the points of the line.
+        - precision (int) (default: POLYLINE_PRECISION) : number of decimals kept.
+    '''
+    points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return ""
+    values = np.round(points[:, ::-1] * 10**precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1).astype(np.uint64)
+    # Chunks of 5 bits of each value, from the lowest, the last one has no continuation bit
+    shifts = np.arange(0, 64, 5, dtype=np.uint64)
+    chunks = (zigzag[:, None] >> shifts) & np.uint64(31)
+    sizes = np.maximum(1, (np.floor(np.log2(np.maximum(zigzag, 1).astype(np.float64)))
+                           .astype(np.int64) // 5) + 1)
+    sizes[zigzag == 0] = 1
+    positions = np.arange(len(shifts))
+    chunks = chunks + np.where(positions < sizes[:, None] - 1, 32, 0).astype(np.uint64) + 63
+    return chunks[positions < sizes[:, None]].astype(np.uint8).tobytes().decode("ascii")
+
+def decode(polyline:str, precision:int=POLYLINE_PRECISION) -> list:
+    '''
+    Return the [lon, lat] of the points of an encoded polyline (see encode).
+    '''
+    chars = np.frombuffer(polyline.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if len(chars) == 0:
+        return []
+    # Index of the value of each chunk, a value ends at a chunk without continuation bit
+    ends = (chars & 32) == 0
+    value_ids = np.concatenate(([0], np.cumsum(ends)[:-1]))
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    rank = np.arange(len(chars)) - starts[value_ids]
+    zigzag = np.bincount(value_ids, weights=(chars & 31) << (5 * rank)).astype(np.int64)
+    deltas = np.where(zigzag & 1, ~(zigzag >> 1), zigzag >> 1)
+    values = np.cumsum(deltas.reshape(-1, 2), axis=0) / 10**precision
+    return values[:, ::-1].tolist()
+
+
+def check_format(route_format:str, zoom) -> tuple:
+    '''
+    Check the format and the zoom of the geometry of a route requested and return them.
+    Raise an UnknownFormatError if the format does not exist or the zoom is invalid.
+    '''
+    if route_format not in ROUTE_FORMATS:
+        raise UnknownFormatError(f"Format inconnu : {route_format}"
+                                 f" (disponibles : {', '.join(ROUTE_FORMATS)}).")
+    if zoom is not None:
+        try:
+            zoom = float(zoom)
+        except (TypeError, ValueError):
+            raise UnknownFormatError(f"Zoom invalide : {zoom}.") from None
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise UnknownFormatError(f"Zoom invalide : {zoom} (de 0 à {MAX_ZOOM}).")
+    return route_format, zoom
+
+def compact_route(route:dict, route_format:str="coordinates", zoom:float=None) -> dict:
+    '''
+    Return the response of a route (see routing.get_routing) with a compact geometry, for
+    it and its alternatives: the points are simplified at the scale of the zoom of the map
+    (the points of the elevation profile too), and given as an encoded polyline.
+    INPUT:
+        - route (dict) : the response of the route, not modified.
+        - route_format (str) (default: "coordinates") : format of the geometry (see
+                                                        ROUTE_FORMATS and check_format).
+        - zoom (float) (default: None) : zoom of the map, None to keep all the points.
+    '''
+    if route_format == "coordinates" and zoom is None:
+        return route
+
+    def compact(part:dict) -> dict:
+        part = dict(part)
+        coordinates = part.pop("coordinates")
+        if zoom is not None and len(coordinates) > 2:
+            lat = float(np.mean([point[1] for point in coordinates]))
+            kept = simplify(coordinates, zoom_tolerance(zoom, lat)).tolist()
+            coordinates = [coordinates[i] for i in kept]
+            if part.get("elevation_profile"):
+                part["elevation_profile"] = [part["elevation_profile"][i] for i in kept]
+        if route_format == "polyline":
+            part["polyline"] = encode(coordinates)
+        else:
+            part["coordinates"] = coordinates
+        return part
+
+    route = compact(route)
+    if route.get("alternatives"):
+        route["alternatives"] = [compact(alternative) for alternative in route["alternatives"]]
+    return route
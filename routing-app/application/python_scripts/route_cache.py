@@ -0,0 +1,197 @@
+'''
+Script for the cache of the routes already computed
+'''
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+from threading import Lock
+
+# Default memory budget of the cache (bytes)
+DEFAULT_CACHE_BYTES = 64 * 1024**2
+
+# Estimated memory of a cached route: a fixed part plus one [lon, lat] list per point (bytes)
+ENTRY_OVERHEAD = 2048
+POINT_SIZE = 128
+
+
+def route_size(route:dict) -> int:
+    '''
+    Return the estimated memory used by a route kept in the cache (bytes), with its
+    alternatives.
+    '''
+    return ENTRY_OVERHEAD + POINT_SIZE * len(route.get("coordinates", ())) \
+        + sum(route_size(alternative) for alternative in route.get("alternatives", ()))
+
+
+class RouteCache:
+    '''
+    LRU cache of the responses of get_routing, with a memory budget.
+    The key of a route is (start, end, number of alternatives, weight profile, engine, graph
+    version, ETA model version), where start and end are the snapped points, so all the
+    requests snapped on the same nodes share the route.
+    The routes can also be written in a folder shared by the workers of the app: a route
+    missing in memory is then read from the disk before being computed.
+    '''
+    def __init__(self, max_bytes:int=DEFAULT_CACHE_BYTES, disk_dir:str=None):
+        '''
+        INPUT:
+            - max_bytes (int) (default: DEFAULT_CACHE_BYTES) : memory budget of the cache,
+                                                               0 disables the cache.
+            - disk_dir (str) (default: None) : folder of the shared cache on the disk.
+        '''
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.version = None
+        self._routes = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def sync_version(self, version:str):
+        '''
+        Empty the cache if the graph version has changed since the last request, so that a
+        reloaded graph or speed model never serves the routes of the previous one. The
+        folders of the other versions are removed from the disk cache.
+        '''
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            self._routes.clear()
+            self._bytes = 0
+            self.version = version
+        if self.disk_dir is not None:
+            try:
+                folders = os.listdir(self.disk_dir)
+            except OSError:
+                folders = []
+            for folder in folders:
+                if folder != str(version):
+                    shutil.rmtree(os.path.join(self.disk_dir, folder), ignore_errors=True)
+
+    def _path(self, key:tuple, version:str) -> str:
+        '''
+        Return the file of a key in the disk cache, in the folder of a graph version.
+        '''
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, str(version), name + ".json")
+
+    def get(self, key:tuple, version:str=None):
+        '''
+        Return the cached route of the key, None if it is not in the cache.
+        INPUT:
+            - key (tuple) : key of the route.
+            - version (str) (default: the version of the cache) : graph version of the
+                                                                  request.
+        '''
+        if self.max_bytes <= 0:
+            return None
+        with self._lock:
+            route = self._routes.get(key)
+            if route is not None:
+                self._routes.move_to_end(key)
+                self.hits += 1
+                return route
+        version = self.version if version is None else version
+        if self.disk_dir is not None:
+            try:
+                with open(self._path(key, version), encoding="utf-8") as file:
+                    route = json.load(file)
+            except (OSError, ValueError):
+                route = None
+            if route is not None:
+                self.disk_hits += 1
+                self.hits += 1
+                if version == self.version:
+                    self._store(key, route)
+                return route
+        self.misses += 1
+        return None
+
+    def put(self, key:tuple, route:dict, version:str=None):
+        '''
+        Add a route to the cache, evicting the least recently used routes if the memory
+        budget is exceeded. The route is written in the disk cache under the graph version
+        of the start of its computation: a route computed while the graph changed is never
+        read with the new version.
+        INPUT:
+            - key (tuple) : key of the route.
+            - route (dict) : the route.
+            - version (str) (default: the version of the cache) : graph version at the start
+                                                                  of the computation.
+        '''
+        if self.max_bytes <= 0:
+            return
+        version = self.version if version is None else version
+        if version == self.version:
+            self._store(key, route)
+        if self.disk_dir is not None:
+            path = self._path(key, version)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Written in a temporary file then renamed, the other workers never read half
+                # a file
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as file:
+                    json.dump(route, file)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+
+    def _store(self, key:tuple, route:dict):
+        '''
+        Keep a route in memory and evict the least recently used routes over the budget.
+        '''
+        size = route_size(route)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._routes:
+                self._bytes -= route_size(self._routes.pop(key))
+            self._routes[key] = route
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._routes.popitem(last=False)
+                self._bytes -= route_size(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        '''
+        Return the counters of the cache.
+        '''
+        return {"hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._routes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "version": self.version}
+
+
+_CACHE = RouteCache()
+
+def configure_cache(max_bytes:int=DEFAULT_CACHE_BYTES, disk_dir:str=None) -> RouteCache:
+    '''
+    Replace the route cache of the app by a new empty cache.
+    '''
+    global _CACHE
+    _CACHE = RouteCache(max_bytes, disk_dir)
+    return _CACHE
+
+def get_cache() -> RouteCache:
+    '''
+    Return the route cache of the app.
+    '''
+    return _CACHE
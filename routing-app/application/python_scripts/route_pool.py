@@ -0,0 +1,146 @@
+'''
+Script for the pool of threads computing the routes, out of the threads of the requests
+'''
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import Lock
+
+# Number of routes computed at the same time by a process of the app
+DEFAULT_WORKERS = 4
+
+# Number of routes waiting for a thread of the pool, the next requests are refused
+DEFAULT_MAX_QUEUE = 16
+
+# Time (s) after which a request stops waiting for its route
+DEFAULT_TIMEOUT = 20
+
+# Time (s) after which a refused request can be sent again (header Retry-After)
+RETRY_AFTER = 2
+
+
+class RouteUnavailableError(RuntimeError):
+    '''
+    Raised when a route can't be computed now (server overloaded), the request can be sent
+    again later.
+    '''
+
+
+class QueueFullError(RouteUnavailableError):
+    '''
+    Raised when the queue of the route pool is full.
+    '''
+
+
+class RouteTimeoutError(RouteUnavailableError):
+    '''
+    Raised when the route is not computed within the timeout of the pool.
+    '''
+
+
+class RoutePool:
+    '''
+    Bounded pool of threads computing the routes. At most workers routes are computed at
+    the same time and max_queue wait for a thread: the requests beyond are refused at once
+    instead of piling up. The identical computations in progress (same key) are coalesced:
+    the requests share the result of the first one.
+    '''
+    def __init__(self, workers:int=DEFAULT_WORKERS, max_queue:int=DEFAULT_MAX_QUEUE,
+                 timeout:float=DEFAULT_TIMEOUT):
+        '''
+        INPUT:
+            - workers (int) (default: DEFAULT_WORKERS) : number of threads of the pool.
+            - max_queue (int) (default: DEFAULT_MAX_QUEUE) : number of routes waiting for a
+                                                             thread.
+            - timeout (float) (default: DEFAULT_TIMEOUT) : time (s) a request waits for its
+                                                           route, None to wait without limit.
+        '''
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="route")
+        self._lock = Lock()
+        # Computations in progress by key, and number of computations not finished
+        self._in_flight = {}
+        self._pending = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def run(self, key, function, *args):
+        '''
+        Compute function(*args) in the pool and return its result, or the result of the
+        computation of the same key in progress. The errors of the computation are raised.
+        Raise a QueueFullError if the queue is full and a RouteTimeoutError after timeout
+        seconds (the computation goes on and its result is not kept).
+        INPUT:
+            - key (tuple) : key of the computation, None to never share it.
+            - function (function) : the computation.
+        '''
+        with self._lock:
+            future = self._in_flight.get(key) if key is not None else None
+            submitted = future is None
+            if not submitted:
+                self.coalesced += 1
+            elif self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError("Le serveur est surchargé, réessayez dans quelques"
+                                     " secondes.")
+            else:
+                self._pending += 1
+                self.submitted += 1
+                future = self._executor.submit(function, *args)
+                if key is not None:
+                    self._in_flight[key] = future
+        # Out of the lock: the callback runs at once if the computation is already finished
+        if submitted:
+            future.add_done_callback(lambda done: self._done(key, done))
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise RouteTimeoutError(f"Le calcul de l'itinéraire a dépassé {self.timeout} s,"
+                                    " réessayez dans quelques secondes.") from None
+
+    def _done(self, key, future):
+        '''
+        Forget a finished computation.
+        '''
+        with self._lock:
+            self._pending -= 1
+            if key is not None and self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def stats(self) -> dict:
+        '''
+        Return the size and the counters of the pool.
+        '''
+        with self._lock:
+            return {"workers": self.workers,
+                    "max_queue": self.max_queue,
+                    "timeout": self.timeout,
+                    "pending": self._pending,
+                    "in_flight": len(self._in_flight),
+                    "submitted": self.submitted,
+                    "coalesced": self.coalesced,
+                    "rejected": self.rejected,
+                    "timeouts": self.timeouts}
+
+
+_POOL = None
+
+def configure_pool(workers:int=DEFAULT_WORKERS, max_queue:int=DEFAULT_MAX_QUEUE,
+                   timeout:float=DEFAULT_TIMEOUT) -> RoutePool:
+    '''
+    Replace the route pool of the app by a new pool, no pool (the routes are computed in the
+    threads of the requests) with 0 workers.
+    '''
+    global _POOL
+    _POOL = RoutePool(workers, max_queue, timeout) if workers > 0 else None
+    return _POOL
+
+def get_pool() -> RoutePool:
+    '''
+    Return the route pool of the app, None if there is none.
+    '''
+    return _POOL
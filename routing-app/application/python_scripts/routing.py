@@ -4,110 +4,596 @@ Script for routing
 import warnings
 import math
 
-## for simple routing
-import osmnx as ox  #1.2.2
-import networkx as nx  #3.0
-
-## for data
-import pandas as pd  #1.1.5
-from time import time
+from time import time, perf_counter
+import numpy as np
 from haversine import haversine
 
+from . import graph_store, metrics, route_cache, route_pool
+from .search import ENGINES, NoRouteError, astar, bidirectional_astar, min_bound, seeds
+from .spatial_index import SNAP_MODES
+from .contraction import ch_query
+from .matrix import check_matrix_size, one_to_many, travel_time_matrix
+from .edge_store import UNKNOWN_STREET
+from .elevation import elevation_profile
+from .eta_model import get_eta_model
+from .alternatives import MAX_ALTERNATIVES, alternative_routes
+from .isochrone import MAX_ISOCHRONE_MINUTES, IsochroneError, isochrone
+from .weights import DEFAULT_PROFILE, UnknownProfileError
+
 warnings.filterwarnings("ignore")
 
+# Relative tolerance of the costs of the hierarchy customized with the overrides compared with
+# the costs of the hierarchy without override (float32 sums of the same weights)
+CH_TOLERANCE = 1e-6
+
 
-def middle(start, end):
+class UnknownEngineError(ValueError):
     '''
-    Return the middle point between two points.
+    Raised when the requested routing engine does not exist or is not available.
     '''
-    return [(start[0]+end[0])/2, (start[1]+end[1])/2]
 
-def size_window(start, end):
+
+class UnknownSnapModeError(ValueError):
     '''
-    Return the size of the window to get the graph.
+    Raised when the requested way to snap the points on the graph does not exist.
     '''
-    height_lat = haversine(start, (start[0], end[1]), "m")
-    width_lon = haversine(start, (end[0], start[1]), "m")
-    return max(height_lat, width_lon) + 500
 
-def get_full_route(G, path_length):
+
+class InvalidAlternativesError(ValueError):
     '''
-    Return the list of coordinates of the route.
+    Raised when the requested number of alternative routes is not an integer.
     '''
-    # Get the edges of the route
-    edges = ox.graph_to_gdfs(G, nodes=False, edges=True)
-    # Get the coordinates of the route and the length
-    coordinates = []
-    length = 0
-    estimated_time = 0
-    for i in range(len(path_length)-1):
-        edge = edges.loc[path_length[i], path_length[i+1]]
-        list_edge_coords = list(edge["geometry"].apply(lambda row: list(row.coords)))[0][:-1]
-        coordinates.extend(list_edge_coords)
-        length += edge["length"]
 
-        # Convert the edge to calculate the time (weight)
-        edge_for_weight = [{key: value[0] for key, value in edge.to_dict().items()}]
-        estimated_time += custom_weight(path_length[i], path_length[i+1], edge_for_weight)
 
-    # Add the last point
-    coordinates.append(list(edge["geometry"].apply(lambda row: list(row.coords)))[0][-1])
-    
-    # Get the names of the streets
-    start_street = edges.loc[path_length[0], path_length[1]]["name"][0]
-    end_street = edges.loc[path_length[-2], path_length[-1]]["name"][0]
-    # Check if the street is not nan
-    if isinstance(start_street, float) and math.isnan(start_street):
-        start_street = "Rue inconnue"
-    if isinstance(end_street, float) and math.isnan(end_street):
-        end_street = "Rue inconnue"
+def hierarchy_available(store, profile:str=DEFAULT_PROFILE) -> bool:
+    '''
+    Return True if the contraction hierarchy can be used: it is built on the weights of the
+    default profile.
+    '''
+    return store.ch is not None and profile == DEFAULT_PROFILE
 
-    # Check if the estimated time is infinity
-    if math.isinf(estimated_time):
-        estimated_time = -1
+def available_engines(store, profile:str=DEFAULT_PROFILE) -> list:
+    '''
+    Return the names of the routing engines available with the graph store for a weight
+    profile (see hierarchy_available for the contraction hierarchy).
+    '''
+    return list(ENGINES) + (["alt"] if profile in store.landmarks else []) \
+        + (["ch"] if hierarchy_available(store, profile) else [])
 
-    return coordinates, int(length), start_street, end_street, estimated_time
+def default_engine(store, profile:str=DEFAULT_PROFILE) -> str:
+    '''
+    Return the fastest engine available: "ch" if the hierarchy can be used, else "dijkstra".
+    '''
+    return "ch" if hierarchy_available(store, profile) else "dijkstra"
 
-def custom_weight(u, v, data):
+def _ch_path(store, graph, source, target):
     '''
-    Return the weight of the edge.
+    Return the shortest path of the contraction hierarchy (see shortest_path).
+    While overrides are active, the path of the customized hierarchy is kept if its cost is
+    not above the cost of the hierarchy without override: the overrides only increase the
+    weights, so this cost is a lower bound. The other paths, through the edges of the
+    overrides, are searched with bidirectional A* (see contraction.customize).
     '''
-    if data[0]["highway"] in ["busway", "motorway", "trunk",
-                              "motorway_link", "trunk_link"]:
-        return float('inf')
+    if store.overridden_ch is None:
+        return ch_query(store.ch, graph, source, target)
+    # No route without the overrides means no route with them
+    _, _, lower, settled = ch_query(store.ch, graph, source, target)
+    try:
+        nodes, edges, cost, found = ch_query(store.overridden_ch, graph, source, target)
+        if cost <= lower * (1 + CH_TOLERANCE):
+            return nodes, edges, cost, settled + found
+        settled += found
+    except NoRouteError:
+        pass
+    nodes, edges, cost, found = bidirectional_astar(graph, source, target)
+    return nodes, edges, cost, settled + found
 
-    return data[0]["length"] / (min(data[0]["speed_kph"], 15) / 3.6)
+def shortest_path(store, source:int, target:int, engine:str=None,
+                  profile:str=DEFAULT_PROFILE):
+    '''
+    Return the shortest path between two nodes of the graph with the chosen engine, on the
+    weights of a profile.
+    INPUT:
+        - store (GraphStore) : the graph store.
+        - source (int or list) : index of the start node, or its seeds (see search.seeds).
+        - target (int or list) : index of the end node, or its seeds (see search.seeds).
+        - engine (str) (default: default_engine(store)) : name of the engine
+          ("dijkstra", "astar", "bidir-astar", "alt" or "ch").
+        - profile (str) (default: DEFAULT_PROFILE) : name of the weight profile.
+    OUTPUT:
+        - nodes (list) : indexes of the nodes of the path.
+        - edges (list) : ids of the edges of the path.
+        - cost (float) : cost of the path.
+        - settled (int) : number of nodes settled by the search.
+    '''
+    graph = store.profile_graph(profile)
+    if engine is None:
+        engine = default_engine(store, profile)
+    if engine == "ch" and hierarchy_available(store, profile):
+        return _ch_path(store, graph, source, target)
+    if engine == "alt" and profile in store.landmarks:
+        return astar(graph, source, target,
+                     potential=min_bound(store.landmarks[profile].bound_to, seeds(target)))
+    if engine not in ENGINES:
+        raise UnknownEngineError(f"Moteur de routage inconnu : {engine} (disponibles :"
+                                 f" {', '.join(available_engines(store, profile))}).")
+    return ENGINES[engine](graph, source, target)
 
 
-def get_routing(start, end):
+def get_profiles() -> dict:
     '''
-    Handle the routing.
+    Return the weight profiles available, with their routing engines.
+    '''
+    tiles = graph_store.get_tiles()
+    if tiles is not None:
+        return {DEFAULT_PROFILE: {"engines": ["tiles"], "default": True}}
+    store = graph_store.get_store()
+    return {profile: {"engines": available_engines(store, profile),
+                      "default": profile == DEFAULT_PROFILE} for profile in store.profiles}
+
+def get_landmarks() -> dict:
+    '''
+    Return the landmarks of the ALT engine of each weight profile.
+    '''
+    graph = graph_store.get_store().graph
+    return {profile: [{"node": int(graph.node_ids[node]),
+                       "lat": float(graph.lat[node]),
+                       "lon": float(graph.lon[node])} for node in landmarks.nodes.tolist()]
+            for profile, landmarks in graph_store.get_store().landmarks.items()}
+
+def compare_engines(store, pairs:list, engines:list=None) -> dict:
+    '''
+    Run every engine on the same origin-destination pairs and compare the search spaces.
+    INPUT:
+        - store (GraphStore) : the graph store.
+        - pairs (list) : list of (source, target) indexes of nodes.
+        - engines (list) (default: available_engines(store)) : names of the engines.
+    OUTPUT:
+        - stats (dict) : for each engine, the mean number of settled nodes, the mean time (s)
+                         and the number of routes costlier than the Dijkstra ones.
+    '''
+    if engines is None:
+        engines = available_engines(store)
+    stats = {engine: {"settled_nodes": 0., "time": 0., "worse_routes": 0} for engine in engines}
+    n_routes = 0
+    for source, target in pairs:
+        try:
+            reference = ENGINES["dijkstra"](store.graph, source, target)[2]
+        except NoRouteError:
+            continue
+        n_routes += 1
+        for engine in engines:
+            dbt = time()
+            _, _, cost, settled = shortest_path(store, source, target, engine)
+            stats[engine]["time"] += time()-dbt
+            stats[engine]["settled_nodes"] += settled
+            stats[engine]["worse_routes"] += not math.isclose(cost, reference, rel_tol=1e-4)
+    # Means over the pairs linked by a route
+    for values in stats.values():
+        values["time"] /= max(n_routes, 1)
+        values["settled_nodes"] /= max(n_routes, 1)
+    return stats
+
+def _cache_point(snapped) -> tuple:
+    '''
+    Return the part of the cache key of a snapped point: its node, or its edge and its
+    position along the edge (to the millionth) when it is snapped on an edge.
+    '''
+    if snapped.edge < 0:
+        return (snapped.seeds[0][0],)
+    return (snapped.edge, round(snapped.fraction, 6))
+
+def _add_snapped_points(coordinates:list, length:int, snapped_start, snapped_end) -> tuple:
+    '''
+    Return the coordinates and the length of a route starting and ending at the projections
+    of the points on their edges.
+    '''
+    if coordinates:
+        length += int(haversine(snapped_start.point, coordinates[0][::-1], "m")
+                      + haversine(coordinates[-1][::-1], snapped_end.point, "m"))
+    else:
+        length += int(haversine(snapped_start.point, snapped_end.point, "m"))
+    return [snapped_start.point[::-1]] + coordinates + [snapped_end.point[::-1]], length
+
+def _elevation(store, coordinates:list, edges:list, node:int, snapped_start, snapped_end,
+               snap:str) -> tuple:
+    '''
+    Return the elevation profile (see elevation.elevation_profile) and the total climb (m) of
+    a route, from the elevations of the points of the edges precomputed in the edge store,
+    None if the graph has no elevation.
+    INPUT:
+        - coordinates (list) : [lon, lat] of the points of the route.
+        - edges (list) : ids of the edges of the route, empty if it has none.
+        - node (int) : index of the only node of a route without edge, else None.
+        - snapped_start, snapped_end (SnappedPoint) : the start and the end of the route.
+        - snap (str) : "edge" if the route starts and ends at the snapped points.
+    '''
+    edge_store = store.edges
+    if edge_store.coord_elevations is None or edge_store.climbs is None:
+        return None, None
+    climb = 0.
+    elevations = []
+    if edges:
+        elevations, climb = edge_store.route_elevations(edges)
+        elevations = elevations.tolist()
+    elif node is not None:
+        # Elevation of the node from the first point of one of its edges
+        graph = store.graph
+        start = int(graph.offsets[node])
+        elevations = [float(edge_store.coord_elevations[edge_store.coord_offsets[start]])
+                      if start < int(graph.offsets[node+1]) else float('nan')]
+    if snap == "edge":
+        start = edge_store.point_elevation(snapped_start.edge, snapped_start.fraction)
+        end = edge_store.point_elevation(snapped_end.edge, snapped_end.fraction)
+        elevations = [start] + elevations + [end]
+        # Parts of the edges between the snapped points and the route
+        for i in sorted({0, len(elevations) - 2}):
+            rise = elevations[i+1] - elevations[i]
+            if rise > 0:
+                climb += rise
+    return elevation_profile(coordinates, elevations), round(climb, 1)
+
+def _eta(store, edges:list, estimated_time:float) -> float:
+    '''
+    Return the travel time of the edges of a path predicted by the ETA model from their
+    features (see eta_model), or estimated_time, the sum of their travel times, without model.
+    '''
+    model = get_eta_model()
+    if model is None or estimated_time < 0:
+        return estimated_time
+    with metrics.get_metrics().timer("routing_stage_seconds", endpoint="route", stage="eta"):
+        return model.predict(*store.edges.route_features(edges))
+
+def _end_time(store, snapped, node:int, is_start:bool) -> float:
+    '''
+    Return the travel time (s) between a snapped point and the node of the route next to it,
+    the first node for the start and the last one for the end, with the weights of
+    DEFAULT_PROFILE whatever the weight profile of the search.
+    '''
+    if snapped.edge < 0:
+        return 0.
+    return dict(store.index.virtual_node(snapped.edge, snapped.fraction, is_start))[node]
+
+def _alternative(store, nodes:list, edges:list, overlap:float, snapped_start, snapped_end,
+                 snap:str) -> dict:
     '''
-    dbt = time()
-    print(size_window(start, end))
-    G = ox.graph_from_point(middle(start, end), dist=size_window(start, end), network_type="bike", simplify=False)  #'drive', 'bike', 'walk'
-    dbt, delay = time(), time()-dbt
-    print("Temps de récupération du graphe : ", delay)
-    G = ox.add_edge_speeds(G)
-    dbt, delay = time(), time()-dbt
-    print("Temps d'ajout des vitesses : ", delay)
-
-    # find the nearest node to the start/end location
-    start_node = ox.distance.nearest_nodes(G, start[1], start[0])
-    end_node = ox.distance.nearest_nodes(G, end[1], end[0])
-    dbt, delay = time(), time()-dbt
-    print("Temps de recherche des noeuds les plus proches : ", delay)
-
-    path_length = nx.shortest_path(G, source=start_node, target=end_node, method='dijkstra', weight=custom_weight)
-    dbt, delay = time(), time()-dbt
-    print("Temps de calcul du chemin : ", delay)
-
-    coordinates, length, start_street, end_street, estimated_time = get_full_route(G, path_length)
-    dbt, delay = time(), time()-dbt
-    print("Temps de récupération du chemin complet : ", delay)
-    
+    Return the response of an alternative route, with the part of the best route it shares.
+    '''
+    coordinates, length, start_street, end_street, estimated_time = \
+        store.edges.route(edges, store.graph.weights)
+    estimated_time = _eta(store, edges, estimated_time)
+    estimated_time += _end_time(store, snapped_start, nodes[0], True) \
+        + _end_time(store, snapped_end, nodes[-1], False)
+    if snap == "edge":
+        coordinates, length = _add_snapped_points(coordinates, length, snapped_start,
+                                                  snapped_end)
+    elevations, climb = _elevation(store, coordinates, edges, None, snapped_start,
+                                   snapped_end, snap)
     return {"coordinates":coordinates,
             "length":length,
             "start_street":start_street,
             "end_street": end_street,
-            "estimated_time": estimated_time}
\ No newline at end of file
+            "estimated_time": estimated_time,
+            "elevation_profile": elevations,
+            "total_climb": climb,
+            "overlap": round(overlap, 3)}
+
+def get_routing(start, end, engine=None, snap="node", alternatives=0, time_budget=None,
+                profile=None):
+    '''
+    Handle the routing.
+    The weight profile (see weights.PROFILES, DEFAULT_PROFILE by default) and the engine of
+    the search can be chosen (see shortest_path). The start and the end are
+    snapped on their nearest node, or on their nearest edge with snap="edge": the route then
+    starts and ends at the projection of the points on the edges.
+    Up to MAX_ALTERNATIVES alternative routes can be asked (see alternative_routes), they are
+    searched until time_budget seconds after the start of the request.
+    With an ETA model (see eta_model), the estimated time of the routes is its prediction
+    from the features of their edges instead of the cost of the search.
+    '''
+    if snap not in SNAP_MODES:
+        raise UnknownSnapModeError(f"Mode d'accroche inconnu : {snap}"
+                                   f" (disponibles : {', '.join(SNAP_MODES)}).")
+    try:
+        alternatives = max(0, min(int(alternatives or 0), MAX_ALTERNATIVES))
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidAlternativesError(f"Nombre d'itinéraires alternatifs invalide :"
+                                       f" {alternatives}.") from None
+    profile = profile or DEFAULT_PROFILE
+    if graph_store.get_tiles() is not None:
+        if profile != DEFAULT_PROFILE:
+            raise UnknownProfileError(f"Le profil {profile} n'est pas disponible avec le graphe"
+                                      " découpé en tuiles.")
+        return _dispatch(None, get_tiled_routing, start, end, snap)
+    deadline = time() + time_budget if time_budget is not None else None
+    # The graph is built once at the start of the app and kept in memory, the request reads
+    # the weights of one snapshot even if the overrides change them meanwhile
+    store = graph_store.get_store().snapshot()
+    # The unknown profiles are refused before the snapping
+    store.profile_graph(profile)
+    if engine is None:
+        engine = default_engine(store, profile)
+    # The unknown engines are refused before the cache, which keeps the routes by engine
+    if engine not in available_engines(store, profile):
+        raise UnknownEngineError(f"Moteur de routage inconnu : {engine} (disponibles :"
+                                 f" {', '.join(available_engines(store, profile))}).")
+
+    # find the nearest node (or edge) to the start/end location
+    stats = metrics.get_metrics()
+    with stats.timer("routing_stage_seconds", endpoint="route", stage="snap"):
+        snapped_start, snapped_end = store.snap(start, end, snap, profile)
+
+    # The routes already computed on the same snapped points are taken from the cache
+    # The version of the start of the request, the weights can change during the computation
+    version = store.version
+    cache = route_cache.get_cache()
+    cache.sync_version(version)
+    model = get_eta_model()
+    key = (_cache_point(snapped_start), _cache_point(snapped_end), alternatives, profile,
+           engine, version, model.version if model is not None else None)
+    route = cache.get(key, version)
+    stats.inc("routing_cache_requests_total", result="miss" if route is None else "hit")
+    if route is not None:
+        return dict(route, cached=True)
+
+    # The route is computed once for all the identical requests in progress
+    route = _dispatch(key, _compute_route, store, key, version, engine, snap, snapped_start,
+                      snapped_end, alternatives, deadline, profile)
+    return dict(route, cached=False)
+
+def _dispatch(key, function, *args):
+    '''
+    Run the computation of a route in the route pool of the app (see route_pool), shared with
+    the computation in progress of the same key, or in the request without pool. The
+    computation is profiled when it is sampled (see metrics.Metrics.profiled).
+    '''
+    profiled = metrics.get_metrics().profiled
+    pool = route_pool.get_pool()
+    if pool is None:
+        return profiled(function, *args)
+    return pool.run(key, profiled, function, *args)
+
+def _compute_route(store, key:tuple, version:str, engine:str, snap:str, snapped_start,
+                   snapped_end, alternatives:int, deadline:float, profile:str) -> dict:
+    '''
+    Compute the route between the snapped points (see get_routing) and keep it in the route
+    cache, under the graph version of the request.
+    '''
+    stats = metrics.get_metrics()
+    dbt = perf_counter()
+    graph = store.profile_graph(profile)
+    # Start and end on the same edge, in its direction
+    direct_cost = store.profile_index(profile).direct_cost(snapped_start, snapped_end)
+    try:
+        path, path_edges, cost, settled = shortest_path(store, snapped_start.seeds,
+                                                        snapped_end.seeds, engine, profile)
+    except NoRouteError:
+        if math.isinf(direct_cost):
+            raise
+        path, path_edges, cost, settled = None, None, float('inf'), 0
+    dbt, delay = perf_counter(), perf_counter()-dbt
+    stats.observe("routing_stage_seconds", delay, endpoint="route", stage="search")
+    stats.observe("routing_settled_nodes", settled, engine=engine)
+
+    # The weights of the profile only choose the route, its estimated time is the travel time
+    # with the weights of DEFAULT_PROFILE
+    route_edges, route_node = [], None
+    if direct_cost <= cost:
+        coordinates = []
+        length, estimated_time = 0, store.index.direct_cost(snapped_start, snapped_end)
+        start_street = end_street = store.edges.street_name(snapped_start.edge)
+    elif len(path) == 1:
+        coordinates = [[float(graph.lon[path[0]]), float(graph.lat[path[0]])]]
+        length = 0
+        estimated_time = _end_time(store, snapped_start, path[0], True) \
+            + _end_time(store, snapped_end, path[0], False)
+        start_street = end_street = UNKNOWN_STREET
+        route_node = path[0]
+    else:
+        # Vectorized gather of the geometry and the attributes of the edges of the path
+        coordinates, length, start_street, end_street, estimated_time = \
+            store.edges.route(path_edges, store.graph.weights)
+        estimated_time = _eta(store, path_edges, estimated_time)
+        # Parts of the edges between the virtual nodes and the path
+        estimated_time += _end_time(store, snapped_start, path[0], True) \
+            + _end_time(store, snapped_end, path[-1], False)
+        route_edges = path_edges
+
+    if snap == "edge":
+        # The route starts and ends at the projections of the points
+        coordinates, length = _add_snapped_points(coordinates, length, snapped_start,
+                                                  snapped_end)
+    elevations, climb = _elevation(store, coordinates, route_edges, route_node, snapped_start,
+                                   snapped_end, snap)
+    # The time of the ETA model (stage "eta") is part of the assembly
+    dbt, delay = perf_counter(), perf_counter()-dbt
+    stats.observe("routing_stage_seconds", delay, endpoint="route", stage="assemble")
+
+    # Alternatives from the forward and backward trees of the start and the end
+    routes = []
+    if alternatives and path_edges and direct_cost > cost:
+        routes = [_alternative(store, nodes, edges, overlap, snapped_start, snapped_end, snap)
+                  for nodes, edges, _, overlap in alternative_routes(
+                      graph, snapped_start.seeds, snapped_end.seeds, path_edges, cost,
+                      store.edges.lengths, alternatives, deadline)]
+        stats.observe("routing_stage_seconds", perf_counter()-dbt, endpoint="route",
+                      stage="alternatives")
+
+    route = {"coordinates":coordinates,
+             "length":length,
+             "start_street":start_street,
+             "end_street": end_street,
+             "estimated_time": estimated_time,
+             "elevation_profile": elevations,
+             "total_climb": climb,
+             "engine": engine,
+             "profile": profile,
+             "settled_nodes": settled,
+             "alternatives": routes}
+    route_cache.get_cache().put(key, route, version)
+    return route
+
+
+def get_tiled_routing(start, end, snap="node"):
+    '''
+    Handle the routing on the tiled graph (see tiles.TiledGraph), with the snapping and the
+    cache of get_routing. The tiles of the start and the end are loaded if needed, the route
+    is searched on them and on the overlay of the other tiles, without alternatives.
+    '''
+    stats = metrics.get_metrics()
+    dbt = perf_counter()
+    tiles = graph_store.get_tiles()
+    graph_store.check_point(start, "Le point de départ")
+    graph_store.check_point(end, "Le point d'arrivée")
+    if not tiles.tiles_near(start):
+        raise graph_store.OutOfGraphError("Le point de départ est en dehors de la zone couverte.")
+    if not tiles.tiles_near(end):
+        raise graph_store.OutOfGraphError("Le point d'arrivée est en dehors de la zone couverte.")
+    snapped_start, snapped_end = tiles.snap([start, end], snap, [True, False])
+    if snapped_start is None:
+        raise graph_store.OutOfGraphError("Le point de départ est trop loin du réseau cyclable.")
+    if snapped_end is None:
+        raise graph_store.OutOfGraphError("Le point d'arrivée est trop loin du réseau cyclable.")
+    dbt, delay = perf_counter(), perf_counter()-dbt
+    stats.observe("routing_stage_seconds", delay, endpoint="tiles", stage="snap")
+
+    version = tiles.version
+    cache = route_cache.get_cache()
+    cache.sync_version(version)
+    key = (_cache_point(snapped_start), _cache_point(snapped_end), 0, DEFAULT_PROFILE, version)
+    route = cache.get(key, version)
+    stats.inc("routing_cache_requests_total", result="miss" if route is None else "hit")
+    if route is not None:
+        return dict(route, cached=True)
+
+    direct_cost = tiles.direct_cost(snapped_start, snapped_end)
+    try:
+        path, path_edges, cost, settled = tiles.shortest_path(snapped_start.seeds,
+                                                              snapped_end.seeds)
+    except NoRouteError:
+        if math.isinf(direct_cost):
+            raise
+        path, path_edges, cost, settled = None, None, float('inf'), 0
+    dbt, delay = perf_counter(), perf_counter()-dbt
+    stats.observe("routing_stage_seconds", delay, endpoint="tiles", stage="search")
+    stats.observe("routing_settled_nodes", settled, engine="tiles")
+
+    if direct_cost <= cost:
+        coordinates = []
+        length, estimated_time = 0, direct_cost
+        start_street = end_street = tiles.street_name(snapped_start.edge)
+    elif len(path) == 1:
+        coordinates = [tiles.node_point(path[0])[::-1]]
+        length, estimated_time = 0, cost
+        start_street = end_street = UNKNOWN_STREET
+    else:
+        coordinates, length, start_street, end_street, estimated_time = \
+            tiles.route(path_edges)
+        estimated_time += dict(snapped_start.seeds)[path[0]] + dict(snapped_end.seeds)[path[-1]]
+    if snap == "edge":
+        coordinates, length = _add_snapped_points(coordinates, length, snapped_start,
+                                                  snapped_end)
+    stats.observe("routing_stage_seconds", perf_counter()-dbt, endpoint="tiles",
+                  stage="assemble")
+
+    route = {"coordinates":coordinates,
+             "length":length,
+             "start_street":start_street,
+             "end_street": end_street,
+             "estimated_time": estimated_time,
+             "elevation_profile": None,
+             "total_climb": None,
+             "engine": "tiles",
+             "profile": DEFAULT_PROFILE,
+             "settled_nodes": settled,
+             "alternatives": []}
+    cache.put(key, route, version)
+    return dict(route, cached=False)
+
+
+def matrix(origins:list, destinations:list, snap:str="node") -> np.ndarray:
+    '''
+    Return the matrix of the travel times between origins and destinations.
+    All the points are snapped in one batch, then the matrix is computed with the buckets of
+    the contraction hierarchy if it is loaded, else with one one-to-many search per origin.
+    INPUT:
+        - origins (list) : (lat, lon) of the origins.
+        - destinations (list) : (lat, lon) of the destinations.
+        - snap (str) (default: "node") : snap the points on the nearest "node" or "edge".
+    OUTPUT:
+        - durations (np.ndarray) : float32 matrix of the travel times (s), of shape
+                                   (len(origins), len(destinations)), inf if unreachable.
+    '''
+    stats = metrics.get_metrics()
+    dbt = perf_counter()
+    store = graph_store.get_store().snapshot()
+    if snap not in SNAP_MODES:
+        raise UnknownSnapModeError(f"Mode d'accroche inconnu : {snap}"
+                                   f" (disponibles : {', '.join(SNAP_MODES)}).")
+    check_matrix_size(len(origins), len(destinations))
+    snapped_origins = store.snap_many(origins, snap, is_start=True)
+    snapped_destinations = store.snap_many(destinations, snap, is_start=False)
+    dbt, delay = perf_counter(), perf_counter()-dbt
+    stats.observe("routing_stage_seconds", delay, endpoint="matrix", stage="snap")
+
+    sources = [point.seeds for point in snapped_origins]
+    targets = [point.seeds for point in snapped_destinations]
+    if store.overridden_ch is None:
+        durations = travel_time_matrix(store.graph, sources, targets, store.ch)
+    else:
+        # The rows above the costs of the hierarchy without override are computed again on
+        # the graph (see _ch_path)
+        durations = travel_time_matrix(store.graph, sources, targets, store.overridden_ch)
+        lower = travel_time_matrix(store.graph, sources, targets, store.ch)
+        for i in np.flatnonzero(np.any(durations > lower * (1 + CH_TOLERANCE), axis=1)).tolist():
+            durations[i] = one_to_many(store.graph, sources[i], targets)
+    if snap == "edge":
+        # Origins and destinations on the same segment can be linked directly
+        segments = {}
+        for j, point in enumerate(snapped_destinations):
+            edge = point.edge
+            segment = frozenset((store.graph.edge_source(edge), int(store.graph.targets[edge])))
+            segments.setdefault(segment, []).append(j)
+        for i, point in enumerate(snapped_origins):
+            edge = point.edge
+            segment = frozenset((store.graph.edge_source(edge), int(store.graph.targets[edge])))
+            for j in segments.get(segment, ()):
+                durations[i, j] = min(durations[i, j],
+                                      store.index.direct_cost(point, snapped_destinations[j]))
+    stats.observe("routing_stage_seconds", perf_counter()-dbt, endpoint="matrix",
+                  stage="search")
+    return durations
+
+
+def get_isochrone(point:list, minutes:float, snap:str="node") -> dict:
+    '''
+    Return the area reachable by bike from a point within a travel time, as a GeoJSON
+    feature, with the graph and the snapping of get_routing.
+    INPUT:
+        - point (list) : (lat, lon) of the start.
+        - minutes (float) : travel time (min).
+        - snap (str) (default: "node") : snap the point on the nearest "node" or "edge".
+    OUTPUT:
+        - feature (dict) : GeoJSON feature of the reachable area.
+    '''
+    store = graph_store.get_store().snapshot()
+    if snap not in SNAP_MODES:
+        raise UnknownSnapModeError(f"Mode d'accroche inconnu : {snap}"
+                                   f" (disponibles : {', '.join(SNAP_MODES)}).")
+    try:
+        minutes = float(minutes)
+    except (TypeError, ValueError):
+        raise IsochroneError(f"Durée invalide : {minutes}.") from None
+    if not 0 < minutes <= MAX_ISOCHRONE_MINUTES:
+        raise IsochroneError(f"La durée doit être comprise entre 0 et {MAX_ISOCHRONE_MINUTES}"
+                             " minutes.")
+
+    stats = metrics.get_metrics()
+    with stats.timer("routing_stage_seconds", endpoint="isochrone", stage="snap"):
+        snapped = store.snap_many([point], snap)[0]
+    with stats.timer("routing_stage_seconds", endpoint="isochrone", stage="search"):
+        polygon, n_nodes = isochrone(store.index, snapped.seeds, 60 * minutes)
+    stats.observe("routing_settled_nodes", n_nodes, engine="isochrone")
+    return {"type": "Feature",
+            "geometry": polygon,
+            "properties": {"minutes": minutes, "reachable_nodes": n_nodes}}
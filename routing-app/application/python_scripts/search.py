@@ -0,0 +1,310 @@
+'''
+Script for the shortest path searches on the CSR graph
+'''
+import math
+from heapq import heappush, heappop
+from time import time
+
+# Radius of the Earth (m) of the great-circle bound. The lengths of the edges are great-circle
+# distances on a sphere of 6371009 m (osmnx and osm_import), so the bound computed with a radius
+# not larger than this one never exceeds the length of a path
+EARTH_RADIUS = 6371000
+# Margin on the heuristic against the rounding of the lengths and weights (float32), which is
+# what keeps the bound admissible on the weights stored in the graph
+HEURISTIC_MARGIN = 0.999
+
+
+class NoRouteError(ValueError):
+    '''
+    Raised when there is no route between the start and the end.
+    '''
+
+
+def seeds(node) -> list:
+    '''
+    Return the list of (node, initial cost) of a start or an end of a search.
+    The start (resp. end) of a search is either the index of a node or a list of
+    (node, cost) when it is a virtual node on an edge: the cost is then the cost from the
+    virtual node to the node (resp. from the node to the virtual node).
+    '''
+    if isinstance(node, (list, tuple)):
+        return [(int(v), float(cost)) for v, cost in node]
+    return [(int(node), 0.)]
+
+
+def min_bound(bound, ends:list):
+    '''
+    Return the lower bound of the cost to the closest of several ends.
+    INPUT:
+        - bound (function) : function giving, for an end node, the lower bound to this node.
+        - ends (list) : list of (node, cost) of the ends.
+    '''
+    bounds = [(bound(node), cost) for node, cost in ends]
+    if len(bounds) == 1 and bounds[0][1] == 0.:
+        return bounds[0][0]
+    return lambda v: min(b(v) + cost for b, cost in bounds)
+
+
+def _build_path(pred:dict, target:int):
+    '''
+    Return the nodes and the edges of the path ending at target, up to the node of the
+    start of the search (the node without predecessor).
+    INPUT:
+        - pred (dict) : (previous node, edge) used to reach each node.
+        - target (int) : index of the end node.
+    OUTPUT:
+        - nodes (list) : indexes of the nodes of the path.
+        - edges (list) : positions in the CSR arrays of the edges of the path.
+    '''
+    nodes, edges = [target], []
+    node = target
+    while node in pred:
+        node, edge = pred[node]
+        edges.append(edge)
+        nodes.append(node)
+    nodes.reverse()
+    edges.reverse()
+    return nodes, edges
+
+
+def travel_time_bound(graph, target:int, max_speed_kph:float=None):
+    '''
+    Return a function giving a lower bound of the travel time between a node and target:
+    the haversine distance divided by the maximum speed of the cyclist.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - target (int) : index of the reference node.
+        - max_speed_kph (float) (default: None) : maximum speed (km/h), the one of the
+                                                  weights of the graph by default.
+    OUTPUT:
+        - bound (function) : function of the index of a node.
+    '''
+    if max_speed_kph is None:
+        max_speed_kph = graph.max_speed_kph
+    lat, lon = memoryview(graph.lat), memoryview(graph.lon)
+    lat_t, lon_t = math.radians(lat[target]), math.radians(lon[target])
+    cos_t = math.cos(lat_t)
+    factor = HEURISTIC_MARGIN * 2 * EARTH_RADIUS / (max_speed_kph / 3.6)
+
+    def bound(v:int) -> float:
+        lat_v, lon_v = math.radians(lat[v]), math.radians(lon[v])
+        a = math.sin((lat_v - lat_t) / 2)**2 \
+            + math.cos(lat_v) * cos_t * math.sin((lon_v - lon_t) / 2)**2
+        return factor * math.asin(math.sqrt(a))
+    return bound
+
+
+def dijkstra(graph, source, target):
+    '''
+    Heap-based Dijkstra from source to target on the CSR graph.
+    The search stops as soon as no better path to target can be found.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - source (int or list) : index of the start node, or its seeds (see seeds).
+        - target (int or list) : index of the end node, or its seeds (see seeds).
+    OUTPUT:
+        - nodes (list) : indexes of the nodes of the path.
+        - edges (list) : ids of the edges of the path.
+        - cost (float) : cost of the path.
+        - settled (int) : number of nodes settled by the search.
+    '''
+    # Indexing memoryviews gives Python numbers, much faster than indexing NumPy scalars
+    offsets, targets, weights = graph.views()
+    inf = float('inf')
+    ends = dict(seeds(target))
+    dist, pred, settled, heap = {}, {}, set(), []
+    for node, cost in seeds(source):
+        if cost < dist.get(node, inf):
+            dist[node] = cost
+            heappush(heap, (cost, node))
+    best, reached = inf, None
+    while heap:
+        d, u = heappop(heap)
+        if d >= best:
+            break
+        if u in settled:
+            continue
+        settled.add(u)
+        if u in ends and d + ends[u] < best:
+            best, reached = d + ends[u], u
+        for i in range(offsets[u], offsets[u+1]):
+            v = targets[i]
+            nd = d + weights[i]
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                pred[v] = (u, i)
+                heappush(heap, (nd, v))
+
+    if reached is None:
+        raise NoRouteError("Aucun itinéraire n'a été trouvé entre le départ et l'arrivée.")
+    nodes, positions = _build_path(pred, reached)
+    return nodes, graph.edge_ids[positions].tolist(), best, len(settled)
+
+
+def single_source(graph, source, max_cost:float=float('inf'), deadline:float=None):
+    '''
+    Dijkstra from source to all the nodes whose cost is at most max_cost.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - source (int or list) : index of the start node, or its seeds (see seeds).
+        - max_cost (float) (default: inf) : cost at which the search stops.
+        - deadline (float) (default: None) : time (time.time()) at which the search stops,
+                                             the costs of the settled nodes stay exact.
+    OUTPUT:
+        - dist (dict) : cost of the shortest path to each settled node.
+        - pred (dict) : (previous node, position of the edge) of each reached node.
+    '''
+    offsets, targets, weights = graph.views()
+    inf = float('inf')
+    dist, pred, settled, heap = {}, {}, {}, []
+    for node, cost in seeds(source):
+        if cost < dist.get(node, inf):
+            dist[node] = cost
+            heappush(heap, (cost, node))
+    while heap:
+        d, u = heappop(heap)
+        if u in settled:
+            continue
+        if d > max_cost:
+            break
+        # The clock is read every 1024 settled nodes only
+        if deadline is not None and not len(settled) & 1023 and time() > deadline:
+            break
+        settled[u] = d
+        for i in range(offsets[u], offsets[u+1]):
+            v = targets[i]
+            nd = d + weights[i]
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                pred[v] = (u, i)
+                heappush(heap, (nd, v))
+    return settled, pred
+
+
+def astar(graph, source, target, potential=None):
+    '''
+    A* from source to target on the CSR graph.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - source (int or list) : index of the start node, or its seeds (see seeds).
+        - target (int or list) : index of the end node, or its seeds (see seeds).
+        - potential (function) (default: travel_time_bound) : lower bound of the cost
+                                                              from a node to target.
+    OUTPUT:
+        - nodes (list) : indexes of the nodes of the path.
+        - edges (list) : ids of the edges of the path.
+        - cost (float) : cost of the path.
+        - settled (int) : number of nodes settled by the search.
+    '''
+    ends = dict(seeds(target))
+    if potential is None:
+        potential = min_bound(lambda node: travel_time_bound(graph, node), list(ends.items()))
+    offsets, targets, weights = graph.views()
+    inf = float('inf')
+    dist, pred, settled, heap = {}, {}, set(), []
+    for node, cost in seeds(source):
+        if cost < dist.get(node, inf):
+            dist[node] = cost
+            heappush(heap, (cost + potential(node), cost, node))
+    best, reached = inf, None
+    while heap:
+        key, d, u = heappop(heap)
+        if key >= best:
+            break
+        if u in settled:
+            continue
+        settled.add(u)
+        if u in ends and d + ends[u] < best:
+            best, reached = d + ends[u], u
+        for i in range(offsets[u], offsets[u+1]):
+            v = targets[i]
+            nd = d + weights[i]
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                pred[v] = (u, i)
+                heappush(heap, (nd + potential(v), nd, v))
+
+    if reached is None:
+        raise NoRouteError("Aucun itinéraire n'a été trouvé entre le départ et l'arrivée.")
+    nodes, positions = _build_path(pred, reached)
+    return nodes, graph.edge_ids[positions].tolist(), best, len(settled)
+
+
+def bidirectional_astar(graph, source, target, forward_bound=None, backward_bound=None):
+    '''
+    Bidirectional A* from source to target, with the average of the forward and backward
+    potentials so that both searches use consistent reduced costs.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - source (int or list) : index of the start node, or its seeds (see seeds).
+        - target (int or list) : index of the end node, or its seeds (see seeds).
+        - forward_bound (function) (default: travel_time_bound) : lower bound of the cost
+                                                                  from a node to target.
+        - backward_bound (function) (default: travel_time_bound) : lower bound of the cost
+                                                                   from source to a node.
+    OUTPUT:
+        - nodes (list) : indexes of the nodes of the path.
+        - edges (list) : ids of the edges of the path.
+        - cost (float) : cost of the path.
+        - settled (int) : number of nodes settled by the two searches.
+    '''
+    starts, ends = seeds(source), seeds(target)
+    if forward_bound is None:
+        forward_bound = min_bound(lambda node: travel_time_bound(graph, node), ends)
+    if backward_bound is None:
+        backward_bound = min_bound(lambda node: travel_time_bound(graph, node), starts)
+
+    def potential(v:int) -> float:
+        return (forward_bound(v) - backward_bound(v)) / 2
+
+    inf = float('inf')
+    reverse = graph.reverse()
+    sides = [graph.views(), reverse.views()]
+    signs = [1, -1]
+    dist, pred, settled, heaps = [{}, {}], [{}, {}], [set(), set()], [[], []]
+    for side, side_seeds in ((0, starts), (1, ends)):
+        for node, cost in side_seeds:
+            if cost < dist[side].get(node, inf):
+                dist[side][node] = cost
+                heappush(heaps[side], (cost + signs[side] * potential(node), cost, node))
+    best, meeting = inf, None
+    # The start and the end can share a node
+    for node, cost in dist[0].items():
+        if node in dist[1] and cost + dist[1][node] < best:
+            best, meeting = cost + dist[1][node], node
+    while heaps[0] and heaps[1]:
+        # The sum of the smallest keys is a lower bound of the cost of the remaining paths
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        # Expand the side with the smallest queue
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        _, d, u = heappop(heaps[side])
+        if u in settled[side]:
+            continue
+        settled[side].add(u)
+        offsets, targets, weights = sides[side]
+        side_dist, other_dist = dist[side], dist[1-side]
+        for i in range(offsets[u], offsets[u+1]):
+            v = targets[i]
+            nd = d + weights[i]
+            if nd < side_dist.get(v, inf):
+                side_dist[v] = nd
+                pred[side][v] = (u, i)
+                heappush(heaps[side], (nd + signs[side] * potential(v), nd, v))
+                if v in other_dist and nd + other_dist[v] < best:
+                    best, meeting = nd + other_dist[v], v
+
+    if meeting is None:
+        raise NoRouteError("Aucun itinéraire n'a été trouvé entre le départ et l'arrivée.")
+
+    nodes_f, positions_f = _build_path(pred[0], meeting)
+    nodes_b, positions_b = _build_path(pred[1], meeting)
+    nodes = nodes_f + nodes_b[::-1][1:]
+    edges = graph.edge_ids[positions_f].tolist() + reverse.edge_ids[positions_b[::-1]].tolist()
+    return nodes, edges, best, len(settled[0]) + len(settled[1])
+
+
+# Engines of the search, by name
+ENGINES = {"dijkstra": dijkstra,
+           "astar": astar,
+           "bidir-astar": bidirectional_astar}
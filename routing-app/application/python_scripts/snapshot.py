@@ -0,0 +1,142 @@
+'''
+Script for the binary snapshots of the routing graph (CSR graph and edge store)
+'''
+import json
+import os
+import shutil
+from time import time
+import numpy as np
+
+from .csr_graph import CSRGraph
+from .edge_store import EdgeStore
+
+# Folder of the snapshots in the graph folder, one subfolder per graph version
+SNAPSHOTS_DIRNAME = "snapshots"
+
+# File of the snapshots folder giving the version of the current snapshot
+CURRENT_FILENAME = "CURRENT"
+
+# Description of the snapshot : versions, bounding box, arrays
+MANIFEST_FILENAME = "manifest.json"
+
+# Version of the format of the snapshots, increased when the arrays change
+FORMAT_VERSION = 3
+
+# Arrays of the snapshot, one .npy file each
+GRAPH_ARRAYS = ["node_ids", "lat", "lon", "offsets", "targets", "weights", "edge_ids"]
+EDGE_ARRAYS = ["coords", "coord_offsets", "lengths", "name_ids", "way_ids"]
+# Attributes of the edges (weight profiles, elevation, ETA), saved when they are known
+ATTRIBUTE_ARRAYS = ["speeds", "climbs", "descents", "max_grades", "coord_elevations",
+                    "signals"]
+
+
+class SnapshotError(ValueError):
+    '''
+    Raised when a snapshot is missing or has not the expected format.
+    '''
+
+
+def snapshots_dir(graph_dir:str) -> str:
+    '''
+    Return the folder of the snapshots of a graph folder.
+    '''
+    return os.path.join(graph_dir, SNAPSHOTS_DIRNAME)
+
+def current_snapshot(graph_dir:str) -> str:
+    '''
+    Return the folder of the current snapshot of a graph folder, None if there is none.
+    '''
+    root = snapshots_dir(graph_dir)
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), encoding="utf-8") as file:
+            version = file.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(root, version)
+    return path if os.path.isdir(path) else None
+
+
+def save_snapshot(graph_dir:str, graph, edges, bbox:tuple) -> str:
+    '''
+    Save the graph in a new snapshot of the graph folder and make it the current one.
+    The snapshot is written in a temporary folder renamed at the end, then the CURRENT file
+    is replaced, so a process loading the graph never sees a half-written snapshot.
+    INPUT:
+        - graph_dir (str) : the graph folder.
+        - graph (CSRGraph) : the graph.
+        - edges (EdgeStore) : the geometry and the attributes of the edges.
+        - bbox (tuple) : (north, south, east, west) bounding box of the graph.
+    OUTPUT:
+        - path (str) : folder of the snapshot.
+    '''
+    fingerprint = graph.fingerprint()
+    version = fingerprint[:16]
+    root = snapshots_dir(graph_dir)
+    path = os.path.join(root, version)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+
+    arrays = {name: getattr(graph, name) for name in GRAPH_ARRAYS}
+    arrays.update({name: getattr(edges, name) for name in EDGE_ARRAYS})
+    arrays.update({name: getattr(edges, name) for name in ATTRIBUTE_ARRAYS
+                   if getattr(edges, name) is not None})
+    arrays["names"] = np.array(edges.names, dtype=str)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+    manifest = {"format_version": FORMAT_VERSION,
+                "version": version,
+                "fingerprint": fingerprint,
+                "bbox": list(bbox),
+                "n_nodes": graph.n_nodes,
+                "n_edges": graph.n_edges,
+                "created": time(),
+                "arrays": {name: {"dtype": str(array.dtype), "shape": list(array.shape)}
+                           for name, array in arrays.items()}}
+    with open(os.path.join(tmp, MANIFEST_FILENAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    current = os.path.join(root, f"{CURRENT_FILENAME}.{os.getpid()}.tmp")
+    with open(current, "w", encoding="utf-8") as file:
+        file.write(version)
+    os.replace(current, os.path.join(root, CURRENT_FILENAME))
+    return path
+
+def load_snapshot(path:str, mmap:bool=True) -> tuple:
+    '''
+    Load a snapshot saved with save_snapshot.
+    With mmap, the arrays are mapped read-only (np.load(mmap_mode='r')): loading is almost
+    instant, the pages are read from the disk when they are used and are shared by all the
+    processes mapping the same files. The weights are mapped copy-on-write (mmap_mode='c'),
+    so that the overrides of the weights only copy the pages they modify.
+    INPUT:
+        - path (str) : folder of the snapshot.
+        - mmap (bool) (default: True) : map the arrays instead of reading them.
+    OUTPUT:
+        - graph (CSRGraph) : the graph.
+        - edges (EdgeStore) : the geometry and the attributes of the edges.
+        - manifest (dict) : the description of the snapshot (see save_snapshot).
+    '''
+    try:
+        with open(os.path.join(path, MANIFEST_FILENAME), encoding="utf-8") as file:
+            manifest = json.load(file)
+    except OSError:
+        raise SnapshotError(f"No snapshot in {path}.") from None
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')}"
+                            f" in {path} (expected {FORMAT_VERSION}), build it again.")
+
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(path, name + ".npy"),
+                            mmap_mode="c" if mmap and name == "weights" else mmap_mode)
+              for name in GRAPH_ARRAYS + EDGE_ARRAYS}
+    # The fingerprint of the manifest avoids reading all the arrays to hash them
+    graph = CSRGraph(*(arrays[name] for name in GRAPH_ARRAYS), fingerprint=manifest["fingerprint"])
+    attributes = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+                  for name in ATTRIBUTE_ARRAYS if name in manifest["arrays"]}
+    edges = EdgeStore(*(arrays[name] for name in EDGE_ARRAYS),
+                      np.load(os.path.join(path, "names.npy")).tolist(), graph.weights,
+                      **attributes)
+    return graph, edges, manifest
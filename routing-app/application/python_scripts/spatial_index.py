@@ -0,0 +1,226 @@
+'''
+Script for the spatial index used to snap the start and the end of a route on the graph
+'''
+import copy
+import math
+from collections import namedtuple
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Radius of the Earth (m)
+EARTH_RADIUS = 6371009
+
+# Maximum distance between a point and the graph to snap it (m)
+MAX_SNAP_DISTANCE = 1000
+
+# Ways to snap a point on the graph : on its nearest node or on its nearest edge
+SNAP_MODES = ("node", "edge")
+
+# Point snapped on the graph :
+#   - seeds (list) : seeds of the search (see search.seeds).
+#   - point (list) : (lat, lon) of the snapped point.
+#   - edge (int) : id of the edge of the point (-1 if snapped on a node).
+#   - fraction (float) : position of the point along the edge.
+SnappedPoint = namedtuple("SnappedPoint", ["seeds", "point", "edge", "fraction"])
+
+
+class SpatialIndex:
+    '''
+    KD-trees over the nodes and the edges of a CSR graph, built once with the graph.
+    The coordinates are projected on a local equirectangular projection centered on the
+    graph, which is precise enough at the scale of a region.
+    The edges are indexed by the middle of their segment, the edges of infinite weight
+    (forbidden highways) are not indexed.
+    '''
+    def __init__(self, graph, max_distance:float=MAX_SNAP_DISTANCE):
+        '''
+        INPUT:
+            - graph (CSRGraph) : the graph.
+            - max_distance (float) (default: MAX_SNAP_DISTANCE) : maximum snapping distance (m).
+        '''
+        self.graph = graph
+        self.max_distance = max_distance
+        self.lat0 = float(np.mean(graph.lat)) if graph.n_nodes else 0.
+        self.lon0 = float(np.mean(graph.lon)) if graph.n_nodes else 0.
+        self.xy = self.project(graph.lat, graph.lon)
+        self.node_tree = cKDTree(self.xy)
+
+        sources = np.repeat(np.arange(graph.n_nodes, dtype=np.int32), np.diff(graph.offsets))
+        self.edges = np.flatnonzero(np.isfinite(graph.weights)).astype(np.int32)
+        self.sources = sources[self.edges]
+        self.targets = graph.targets[self.edges]
+        a, b = self.xy[self.sources], self.xy[self.targets]
+        self.edge_tree = cKDTree((a + b) / 2)
+        self.max_half_length = float(np.max(np.linalg.norm(b - a, axis=1)) / 2) \
+            if len(self.edges) else 0.
+
+    def with_graph(self, graph):
+        '''
+        Return an index of the same nodes and edges for a graph with other weights (see
+        CSRGraph.with_weights): the KD-trees are shared, only the costs of the virtual nodes
+        change.
+        '''
+        index = copy.copy(self)
+        index.graph = graph
+        return index
+
+    def project(self, lat, lon) -> np.ndarray:
+        '''
+        Return the projected (x, y) coordinates (m) of points, shape (N, 2).
+        '''
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        x = EARTH_RADIUS * np.radians(lon - self.lon0) * math.cos(math.radians(self.lat0))
+        y = EARTH_RADIUS * np.radians(lat - self.lat0)
+        return np.column_stack((x, y))
+
+    def unproject(self, xy) -> np.ndarray:
+        '''
+        Return the (lat, lon) coordinates of projected points, shape (N, 2).
+        '''
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        lat = self.lat0 + np.degrees(xy[:, 1] / EARTH_RADIUS)
+        lon = self.lon0 + np.degrees(xy[:, 0] / (EARTH_RADIUS * math.cos(math.radians(self.lat0))))
+        return np.column_stack((lat, lon))
+
+    def nearest_nodes(self, points):
+        '''
+        Snap all the points on their nearest node in one vectorized query.
+        INPUT:
+            - points (array-like) : (lat, lon) of the points, shape (N, 2).
+        OUTPUT:
+            - nodes (np.ndarray) : index of the nearest node of each point.
+            - distances (np.ndarray) : distance between each point and its node (m).
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        distances, nodes = self.node_tree.query(self.project(points[:, 0], points[:, 1]))
+        return nodes.astype(np.int64), distances
+
+    def nearest_edges(self, points):
+        '''
+        Snap all the points on their nearest edge, at the orthogonal projection of the point.
+        The nearest edge is among the edges whose middle is closer than the distance to the
+        nearest node plus the largest half length of an edge.
+        INPUT:
+            - points (array-like) : (lat, lon) of the points, shape (N, 2).
+        OUTPUT:
+            - edges (np.ndarray) : id of the nearest edge of each point.
+            - fractions (np.ndarray) : position of the projection along the edge (0 to 1).
+            - distances (np.ndarray) : distance between each point and its projection (m).
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xy = self.project(points[:, 0], points[:, 1])
+        node_distances, _ = self.node_tree.query(xy)
+        candidates = self.edge_tree.query_ball_point(xy, node_distances + self.max_half_length)
+
+        edges = np.empty(len(xy), dtype=np.int64)
+        fractions = np.empty(len(xy), dtype=np.float64)
+        distances = np.empty(len(xy), dtype=np.float64)
+        for i, (point, candidate) in enumerate(zip(xy, candidates)):
+            candidate = np.asarray(candidate, dtype=np.int64)
+            a, b = self.xy[self.sources[candidate]], self.xy[self.targets[candidate]]
+            ab = b - a
+            squared = np.einsum("ij,ij->i", ab, ab)
+            t = np.clip(np.einsum("ij,ij->i", point - a, ab) / np.where(squared > 0, squared, 1),
+                        0, 1)
+            gaps = np.linalg.norm(a + t[:, None] * ab - point, axis=1)
+            best = int(np.argmin(gaps))
+            edges[i] = self.edges[candidate[best]]
+            fractions[i] = t[best]
+            distances[i] = gaps[best]
+        return edges, fractions, distances
+
+    def snap(self, points, mode:str="node", is_start=True) -> list:
+        '''
+        Snap all the points on the graph, on their nearest node or edge.
+        INPUT:
+            - points (array-like) : (lat, lon) of the points, shape (N, 2).
+            - mode (str) (default: "node") : "node" or "edge" (see SNAP_MODES).
+            - is_start (bool or list) (default: True) : whether each point is the start of a
+                                                        route or its end.
+        OUTPUT:
+            - snapped (list) : SnappedPoint of each point, None if the point is further than
+                               max_distance from the graph.
+        '''
+        graph = self.graph
+        snapped = []
+        if mode == "node":
+            nodes, distances = self.nearest_nodes(points)
+            for node, distance in zip(nodes.tolist(), distances.tolist()):
+                snapped.append(SnappedPoint([(node, 0.)], [float(graph.lat[node]),
+                                                           float(graph.lon[node])], -1, 0.)
+                               if distance <= self.max_distance else None)
+        else:
+            edges, fractions, distances = self.nearest_edges(points)
+            is_start = np.broadcast_to(is_start, edges.shape).tolist()
+            for i, (edge, fraction) in enumerate(zip(edges.tolist(), fractions.tolist())):
+                snapped.append(SnappedPoint(self.virtual_node(edge, fraction, is_start[i]),
+                                            self.edge_point(edge, fraction), edge, fraction)
+                               if distances[i] <= self.max_distance else None)
+        return snapped
+
+    def direct_cost(self, start:SnappedPoint, end:SnappedPoint) -> float:
+        '''
+        Return the cost to go directly from start to end when they are on the same segment
+        (the same edge or an edge and its reverse edge), else inf.
+        '''
+        if start.edge < 0 or end.edge < 0:
+            return float('inf')
+        graph = self.graph
+        source, target = graph.edge_source(start.edge), int(graph.targets[start.edge])
+        end_source, end_target = graph.edge_source(end.edge), int(graph.targets[end.edge])
+        # Positions of the points along the edge of start
+        if (end_source, end_target) == (source, target):
+            position_start, position_end = start.fraction, end.fraction
+        elif (end_source, end_target) == (target, source):
+            position_start, position_end = start.fraction, 1 - end.fraction
+        else:
+            return float('inf')
+
+        if position_end >= position_start:
+            return (position_end - position_start) * float(graph.weights[start.edge])
+        back = self._reverse_weight(source, target)
+        return (position_start - position_end) * back
+
+    def _reverse_weight(self, source:int, target:int) -> float:
+        '''
+        Return the weight of the lightest edge from target to source (inf if there is none).
+        '''
+        graph = self.graph
+        start, end = int(graph.offsets[target]), int(graph.offsets[target+1])
+        weights = graph.weights[start:end][graph.targets[start:end] == source]
+        return float(weights.min()) if len(weights) else float('inf')
+
+    def edge_point(self, edge:int, fraction:float) -> list:
+        '''
+        Return the (lat, lon) of the point at the fraction of the edge.
+        '''
+        position = int(np.searchsorted(self.edges, edge))
+        a, b = self.xy[self.sources[position]], self.xy[self.targets[position]]
+        return self.unproject(a + fraction * (b - a))[0].tolist()
+
+    def virtual_node(self, edge:int, fraction:float, is_start:bool) -> list:
+        '''
+        Return the seeds of a search (see search.seeds) from or to a virtual node inserted on
+        an edge. The virtual node is linked to the two ends of the edge, in the directions
+        allowed by the edge and its reverse edge, with the part of their weight.
+        INPUT:
+            - edge (int) : id of the edge.
+            - fraction (float) : position of the virtual node along the edge (0 to 1).
+            - is_start (bool) : True for the start of a route, False for its end.
+        OUTPUT:
+            - seeds (list) : list of (node, cost).
+        '''
+        graph = self.graph
+        source = graph.edge_source(edge)
+        target = int(graph.targets[edge])
+        weight = float(graph.weights[edge])
+        back = self._reverse_weight(source, target)
+        if is_start:
+            node_seeds = [(target, (1 - fraction) * weight)]
+            if math.isfinite(back):
+                node_seeds.append((source, fraction * back))
+        else:
+            node_seeds = [(source, fraction * weight)]
+            if math.isfinite(back):
+                node_seeds.append((target, (1 - fraction) * back))
+        return node_seeds
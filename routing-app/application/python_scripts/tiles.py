@@ -0,0 +1,640 @@
+'''
+Script for the tiled graph: the graph is split into geographic tiles loaded on demand, and an
+overlay of the boundary nodes of the tiles links them for the routes across tiles
+'''
+import json
+import math
+import os
+import shutil
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from heapq import heappush, heappop
+from threading import Lock
+from time import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra as sparse_dijkstra
+
+from .csr_graph import CSRGraph
+from .edge_store import EdgeStore, _ranges
+from .search import NoRouteError, dijkstra, seeds
+from .spatial_index import EARTH_RADIUS, MAX_SNAP_DISTANCE, SnappedPoint, SpatialIndex
+
+# Folder of the tiles in the graph folder
+TILES_DIRNAME = "tiles"
+
+# Description of the tiles : versions, grid, tiles
+MANIFEST_FILENAME = "manifest.json"
+
+# Version of the format of the tiles, increased when the arrays change
+FORMAT_VERSION = 2
+
+# Side of a tile (degrees of latitude and longitude)
+TILE_SIZE = 0.25
+
+# Default memory budget of the loaded tiles (bytes)
+DEFAULT_TILES_BYTES = 256 * 1024**2
+
+# Arrays of the overlay, one .npy file each, mapped from the disk
+OVERLAY_ARRAYS = ["tile_node_offsets", "tile_edge_offsets", "boundary", "overlay_offsets",
+                  "overlay_targets", "overlay_weights", "overlay_edges"]
+
+# Arrays of a tile, in one .npz file
+TILE_ARRAYS = ["node_ids", "lat", "lon", "offsets", "targets", "weights", "ghost_nodes",
+               "coords", "coord_offsets", "lengths", "name_ids", "way_ids"]
+
+# Number of boundary nodes of a tile searched at once when the overlay is built
+ENTRY_CHUNK_SIZE = 256
+
+
+class TilesError(ValueError):
+    '''
+    Raised when the tiles are missing or have not the expected format.
+    '''
+
+
+def tile_key(lat:float, lon:float, tile_size:float=TILE_SIZE) -> str:
+    '''
+    Return the key "row_column" of the tile of a point in the grid of the tiles.
+    '''
+    return f"{math.floor(lat / tile_size)}_{math.floor(lon / tile_size)}"
+
+
+def _tile_paths(sources, targets, weights, n_own:int, entries, exits) -> tuple:
+    '''
+    Return the costs of the shortest paths inside a tile from its entries to its exits, with
+    the Dijkstra of scipy over the edges of the tile (the parallel edges are reduced to the
+    lightest one, the edges of infinite weight are dropped).
+    INPUT:
+        - sources, targets (np.ndarray) : local indexes of the ends of the edges of the tile.
+        - weights (np.ndarray) : weight of each edge.
+        - n_own (int) : number of nodes of the tile, the ghost nodes come after them.
+        - entries, exits (np.ndarray) : local indexes of the entries and the exits.
+    OUTPUT:
+        - entry, exit (np.ndarray) : local indexes of the ends of each path.
+        - cost (np.ndarray) : cost of each path.
+    '''
+    inside = (targets < n_own) & np.isfinite(weights)
+    sources, targets = sources[inside], targets[inside]
+    weights = weights[inside].astype(np.float64)
+    # Lightest edge first, the first edge of each pair of nodes is kept
+    order = np.lexsort((weights, targets, sources))
+    sources, targets, weights = sources[order], targets[order], weights[order]
+    first = np.ones(len(sources), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    sources, targets, weights = sources[first], targets[first], weights[first]
+    indptr = np.zeros(n_own+1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_own), out=indptr[1:])
+    # Built from its arrays, the matrix keeps the edges of weight 0
+    matrix = csr_matrix((weights, targets, indptr), shape=(n_own, n_own))
+
+    entry, exit_, cost = [], [], []
+    for start in range(0, len(entries), ENTRY_CHUNK_SIZE):
+        chunk = entries[start:start+ENTRY_CHUNK_SIZE]
+        costs = sparse_dijkstra(matrix, directed=True, indices=chunk)[:, exits]
+        rows, columns = np.nonzero(np.isfinite(costs))
+        keep = chunk[rows] != exits[columns]
+        entry.append(chunk[rows[keep]])
+        exit_.append(exits[columns[keep]])
+        cost.append(costs[rows[keep], columns[keep]])
+    if not entry:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(entry), np.concatenate(exit_), np.concatenate(cost)
+
+
+def build_tiles(graph, edges, bbox:tuple, path:str, tile_size:float=TILE_SIZE,
+                verbose:bool=True) -> dict:
+    '''
+    Split the graph into tiles of tile_size degrees and save them with their overlay.
+    The nodes are numbered again tile by tile, so the tile of a node (and of an edge, which
+    belongs to the tile of its source) is found with the offsets of the tiles. A tile keeps
+    its edges, the edges leaving it included: their targets are the ghost nodes of the tile.
+    The overlay links the boundary nodes of the tiles : the edges between two tiles, and for
+    each tile the cost of the shortest path inside the tile from each entry (target of an
+    edge coming from another tile) to each exit (source of an edge leaving the tile).
+    The tiles are written in a temporary folder renamed at the end.
+    INPUT:
+        - graph (CSRGraph) : the graph.
+        - edges (EdgeStore) : the geometry and the attributes of the edges.
+        - bbox (tuple) : (north, south, east, west) bounding box of the graph.
+        - path (str) : folder of the tiles.
+        - tile_size (float) (default: TILE_SIZE) : side of a tile (degrees).
+        - verbose (bool) (default: True) : print the progress of the build.
+    OUTPUT:
+        - manifest (dict) : the description of the tiles.
+    '''
+    dbt = time()
+    n_nodes = graph.n_nodes
+    rows = np.floor(np.asarray(graph.lat) / tile_size).astype(np.int64)
+    columns = np.floor(np.asarray(graph.lon) / tile_size).astype(np.int64)
+    cells = (rows - rows.min()) * (columns.max() - columns.min() + 1) + columns - columns.min()
+    _, node_tile = np.unique(cells, return_inverse=True)
+    node_tile = node_tile.astype(np.int64)
+    n_tiles = int(node_tile.max()) + 1 if n_nodes else 0
+
+    # New index of the nodes and the edges, tile by tile
+    order = np.argsort(node_tile, kind="stable")
+    new_index = np.empty(n_nodes, dtype=np.int64)
+    new_index[order] = np.arange(n_nodes)
+    tile_node_offsets = np.zeros(n_tiles+1, dtype=np.int64)
+    np.cumsum(np.bincount(node_tile, minlength=n_tiles), out=tile_node_offsets[1:])
+    sources = new_index[np.repeat(np.arange(n_nodes), np.diff(graph.offsets))]
+    edge_order = np.argsort(sources, kind="stable")
+    sources = sources[edge_order]
+    targets = new_index[np.asarray(graph.targets)[edge_order]]
+    weights = np.asarray(graph.weights)[edge_order]
+    new_tile = node_tile[order]
+    tile_edge_offsets = np.zeros(n_tiles+1, dtype=np.int64)
+    np.cumsum(np.bincount(new_tile[sources], minlength=n_tiles), out=tile_edge_offsets[1:])
+
+    # Edges between two tiles
+    cut = np.flatnonzero(new_tile[sources] != new_tile[targets])
+    entries = np.unique(targets[cut])
+    exits = np.unique(sources[cut])
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    tiles = {}
+    overlay = [(sources[cut], targets[cut], weights[cut].astype(np.float64), cut)]
+    for t in range(n_tiles):
+        n0, n1 = int(tile_node_offsets[t]), int(tile_node_offsets[t+1])
+        e0, e1 = int(tile_edge_offsets[t]), int(tile_edge_offsets[t+1])
+        n_own = n1 - n0
+        tile_sources = sources[e0:e1] - n0
+        tile_targets = targets[e0:e1]
+        inside = (tile_targets >= n0) & (tile_targets < n1)
+        ghost_nodes = np.unique(tile_targets[~inside])
+        local_targets = np.where(inside, tile_targets - n0,
+                                 n_own + np.searchsorted(ghost_nodes, tile_targets))
+        nodes = order[np.concatenate((np.arange(n0, n1), ghost_nodes))]
+        offsets = np.zeros(n_own+len(ghost_nodes)+1, dtype=np.int64)
+        np.cumsum(np.bincount(tile_sources, minlength=n_own+len(ghost_nodes)), out=offsets[1:])
+
+        old_edges = edge_order[e0:e1]
+        starts = edges.coord_offsets[old_edges]
+        sizes = edges.coord_offsets[old_edges+1] - starts
+        coord_offsets = np.zeros(e1-e0+1, dtype=np.int64)
+        np.cumsum(sizes, out=coord_offsets[1:])
+        arrays = {"node_ids": graph.node_ids[nodes], "lat": graph.lat[nodes],
+                  "lon": graph.lon[nodes], "offsets": offsets,
+                  "targets": local_targets.astype(np.int32), "weights": weights[e0:e1],
+                  "ghost_nodes": ghost_nodes, "coords": edges.coords[_ranges(starts, sizes)],
+                  "coord_offsets": coord_offsets, "lengths": edges.lengths[old_edges],
+                  "name_ids": edges.name_ids[old_edges], "way_ids": edges.way_ids[old_edges]}
+        key = tile_key(float(graph.lat[order[n0]]), float(graph.lon[order[n0]]), tile_size)
+        np.savez(os.path.join(tmp, key + ".npz"), **arrays)
+
+        # Paths inside the tile between its boundary nodes
+        tile_entries = entries[(entries >= n0) & (entries < n1)] - n0
+        tile_exits = exits[(exits >= n0) & (exits < n1)] - n0
+        entry, exit_, cost = _tile_paths(tile_sources, local_targets, weights[e0:e1],
+                                         n_own, tile_entries, tile_exits)
+        overlay.append((entry + n0, exit_ + n0, cost, np.full(len(cost), -1, dtype=np.int64)))
+        row, column = (int(part) for part in key.split("_"))
+        tiles[key] = {"index": t,
+                      "bbox": [(row + 1) * tile_size, row * tile_size,
+                               (column + 1) * tile_size, column * tile_size],
+                      "n_nodes": n_own,
+                      "n_edges": e1 - e0,
+                      "entries": len(tile_entries),
+                      "exits": len(tile_exits),
+                      "shortcuts": len(cost)}
+        if verbose:
+            print(f"Tuile {key} ({t+1}/{n_tiles}) : {n_own} noeuds, {e1-e0} arcs,"
+                  f" {len(tile_entries)} entrées, {len(tile_exits)} sorties")
+
+    # Overlay in the CSR format over the boundary nodes, the edges of infinite weight dropped
+    overlay_sources, overlay_targets, overlay_weights, overlay_edges = \
+        (np.concatenate(parts) for parts in zip(*overlay))
+    finite = np.isfinite(overlay_weights)
+    overlay_sources, overlay_targets = overlay_sources[finite], overlay_targets[finite]
+    overlay_weights, overlay_edges = overlay_weights[finite], overlay_edges[finite]
+    overlay_order = np.argsort(overlay_sources, kind="stable")
+    overlay_sources = overlay_sources[overlay_order]
+    boundary = np.unique(overlay_sources)
+    overlay_offsets = np.searchsorted(overlay_sources, np.append(boundary, n_nodes))
+    arrays = {"tile_node_offsets": tile_node_offsets,
+              "tile_edge_offsets": tile_edge_offsets,
+              "boundary": boundary,
+              "overlay_offsets": overlay_offsets.astype(np.int64),
+              "overlay_targets": overlay_targets[overlay_order].astype(np.int64),
+              "overlay_weights": overlay_weights[overlay_order],
+              "overlay_edges": overlay_edges[overlay_order].astype(np.int64)}
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, name + ".npy"), array)
+    np.save(os.path.join(tmp, "names.npy"), np.array(edges.names, dtype=str))
+
+    fingerprint = graph.fingerprint()
+    manifest = {"format_version": FORMAT_VERSION,
+                "version": fingerprint[:16],
+                "fingerprint": fingerprint,
+                "bbox": list(bbox),
+                "tile_size": tile_size,
+                "n_nodes": n_nodes,
+                "n_edges": graph.n_edges,
+                "boundary_nodes": len(boundary),
+                "overlay_edges": len(overlay_edges),
+                "created": time(),
+                "tiles": tiles}
+    with open(os.path.join(tmp, MANIFEST_FILENAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    if verbose:
+        print(f"{n_tiles} tuiles, {len(boundary)} noeuds frontières et {len(overlay_edges)}"
+              f" arcs de l'overlay en {time()-dbt:.1f} s")
+    return manifest
+
+
+class TileIndex(SpatialIndex):
+    '''
+    Spatial index of a tile, whose edges leaving the tile have their reverse edge in the tile
+    of their target.
+    '''
+    def __init__(self, tile):
+        '''
+        INPUT:
+            - tile (Tile) : the tile.
+        '''
+        super().__init__(tile.graph)
+        self.tile = tile
+
+    def _reverse_weight(self, source:int, target:int) -> float:
+        '''
+        Return the weight of the lightest edge from target to source (inf if there is none),
+        looked for in the tile of target when it is a ghost node.
+        '''
+        tile = self.tile
+        if target < tile.n_own:
+            return super()._reverse_weight(source, target)
+        node = tile.global_node(target)
+        other = tile.tiled.tile(tile.tiled.tile_of_node(node))
+        local = node - other.node_offset
+        start, end = int(other.graph.offsets[local]), int(other.graph.offsets[local+1])
+        targets = other.global_nodes(other.graph.targets[start:end])
+        weights = other.graph.weights[start:end][targets == tile.global_node(source)]
+        return float(weights.min()) if len(weights) else float('inf')
+
+
+class Tile:
+    '''
+    Graph and edges of a tile, with its spatial index built at its first use.
+    The local indexes of the nodes are the nodes of the tile (global index node_offset +
+    local index), then its ghost nodes (global index ghost_nodes[local index - n_own]). The
+    local index of an edge is its position in the tile, its global id is edge_offset + local
+    index.
+    '''
+    def __init__(self, arrays:dict, tiled, node_offset:int, edge_offset:int):
+        '''
+        INPUT:
+            - arrays (dict) : the arrays of the tile (see TILE_ARRAYS).
+            - tiled (TiledGraph) : the tiled graph of the tile.
+            - node_offset, edge_offset (int) : global index of the first node and edge.
+        '''
+        self.tiled = tiled
+        n_edges = len(arrays["targets"])
+        self.graph = CSRGraph(arrays["node_ids"], arrays["lat"], arrays["lon"],
+                              arrays["offsets"], arrays["targets"], arrays["weights"],
+                              np.arange(n_edges, dtype=np.int32))
+        self.edges = EdgeStore(arrays["coords"], arrays["coord_offsets"], arrays["lengths"],
+                               arrays["name_ids"], arrays["way_ids"], tiled.names,
+                               self.graph.weights)
+        self.ghost_nodes = arrays["ghost_nodes"]
+        self.n_own = self.graph.n_nodes - len(self.ghost_nodes)
+        self.node_offset = node_offset
+        self.edge_offset = edge_offset
+        self._index = None
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        Memory used by the arrays of the tile (bytes).
+        '''
+        return self.graph.nbytes + self.edges.nbytes + self.ghost_nodes.nbytes
+
+    @property
+    def index(self) -> TileIndex:
+        '''
+        Index snapping the points on the tile, built at its first use and then kept.
+        '''
+        if self._index is None:
+            self._index = TileIndex(self)
+        return self._index
+
+    def global_node(self, local:int) -> int:
+        '''
+        Return the global index of a local node of the tile.
+        '''
+        if local < self.n_own:
+            return self.node_offset + local
+        return int(self.ghost_nodes[local - self.n_own])
+
+    def global_nodes(self, local) -> np.ndarray:
+        '''
+        Return the global indexes of local nodes of the tile.
+        '''
+        local = np.asarray(local, dtype=np.int64)
+        nodes = local + self.node_offset
+        ghost = local >= self.n_own
+        nodes[ghost] = self.ghost_nodes[local[ghost] - self.n_own]
+        return nodes
+
+
+class TiledGraph:
+    '''
+    Graph split into tiles (see build_tiles), loaded on demand and kept in an LRU cache
+    with a memory budget. Only the overlay of the boundary nodes is mapped from the disk for
+    all the requests.
+    A route is searched on the tiles of its start and its end, fully loaded, and on the
+    overlay for the other tiles. The overlay paths of the route are then unpacked in their
+    tiles, which are loaded too.
+    '''
+    def __init__(self, path:str, max_bytes:int=DEFAULT_TILES_BYTES):
+        '''
+        INPUT:
+            - path (str) : folder of the tiles.
+            - max_bytes (int) (default: DEFAULT_TILES_BYTES) : memory budget of the tiles.
+        '''
+        try:
+            with open(os.path.join(path, MANIFEST_FILENAME), encoding="utf-8") as file:
+                self.manifest = json.load(file)
+        except OSError:
+            raise TilesError(f"No tiles in {path}.") from None
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise TilesError(f"Unsupported tiles format {self.manifest.get('format_version')}"
+                             f" in {path} (expected {FORMAT_VERSION}), build them again.")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = self.manifest["version"]
+        self.bbox = tuple(self.manifest["bbox"])
+        self.tile_size = self.manifest["tile_size"]
+        self.keys = {tile["index"]: key for key, tile in self.manifest["tiles"].items()}
+        for name in OVERLAY_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+        self.names = np.load(os.path.join(path, "names.npy")).tolist()
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_time = 0.
+
+    def tile(self, t:int) -> Tile:
+        '''
+        Return a tile, loaded from the disk if it is not in the cache. The least recently
+        used tiles are evicted when the memory budget is exceeded.
+        '''
+        with self._lock:
+            tile = self._tiles.get(t)
+            if tile is not None:
+                self._tiles.move_to_end(t)
+                self.hits += 1
+                return tile
+        dbt = time()
+        with np.load(os.path.join(self.path, self.keys[t] + ".npz")) as data:
+            arrays = {name: data[name] for name in TILE_ARRAYS}
+        tile = Tile(arrays, self, int(self.tile_node_offsets[t]),
+                    int(self.tile_edge_offsets[t]))
+        with self._lock:
+            self.loads += 1
+            self.load_time += time()-dbt
+            if t not in self._tiles:
+                self._tiles[t] = tile
+                self._bytes += tile.nbytes
+            # The tile just loaded is kept even if it exceeds the budget alone
+            while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+        return tile
+
+    def tile_of_node(self, node:int) -> int:
+        '''
+        Return the tile of a node given by its global index.
+        '''
+        return bisect_right(memoryview(self.tile_node_offsets), node) - 1
+
+    def tile_of_edge(self, edge:int) -> int:
+        '''
+        Return the tile of an edge given by its global id.
+        '''
+        return bisect_right(memoryview(self.tile_edge_offsets), edge) - 1
+
+    def tiles_near(self, point:list) -> list:
+        '''
+        Return the tiles around a (lat, lon) point (its tile and the 8 tiles around it), with
+        the distance between the point and each of them (m), the closest first.
+        '''
+        row = math.floor(point[0] / self.tile_size)
+        column = math.floor(point[1] / self.tile_size)
+        tiles = []
+        for key in (f"{row+i}_{column+j}" for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            tile = self.manifest["tiles"].get(key)
+            if tile is None:
+                continue
+            north, south, east, west = tile["bbox"]
+            dlat = max(south - point[0], 0., point[0] - north)
+            dlon = max(west - point[1], 0., point[1] - east) * math.cos(math.radians(point[0]))
+            tiles.append((EARTH_RADIUS * math.radians(math.hypot(dlat, dlon)), tile["index"]))
+        return sorted(tiles)
+
+    def snap(self, points:list, mode:str="node", is_start=True) -> list:
+        '''
+        Snap the points on the graph, on the tile of each point (its ghost nodes and the edges
+        leaving it included) or on a tile around it if its nearest node or edge is closer to
+        that tile.
+        INPUT:
+            - points (list) : (lat, lon) of the points.
+            - mode (str) (default: "node") : snap on the nearest "node" or "edge".
+            - is_start (bool or list) (default: True) : whether each point is the start of a
+                                                        route or its end.
+        OUTPUT:
+            - snapped (list) : SnappedPoint of each point, with the global indexes of the nodes
+                               and the edges, None if the point is too far from the graph.
+        '''
+        is_start = np.broadcast_to(is_start, (len(points),)).tolist()
+        snapped = []
+        for point, start in zip(points, is_start):
+            best, best_tile = MAX_SNAP_DISTANCE, None
+            for distance, t in self.tiles_near(point):
+                if distance > best:
+                    break
+                tile = self.tile(t)
+                if mode == "node":
+                    _, distances = tile.index.nearest_nodes([point])
+                else:
+                    _, _, distances = tile.index.nearest_edges([point])
+                if distances[0] <= best:
+                    best, best_tile = float(distances[0]), tile
+            if best_tile is None:
+                snapped.append(None)
+                continue
+            tile = best_tile
+            local = tile.index.snap([point], mode, start)[0]
+            snapped.append(SnappedPoint([(tile.global_node(node), cost)
+                                         for node, cost in local.seeds], local.point,
+                                        tile.edge_offset + local.edge if local.edge >= 0 else -1,
+                                        local.fraction))
+        return snapped
+
+    def direct_cost(self, start:SnappedPoint, end:SnappedPoint) -> float:
+        '''
+        Return the cost to go directly from start to end when they are on the same segment,
+        else inf (see SpatialIndex.direct_cost).
+        '''
+        if start.edge < 0 or end.edge < 0:
+            return float('inf')
+        t = self.tile_of_edge(start.edge)
+        if self.tile_of_edge(end.edge) != t:
+            return float('inf')
+        tile = self.tile(t)
+        return tile.index.direct_cost(start._replace(edge=start.edge-tile.edge_offset),
+                                      end._replace(edge=end.edge-tile.edge_offset))
+
+    def street_name(self, edge:int) -> str:
+        '''
+        Return the name of the street of an edge given by its global id.
+        '''
+        tile = self.tile(self.tile_of_edge(edge))
+        return tile.edges.street_name(edge - tile.edge_offset)
+
+    def node_point(self, node:int) -> list:
+        '''
+        Return the (lat, lon) of a node given by its global index.
+        '''
+        t = self.tile_of_node(node)
+        tile = self.tile(t)
+        local = node - tile.node_offset
+        return [float(tile.graph.lat[local]), float(tile.graph.lon[local])]
+
+    def shortest_path(self, source, target) -> tuple:
+        '''
+        Dijkstra from source to target across the tiles: the nodes of the tiles of the
+        start and the end are expanded with their edges, the other nodes with the edges of
+        the overlay.
+        INPUT:
+            - source (int or list) : global index of the start node, or its seeds.
+            - target (int or list) : global index of the end node, or its seeds.
+        OUTPUT:
+            - nodes (list) : global indexes of the nodes of the path.
+            - edges (list) : global ids of the edges of the path.
+            - cost (float) : cost of the path.
+            - settled (int) : number of nodes settled by the search.
+        '''
+        starts, ends = seeds(source), dict(seeds(target))
+        sides = {}
+        for node in [node for node, _ in starts] + list(ends):
+            t = self.tile_of_node(node)
+            if t not in sides:
+                tile = self.tile(t)
+                sides[t] = (tile.graph.views(), memoryview(tile.ghost_nodes), tile.n_own,
+                            tile.node_offset, tile.edge_offset)
+        node_offsets = memoryview(self.tile_node_offsets)
+        boundary = memoryview(self.boundary)
+        n_boundary = len(boundary)
+        overlay_offsets = memoryview(self.overlay_offsets)
+        overlay_targets = memoryview(self.overlay_targets)
+        overlay_weights = memoryview(self.overlay_weights)
+        overlay_edges = memoryview(self.overlay_edges)
+
+        inf = float('inf')
+        dist, pred, settled, heap = {}, {}, set(), []
+        for node, cost in starts:
+            if cost < dist.get(node, inf):
+                dist[node] = cost
+                heappush(heap, (cost, node))
+        best, reached = inf, None
+        while heap:
+            d, u = heappop(heap)
+            if d >= best:
+                break
+            if u in settled:
+                continue
+            settled.add(u)
+            if u in ends and d + ends[u] < best:
+                best, reached = d + ends[u], u
+            side = sides.get(bisect_right(node_offsets, u) - 1)
+            if side is not None:
+                (offsets, targets, weights), ghosts, n_own, node_offset, edge_offset = side
+                local = u - node_offset
+                for i in range(offsets[local], offsets[local+1]):
+                    v = targets[i]
+                    v = v + node_offset if v < n_own else ghosts[v - n_own]
+                    nd = d + weights[i]
+                    if nd < dist.get(v, inf):
+                        dist[v] = nd
+                        pred[v] = (u, edge_offset + i)
+                        heappush(heap, (nd, v))
+                continue
+            b = bisect_left(boundary, u)
+            if b == n_boundary or boundary[b] != u:
+                continue
+            for j in range(overlay_offsets[b], overlay_offsets[b+1]):
+                v = overlay_targets[j]
+                nd = d + overlay_weights[j]
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    # The paths inside a tile are kept as -(position in the overlay + 1)
+                    edge = overlay_edges[j]
+                    pred[v] = (u, edge if edge >= 0 else -(j + 1))
+                    heappush(heap, (nd, v))
+
+        if reached is None:
+            raise NoRouteError("Aucun itinéraire n'a été trouvé entre le départ et l'arrivée.")
+        nodes, edges = [reached], []
+        node = reached
+        while node in pred:
+            previous, edge = pred[node]
+            if edge >= 0:
+                edges.append(edge)
+                nodes.append(previous)
+            else:
+                # Path inside a tile between two of its boundary nodes, searched in the tile
+                tile = self.tile(self.tile_of_node(previous))
+                tile_nodes, tile_edges, _, _ = dijkstra(tile.graph, previous - tile.node_offset,
+                                                        node - tile.node_offset)
+                edges.extend(tile.edge_offset + edge for edge in reversed(tile_edges))
+                nodes.extend(tile.node_offset + v for v in reversed(tile_nodes[:-1]))
+            node = previous
+        nodes.reverse()
+        edges.reverse()
+        return nodes, edges, best, len(settled)
+
+    def route(self, edges:list):
+        '''
+        Gather the geometry and the attributes of the edges of a path across the tiles (see
+        EdgeStore.route), tile by tile.
+        '''
+        edges = np.asarray(edges, dtype=np.int64)
+        tiles = np.searchsorted(self.tile_edge_offsets, edges, side="right") - 1
+        breaks = np.flatnonzero(np.diff(tiles)) + 1
+        coordinates, length, estimated_time, streets = [], 0, 0., []
+        for run, t in zip(np.split(edges, breaks), tiles[np.append(0, breaks)].tolist()):
+            tile = self.tile(t)
+            run_coordinates, run_length, start_street, end_street, run_time = \
+                tile.edges.route(run - tile.edge_offset)
+            # The last point of a run is the first point of the next one
+            coordinates.extend(run_coordinates[1:] if coordinates else run_coordinates)
+            length += run_length
+            estimated_time = -1 if run_time < 0 or estimated_time < 0 else \
+                estimated_time + run_time
+            streets.append((start_street, end_street))
+        return coordinates, length, streets[0][0], streets[-1][1], estimated_time
+
+    def stats(self) -> dict:
+        '''
+        Return the counters of the cache of the tiles.
+        '''
+        return {"tiles": len(self.keys),
+                "loaded_tiles": len(self._tiles),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "load_time": self.load_time,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "boundary_nodes": int(len(self.boundary)),
+                "overlay_edges": int(len(self.overlay_edges)),
+                "version": self.version}
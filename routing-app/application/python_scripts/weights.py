@@ -0,0 +1,127 @@
+'''
+Script for the cost of the edges of the bike graph
+'''
+import os
+import numpy as np
+
+# Highways forbidden to bikes
+FORBIDDEN_HIGHWAYS = ["busway", "motorway", "trunk", "motorway_link", "trunk_link"]
+
+# Name of the weight profile given by custom_weight
+DEFAULT_PROFILE = "fastest"
+
+# Maximum speed of the cyclist (km/h)
+MAX_SPEED_KPH = 15
+
+# Time (s) counted for each meter of climb by the least-climb profile, about five times the
+# time needed to climb it, so that the routes avoid the climbs at the cost of some detours
+CLIMB_PENALTY = 30
+
+# Grade (%) above which the climb of an edge counts twice for the least-climb profile
+STEEP_GRADE = 6
+
+# Name of the file of the speeds of a rider profile in the graph folder (see
+# save_rider_speeds)
+RIDER_FILENAME = "rider_{name}.npz"
+
+
+class UnknownProfileError(ValueError):
+    '''
+    Raised when the requested weight profile does not exist or is not available.
+    '''
+
+
+def custom_weight(u, v, data):
+    '''
+    Return the weight of the edge.
+    '''
+    if data[0]["highway"] in FORBIDDEN_HIGHWAYS:
+        return float('inf')
+
+    return data[0]["length"] / (min(data[0]["speed_kph"], MAX_SPEED_KPH) / 3.6)
+
+
+def fastest_weights(weights, edges):
+    '''
+    Return the weights of the fastest profile : the weights of custom_weight, the ones of
+    the graph.
+    '''
+    return weights
+
+def shortest_weights(weights, edges):
+    '''
+    Return the weights of the shortest profile : the travel time at the maximum speed of the
+    cyclist on every edge, proportional to the length of the edge.
+    '''
+    return np.where(np.isinf(weights), np.inf,
+                    edges.lengths / (MAX_SPEED_KPH / 3.6)).astype(np.float32)
+
+def least_climb_weights(weights, edges):
+    '''
+    Return the weights of the least-climb profile : the travel time of the edge with
+    CLIMB_PENALTY seconds for each meter of climb, twice on the edges steeper than
+    STEEP_GRADE. None if the climbs of the edges are unknown (graph without elevation).
+    '''
+    if edges.climbs is None:
+        return None
+    penalty = CLIMB_PENALTY * np.asarray(edges.climbs, dtype=np.float64)
+    if edges.max_grades is not None:
+        penalty *= np.where(np.asarray(edges.max_grades) > STEEP_GRADE, 2, 1)
+    return (weights + penalty).astype(np.float32)
+
+
+# Weight profiles computed from the graph : name -> function giving the weight of every edge
+# from the weights of the graph and the edge store (the arrays are aligned on the edge ids),
+# and maximum speed (km/h) of the profile, giving the lower bounds of the A* searches
+PROFILES = {"fastest": (fastest_weights, MAX_SPEED_KPH),
+            "shortest": (shortest_weights, MAX_SPEED_KPH),
+            "least-climb": (least_climb_weights, MAX_SPEED_KPH)}
+
+
+def rider_weights(weights, edges, speeds) -> tuple:
+    '''
+    Return the weights of a rider profile from the speed of the rider on each edge.
+    The edges without speed keep the weight of the graph.
+    INPUT:
+        - weights (np.ndarray) : weights of the graph.
+        - edges (EdgeStore) : the geometry and the attributes of the edges.
+        - speeds (np.ndarray) : speed of the rider on each edge (km/h), nan if unknown.
+    OUTPUT:
+        - weights (np.ndarray) : weight of each edge (float32).
+        - max_speed_kph (float) : maximum speed of the profile (km/h).
+    '''
+    known = np.isfinite(speeds) & (speeds > 0)
+    rider = np.where(known, edges.lengths / (np.where(known, speeds, 1) / 3.6), weights)
+    rider[np.isinf(weights)] = np.inf
+    max_speed = float(speeds[known].max()) if known.any() else MAX_SPEED_KPH
+    if not known.all():
+        max_speed = max(max_speed, MAX_SPEED_KPH)
+    return rider.astype(np.float32), max_speed
+
+def save_rider_speeds(graph_dir:str, name:str, fingerprint:str, speeds) -> str:
+    '''
+    Save the speeds of a rider on each edge of the graph, loaded as the weight profile name
+    (see GraphStore.load_profiles), and return the path of the file.
+    INPUT:
+        - graph_dir (str) : the graph folder.
+        - name (str) : name of the profile.
+        - fingerprint (str) : fingerprint of the graph of the speeds.
+        - speeds (np.ndarray) : speed of the rider on each edge (km/h), nan if unknown.
+    '''
+    if name in PROFILES:
+        raise UnknownProfileError(f"Le profil {name} n'est pas un profil de cycliste.")
+    path = os.path.join(graph_dir, RIDER_FILENAME.format(name=name))
+    np.savez(path, name=np.array(name), fingerprint=np.array(fingerprint),
+             speeds=np.asarray(speeds, dtype=np.float32))
+    return path
+
+def load_rider_speeds(path:str) -> tuple:
+    '''
+    Load the speeds saved with save_rider_speeds.
+    OUTPUT:
+        - name (str) : name of the profile.
+        - fingerprint (str) : fingerprint of the graph of the speeds.
+        - speeds (np.ndarray) : speed of the rider on each edge (km/h).
+    '''
+    with np.load(path) as data:
+        return str(data["name"]), str(data["fingerprint"]), data["speeds"]
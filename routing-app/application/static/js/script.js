@@ -76,6 +76,29 @@ const updateRoadCalculationButton = () => {
     }
 }
 
+// Décodage d'une polyline encodée (format de l'API Google Maps, précision 1e-5) en
+// coordonnées [lon, lat]
+const decodePolyline = (polyline) => {
+    var coordinates = [];
+    var index = 0, lat = 0, lon = 0;
+    while (index < polyline.length) {
+        var deltas = [];
+        for (var k = 0; k < 2; k++) {
+            var result = 0, shift = 0, chunk;
+            do {
+                chunk = polyline.charCodeAt(index++) - 63;
+                result += (chunk & 31) * Math.pow(2, shift);
+                shift += 5;
+            } while (chunk >= 32);
+            deltas.push(result % 2 === 1 ? -(result + 1) / 2 : result / 2);
+        }
+        lat += deltas[0];
+        lon += deltas[1];
+        coordinates.push([lon / 1e5, lat / 1e5]);
+    }
+    return coordinates;
+}
+
 function updateCounter(message) {
     // Display 'message' on the page
     document.getElementById("countdown").textContent = message;
@@ -96,7 +119,10 @@ document.getElementById("calculate_road").addEventListener("click", function(){
         },
         body: JSON.stringify({
             start : start,
-            end : end
+            end : end,
+            // Tracé en polyline encodée, simplifié au zoom de la carte
+            format : "polyline",
+            zoom : map.getZoom()
         }) // Convertit le dictionnaire en JSON
     })
     .then(response => response.text())
@@ -107,10 +133,15 @@ document.getElementById("calculate_road").addEventListener("click", function(){
         console.log(res)
         // Cacher le loader
         document.getElementById("loader").style.display = "none";
+        // Afficher l'erreur éventuelle (point en dehors de la zone couverte, ...)
+        if (res["error"] !== undefined){
+            alert(res["error"]);
+            return;
+        }
         // Afficher le tracé de la route
         var myLines = {
             "type": "LineString",
-            "coordinates": res["coordinates"]
+            "coordinates": decodePolyline(res["polyline"])
         };
         
         var myStyle = {
@@ -0,0 +1,33 @@
+'''
+Configuration of gunicorn, to run the app with many worker processes :
+gunicorn -c gunicorn.conf.py "application:create_app()"
+'''
+import os
+
+from application.python_scripts.memory import process_memory
+
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+# Threads of the requests of each worker: they wait for the pool computing the routes (see
+# route_pool), so a slow route does not block the other requests of the worker
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", 8))
+
+# The app (and the graph) is loaded once in the master process, before the workers are
+# forked: the arrays mapped from the snapshot and the structures built at startup are
+# shared by all the workers, instead of one copy per worker
+preload_app = True
+os.environ.setdefault("FLASK_WARM_UP", "true")
+
+# A request of the bounded searches (alternatives, isochrone) can take a few seconds
+timeout = 60
+
+
+def post_worker_init(worker):
+    '''
+    Print the memory of each worker once started.
+    '''
+    memory = process_memory()
+    worker.log.info(f"Mémoire du worker {memory['pid']} : RSS {memory['rss']:.1f} Mo,"
+                    f" PSS {memory['pss']:.1f} Mo, partagée {memory['shared']:.1f} Mo,"
+                    f" privée {memory['private']:.1f} Mo")
@@ -0,0 +1,87 @@
+'''
+Fixtures of the tests: a small grid of streets imported from an OSM extract and the resident
+store built on it
+'''
+import numpy as np
+import pytest
+
+from application.python_scripts import graph_store, route_cache
+from application.python_scripts.contraction import build_hierarchy
+from application.python_scripts.osm_import import import_osm
+
+# Size of the grid (nodes per side) and distance between two nodes (degrees)
+GRID_SIZE = 20
+GRID_STEP = 0.001
+
+# Corner of the grid (lat, lon)
+GRID_ORIGIN = (48.85, 2.30)
+
+# Kinds of ways of the grid and their maxspeed (km/h), some below the speed of the cyclist
+HIGHWAYS = {"residential": 30, "cycleway": 12, "primary": 50, "living_street": 8}
+
+
+def write_grid(path:str, seed:int=0):
+    '''
+    Write a grid of streets of random kinds and slightly moved nodes as an OSM extract.
+    '''
+    rng = np.random.default_rng(seed)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    for i in range(GRID_SIZE):
+        for j in range(GRID_SIZE):
+            lat = GRID_ORIGIN[0] + i * GRID_STEP + rng.uniform(-0.2, 0.2) * GRID_STEP
+            lon = GRID_ORIGIN[1] + j * GRID_STEP + rng.uniform(-0.2, 0.2) * GRID_STEP
+            lines.append(f'  <node id="{1 + i * GRID_SIZE + j}" lat="{lat}" lon="{lon}"/>')
+    way_id = 1
+    for i in range(GRID_SIZE):
+        for j in range(GRID_SIZE):
+            node = 1 + i * GRID_SIZE + j
+            for other in ([node + 1] if j + 1 < GRID_SIZE else []) \
+                    + ([node + GRID_SIZE] if i + 1 < GRID_SIZE else []):
+                highway = list(HIGHWAYS)[rng.integers(len(HIGHWAYS))]
+                lines += [f'  <way id="{way_id}">', f'    <nd ref="{node}"/>',
+                          f'    <nd ref="{other}"/>', f'    <tag k="highway" v="{highway}"/>',
+                          f'    <tag k="maxspeed" v="{HIGHWAYS[highway]}"/>', '  </way>']
+                way_id += 1
+    lines.append('</osm>')
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines))
+
+
+def grid_center() -> tuple:
+    '''
+    Return the (lat, lon) of the center of the grid.
+    '''
+    return (GRID_ORIGIN[0] + GRID_SIZE / 2 * GRID_STEP, GRID_ORIGIN[1] + GRID_SIZE / 2 * GRID_STEP)
+
+
+@pytest.fixture(scope="session")
+def grid_path(tmp_path_factory) -> str:
+    '''
+    Path of the OSM extract of the grid.
+    '''
+    path = str(tmp_path_factory.mktemp("grid") / "grid.osm")
+    write_grid(path)
+    return path
+
+
+@pytest.fixture
+def grid(grid_path) -> tuple:
+    '''
+    Graph, edge store and bbox of the grid, imported again for each test.
+    '''
+    graph, edges, bbox, _ = import_osm(grid_path, verbose=False)
+    return graph, edges, bbox
+
+
+@pytest.fixture
+def store(grid, monkeypatch):
+    '''
+    Resident store of the grid with its weight profiles and contraction hierarchy, used by
+    the app with an empty route cache.
+    '''
+    store = graph_store.GraphStore(*grid)
+    store.load_profiles()
+    store.ch = build_hierarchy(store.graph, verbose=False)
+    monkeypatch.setattr(graph_store, "_STORE", store)
+    monkeypatch.setattr(route_cache, "_CACHE", route_cache.RouteCache())
+    return store
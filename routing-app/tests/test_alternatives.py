@@ -0,0 +1,66 @@
+'''
+Tests of the alternative routes and of the validation of the requests of routes
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts import graph_store, routing
+from application.python_scripts.alternatives import (MAX_ALTERNATIVES, MAX_OVERLAP, MAX_STRETCH,
+                                                     alternative_routes)
+from application.python_scripts.search import NoRouteError, dijkstra
+
+from conftest import grid_center
+
+
+def test_alternatives_are_valid_routes(grid):
+    graph, edges, _ = grid
+    rng = np.random.default_rng(0)
+    found = 0
+    for source, target in rng.integers(0, graph.n_nodes, size=(50, 2)).tolist():
+        try:
+            _, best_edges, best_cost, _ = dijkstra(graph, source, target)
+        except NoRouteError:
+            continue
+        alternatives = alternative_routes(graph, source, target, best_edges, best_cost,
+                                          edges.lengths)
+        assert len(alternatives) <= MAX_ALTERNATIVES
+        found += len(alternatives)
+        for nodes, path_edges, cost, overlap in alternatives:
+            assert nodes[0] == source and nodes[-1] == target
+            assert len(set(nodes)) == len(nodes)
+            assert [graph.edge_source(edge) for edge in path_edges] == nodes[:-1]
+            assert graph.targets[path_edges].tolist() == nodes[1:]
+            assert math.isclose(cost, float(graph.weights[path_edges].sum()), rel_tol=1e-4)
+            assert best_cost * (1 - 1e-6) <= cost <= MAX_STRETCH * best_cost * (1 + 1e-6)
+            assert overlap <= MAX_OVERLAP
+    assert found
+
+
+def test_alternatives_of_get_routing(store):
+    center = list(grid_center())
+    route = routing.get_routing([center[0] - 0.006, center[1] - 0.006],
+                                [center[0] + 0.006, center[1] + 0.006], alternatives=10)
+    assert len(route["alternatives"]) <= MAX_ALTERNATIVES
+    for alternative in route["alternatives"]:
+        assert alternative["estimated_time"] >= route["estimated_time"] * (1 - 1e-6)
+        assert 0 <= alternative["overlap"] <= MAX_OVERLAP
+
+
+@pytest.mark.parametrize("alternatives", ["x", [1], float("inf")])
+def test_invalid_alternatives_are_refused(store, alternatives):
+    center = list(grid_center())
+    with pytest.raises(routing.InvalidAlternativesError):
+        routing.get_routing(center, center, alternatives=alternatives)
+
+
+@pytest.mark.parametrize("point", [None, [], [48.86], ["48.86", "2.31"], [True, 2.31],
+                                   [float("nan"), 2.31], "48.86,2.31"])
+def test_invalid_points_are_refused(store, point):
+    center = list(grid_center())
+    with pytest.raises(graph_store.InvalidPointError):
+        routing.get_routing(point, center)
+    with pytest.raises(graph_store.InvalidPointError):
+        routing.get_routing(center, point)
+    with pytest.raises(graph_store.InvalidPointError):
+        routing.matrix([center, point], [center])
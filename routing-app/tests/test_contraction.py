@@ -0,0 +1,78 @@
+'''
+Tests of the contraction hierarchy against Dijkstra
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts.contraction import (ContractionHierarchy, build_hierarchy,
+                                                    ch_query, check_hierarchy, customize)
+from application.python_scripts.search import NoRouteError, dijkstra
+
+
+@pytest.fixture
+def hierarchy(grid):
+    '''
+    Graph of the grid and its contraction hierarchy.
+    '''
+    graph = grid[0]
+    return graph, build_hierarchy(graph, verbose=False)
+
+
+def test_ch_matches_dijkstra(hierarchy):
+    graph, ch = hierarchy
+    rng = np.random.default_rng(0)
+    for source, target in rng.integers(0, graph.n_nodes, size=(200, 2)).tolist():
+        try:
+            expected = dijkstra(graph, source, target)[2]
+        except NoRouteError:
+            with pytest.raises(NoRouteError):
+                ch_query(ch, graph, source, target)
+            continue
+        nodes, edges, cost, _ = ch_query(ch, graph, source, target)
+        assert math.isclose(cost, expected, rel_tol=1e-4)
+        # The unpacked path is a path of the graph of this cost
+        assert nodes[0] == source and nodes[-1] == target
+        assert [graph.edge_source(edge) for edge in edges] == nodes[:-1]
+        assert math.isclose(float(graph.weights[edges].sum()), cost, rel_tol=1e-4)
+
+
+def test_check_hierarchy(hierarchy):
+    graph, ch = hierarchy
+    stats = check_hierarchy(ch, graph, n_pairs=50)
+    assert stats["wrong_cost"] == 0
+    assert ch.n_shortcuts > 0
+
+
+def test_saved_hierarchy(hierarchy, tmp_path):
+    graph, ch = hierarchy
+    path = str(tmp_path / "ch.npz")
+    ch.save(path)
+    loaded = ContractionHierarchy.load(path)
+    assert loaded.fingerprint == graph.fingerprint()
+    for name in ContractionHierarchy.ARRAYS:
+        assert np.array_equal(getattr(loaded, name), getattr(ch, name))
+
+
+def test_customize_copy(hierarchy):
+    graph, ch = hierarchy
+    edges = np.arange(0, graph.n_edges, 7)
+    slower = graph.updated(edges, graph.weights[edges] * 2)
+    customized = ch.customizable()
+    assert customize(customized, slower, edges) > 0
+    # The hierarchy of the queries is not changed
+    assert np.array_equal(ch.edge_weights, build_hierarchy(graph, verbose=False).edge_weights)
+    # Twice slower weights on every edge keep the witnesses, the costs stay exact
+    doubled = graph.updated(np.arange(graph.n_edges), graph.weights * 2)
+    customize(customized, doubled, np.arange(graph.n_edges))
+    rng = np.random.default_rng(1)
+    for source, target in rng.integers(0, graph.n_nodes, size=(50, 2)).tolist():
+        try:
+            expected = dijkstra(graph, source, target)[2]
+        except NoRouteError:
+            continue
+        assert math.isclose(ch_query(customized, doubled, source, target)[2], 2 * expected,
+                            rel_tol=1e-4)
+    # Back to the weights of the hierarchy
+    customize(customized, graph, np.arange(graph.n_edges))
+    assert np.allclose(customized.edge_weights, ch.edge_weights, rtol=1e-6)
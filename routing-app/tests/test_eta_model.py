@@ -0,0 +1,92 @@
+'''
+Tests of the ETA model: prediction, serialization and learning on synthetic tracks
+'''
+import json
+import math
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+
+from application.python_scripts import eta_model
+from application.python_scripts.eta_model import DEFAULT_COEFFICIENTS, FEATURES, \
+    MIN_TURN_ANGLE, SIGNAL_DELAY, ETAModel, fit_eta_model, route_features, track_intervals
+
+# Coefficients of the tracks of the tests (s per unit of each learned feature)
+TRUE_COEFFICIENTS = np.array([0.2, 3., -0.5, 8.])
+
+
+def write_track(path:str, seed:int, count:int=200):
+    '''
+    Write a track whose durations follow TRUE_COEFFICIENTS exactly.
+    '''
+    rng = np.random.default_rng(seed)
+    lengths = rng.uniform(10, 60, count - 1)
+    slopes = rng.uniform(-6, 6, count)
+    turns = np.where(rng.random(count) < 0.2, rng.uniform(-180, 180, count), 0.)
+    rises = lengths * (slopes[1:] + slopes[:-1]) / 200
+    turned = np.abs(turns[1:])
+    features = np.column_stack((lengths, np.maximum(rises, 0), np.maximum(-rises, 0),
+                                np.where(turned >= MIN_TURN_ANGLE, turned, 0) / 180))
+    times = np.concatenate(([0.], np.cumsum(features @ TRUE_COEFFICIENTS)))
+    distances = np.concatenate(([0.], np.cumsum(lengths)))
+    start = datetime(2024, 5, 1, 8)
+    points = {str(i): {"time": (start + timedelta(seconds=float(times[i]))).isoformat(),
+                       "cumulated_dist": float(distances[i]), "slope": float(slopes[i]),
+                       "turns": float(turns[i])} for i in range(count)}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(points, file)
+
+
+def test_predict():
+    model = ETAModel(DEFAULT_COEFFICIENTS)
+    lengths, grades = [100., 200.], [0., -5.]
+    # 300 m at 15 km/h, a U-turn and a sharp turn not counted, one signal
+    eta = model.predict(lengths, grades, [180., MIN_TURN_ANGLE / 2], [0, 1])
+    assert math.isclose(eta, 300 * 3.6 / 15 + SIGNAL_DELAY)
+    features = route_features(lengths, [4., -5.], [180., -90.], [0, 1])
+    assert np.allclose(features, [300., 4., 10., 1.5, 1.])
+
+
+def test_save_and_load(tmp_path):
+    model = ETAModel([0.2, 3., 0.5, 8., 12.], intercept=5.)
+    path = str(tmp_path / "eta_model.npz")
+    model.save(path)
+    loaded = ETAModel.load(path)
+    assert np.array_equal(loaded.coefficients, model.coefficients)
+    assert loaded.intercept == model.intercept and loaded.version == model.version
+    assert ETAModel([0.2, 3., 0.5, 8., 12.]).version != model.version
+
+
+def test_load_other_features(tmp_path):
+    path = str(tmp_path / "eta_model.npz")
+    np.savez(path, features=np.array(FEATURES[:-1]), coefficients=np.ones(len(FEATURES) - 1),
+             intercept=np.array(0.))
+    with pytest.raises(ValueError):
+        ETAModel.load(path)
+
+
+def test_fit_on_tracks(tmp_path):
+    paths = []
+    for seed in range(5):
+        paths.append(str(tmp_path / f"track_{seed}.json"))
+        write_track(paths[-1], seed)
+    features, durations = track_intervals(paths[0])
+    assert features.shape == (199, len(FEATURES)) and len(durations) == 199
+    model, stats = fit_eta_model(paths)
+    assert np.allclose(model.coefficients[:-1], TRUE_COEFFICIENTS, rtol=1e-3, atol=1e-3)
+    assert model.coefficients[-1] == SIGNAL_DELAY
+    assert stats["tracks"] == 5 and stats["intervals"] == 5 * 199
+    assert stats["median_error"] < 1e-3
+
+
+def test_fit_without_points(tmp_path):
+    path = str(tmp_path / "track.json")
+    write_track(path, 0, count=1)
+    with pytest.raises(ValueError):
+        fit_eta_model([path])
+
+
+def test_missing_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(eta_model, "_MODEL", None)
+    assert eta_model.load_eta_model(str(tmp_path / "eta_model.npz")) is None
+    assert eta_model.get_eta_model() is None
@@ -0,0 +1,46 @@
+'''
+Tests of the isochrones: the reachable nodes and the area covering them
+'''
+import numpy as np
+import pytest
+from shapely.geometry import Point, shape
+
+from application.python_scripts import routing
+from application.python_scripts.isochrone import (MAX_ISOCHRONE_MINUTES, IsochroneError,
+                                                  isochrone)
+from application.python_scripts.search import single_source
+
+from conftest import grid_center
+
+# Largest distance between a reachable node and the area (degrees), about the tolerance of
+# the simplification of the polygon
+AREA_TOLERANCE = 0.0006
+
+
+@pytest.mark.parametrize("budget", [60., 180., 600.])
+def test_isochrone_covers_the_reachable_nodes(store, budget):
+    graph = store.graph
+    source = graph.n_nodes // 2
+    polygon, n_nodes = isochrone(store.index, source, budget)
+    costs, _ = single_source(graph, source)
+    reachable = [node for node, cost in costs.items() if cost <= budget]
+    assert n_nodes == len(reachable)
+    area = shape(polygon)
+    for node in reachable:
+        point = Point(float(graph.lon[node]), float(graph.lat[node]))
+        assert area.distance(point) <= AREA_TOLERANCE
+    # The area grows with the budget
+    assert area.area <= shape(isochrone(store.index, source, 2 * budget)[0]).area
+
+
+def test_get_isochrone(store):
+    feature = routing.get_isochrone(list(grid_center()), 5)
+    assert feature["type"] == "Feature"
+    assert feature["properties"]["minutes"] == 5
+    assert shape(feature["geometry"]).contains(Point(grid_center()[::-1]))
+
+
+@pytest.mark.parametrize("minutes", [None, "x", 0, -1, MAX_ISOCHRONE_MINUTES + 1])
+def test_invalid_minutes_are_refused(store, minutes):
+    with pytest.raises(IsochroneError):
+        routing.get_isochrone(list(grid_center()), minutes)
@@ -0,0 +1,54 @@
+'''
+Tests of the landmarks and of the ALT engine against Dijkstra
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts import routing
+from application.python_scripts.landmarks import build_landmarks
+from application.python_scripts.search import NoRouteError, dijkstra, single_source
+
+
+@pytest.fixture
+def landmarks(store):
+    '''
+    Landmarks of the fastest profile of the grid, used by the ALT engine.
+    '''
+    store.landmarks["fastest"] = build_landmarks(store.graph, n_landmarks=4)
+    return store.landmarks["fastest"]
+
+
+def test_tables_are_exact_costs(store, landmarks):
+    reverse = store.graph.reverse()
+    for k, node in enumerate(landmarks.nodes.tolist()):
+        forward, _ = single_source(store.graph, node)
+        backward, _ = single_source(reverse, node)
+        for v in range(store.graph.n_nodes):
+            assert math.isclose(landmarks.forward[v, k], forward.get(v, math.inf), rel_tol=1e-5)
+            assert math.isclose(landmarks.backward[v, k], backward.get(v, math.inf),
+                                rel_tol=1e-5)
+
+
+def test_bounds_are_admissible(store, landmarks):
+    graph = store.graph
+    rng = np.random.default_rng(0)
+    for target in rng.integers(0, graph.n_nodes, size=10).tolist():
+        bound = landmarks.bound_to(target)
+        costs, _ = single_source(graph.reverse(), target)
+        for v, cost in costs.items():
+            assert bound(v) <= cost * (1 + 1e-5) + 1e-3
+
+
+def test_alt_matches_dijkstra(store, landmarks):
+    graph = store.graph
+    rng = np.random.default_rng(1)
+    for source, target in rng.integers(0, graph.n_nodes, size=(100, 2)).tolist():
+        try:
+            expected = dijkstra(graph, source, target)[2]
+        except NoRouteError:
+            with pytest.raises(NoRouteError):
+                routing.shortest_path(store, source, target, engine="alt")
+            continue
+        cost = routing.shortest_path(store, source, target, engine="alt")[2]
+        assert math.isclose(cost, expected, rel_tol=1e-4)
@@ -0,0 +1,60 @@
+'''
+Tests of the travel time matrices against Dijkstra and the routes
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts import routing
+from application.python_scripts.contraction import build_hierarchy
+from application.python_scripts.matrix import (MAX_MATRIX_CELLS, MatrixTooLargeError,
+                                               travel_time_matrix)
+from application.python_scripts.search import NoRouteError, dijkstra
+
+from conftest import GRID_ORIGIN, GRID_SIZE, GRID_STEP
+
+
+def expected_cost(graph, source, target) -> float:
+    '''
+    Return the cost of the Dijkstra path, inf if there is none.
+    '''
+    try:
+        return dijkstra(graph, source, target)[2]
+    except NoRouteError:
+        return float('inf')
+
+
+@pytest.mark.parametrize("with_ch", [False, True])
+def test_matrix_matches_dijkstra(grid, with_ch):
+    graph = grid[0]
+    ch = build_hierarchy(graph, verbose=False) if with_ch else None
+    nodes = np.random.default_rng(0).integers(0, graph.n_nodes, size=30).tolist()
+    # Origins with the seeds of a virtual node too
+    sources = nodes[:15] + [[(nodes[0], 10.), (nodes[1], 20.)]]
+    costs = travel_time_matrix(graph, sources, nodes[15:], ch)
+    assert costs.shape == (16, 15)
+    for i, source in enumerate(sources):
+        for j, target in enumerate(nodes[15:]):
+            expected = expected_cost(graph, source, target)
+            assert math.isclose(costs[i, j], expected, rel_tol=1e-4) or costs[i, j] == expected
+
+
+def test_matrix_size_is_limited(grid):
+    with pytest.raises(MatrixTooLargeError):
+        travel_time_matrix(grid[0], [0] * (MAX_MATRIX_CELLS // 10 + 1), [0] * 10)
+
+
+@pytest.mark.parametrize("snap", ["node", "edge"])
+def test_matrix_matches_the_routes(store, snap):
+    rng = np.random.default_rng(1)
+    points = np.column_stack((GRID_ORIGIN[0] + rng.uniform(0, GRID_SIZE * GRID_STEP, 8),
+                              GRID_ORIGIN[1] + rng.uniform(0, GRID_SIZE * GRID_STEP, 8))).tolist()
+    durations = routing.matrix(points[:4], points[4:], snap)
+    for i, origin in enumerate(points[:4]):
+        for j, destination in enumerate(points[4:]):
+            try:
+                route = routing.get_routing(origin, destination, "dijkstra", snap)
+            except NoRouteError:
+                assert math.isinf(durations[i, j])
+                continue
+            assert math.isclose(durations[i, j], route["estimated_time"], rel_tol=1e-4)
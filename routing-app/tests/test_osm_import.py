@@ -0,0 +1,100 @@
+'''
+Tests of the import of the bike graph from an OSM extract, on the grid and on small extracts
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts.osm_import import EARTH_RADIUS, import_osm, parse_maxspeed
+from application.python_scripts.weights import MAX_SPEED_KPH
+
+from conftest import GRID_ORIGIN, GRID_SIZE, GRID_STEP
+
+
+def write_extract(path:str, nodes:list, ways:list):
+    '''
+    Write an OSM extract of nodes (id, lat, lon) and ways (id, refs, tags).
+    '''
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    lines += [f'  <node id="{node_id}" lat="{lat}" lon="{lon}"/>' for node_id, lat, lon in nodes]
+    for way_id, refs, tags in ways:
+        lines.append(f'  <way id="{way_id}">')
+        lines += [f'    <nd ref="{ref}"/>' for ref in refs]
+        lines += [f'    <tag k="{key}" v="{value}"/>' for key, value in tags.items()]
+        lines.append('  </way>')
+    lines.append('</osm>')
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines))
+
+
+@pytest.mark.parametrize("value, speed", [("30", 30), ("20 mph", 20 * 1.609344),
+                                          ("30;50", 40), ("12,5", 12.5)])
+def test_parse_maxspeed(value, speed):
+    assert math.isclose(parse_maxspeed(value), speed)
+
+
+def test_parse_maxspeed_without_number():
+    assert math.isnan(parse_maxspeed("FR:urban"))
+
+
+def test_import_grid(grid):
+    graph, edges, bbox = grid
+    assert graph.n_nodes == GRID_SIZE**2
+    # Every street of the grid in both directions
+    assert graph.n_edges == 2 * 2 * GRID_SIZE * (GRID_SIZE - 1)
+    sources = np.repeat(np.arange(graph.n_nodes), np.diff(graph.offsets))
+    pairs = set(zip(sources.tolist(), graph.targets.tolist()))
+    assert all((target, source) in pairs for source, target in pairs)
+    north, south, east, west = bbox
+    assert south <= graph.lat.min() and graph.lat.max() <= north
+    assert west <= graph.lon.min() and graph.lon.max() <= east
+
+
+def test_lengths_and_weights(grid):
+    graph, edges, _ = grid
+    sources = np.repeat(np.arange(graph.n_nodes), np.diff(graph.offsets))
+    for edge in range(0, graph.n_edges, 37):
+        u, v = sources[edge], graph.targets[edge]
+        lat_u, lon_u = math.radians(graph.lat[u]), math.radians(graph.lon[u])
+        lat_v, lon_v = math.radians(graph.lat[v]), math.radians(graph.lon[v])
+        a = math.sin((lat_v - lat_u) / 2)**2 \
+            + math.cos(lat_u) * math.cos(lat_v) * math.sin((lon_v - lon_u) / 2)**2
+        length = 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+        assert math.isclose(edges.lengths[edge], length, rel_tol=1e-5)
+        speed = min(float(edges.speeds[edge]), MAX_SPEED_KPH)
+        assert math.isclose(graph.weights[edge], length / (speed / 3.6), rel_tol=1e-5)
+
+
+def test_bbox_keeps_the_nodes_inside(grid_path):
+    half = GRID_SIZE // 2 * GRID_STEP
+    bbox = (GRID_ORIGIN[0] + half, GRID_ORIGIN[0] - GRID_STEP, GRID_ORIGIN[1] + half,
+            GRID_ORIGIN[1] - GRID_STEP)
+    graph, _, kept_bbox, _ = import_osm(grid_path, bbox=bbox, verbose=False)
+    assert 0 < graph.n_nodes < GRID_SIZE**2
+    assert graph.lat.max() <= bbox[0] and graph.lon.max() <= bbox[2]
+    assert kept_bbox == bbox
+
+
+def test_empty_bbox_is_refused(grid_path):
+    bbox = (GRID_ORIGIN[0] - 1, GRID_ORIGIN[0] - 2, GRID_ORIGIN[1] - 1, GRID_ORIGIN[1] - 2)
+    with pytest.raises(ValueError):
+        import_osm(grid_path, bbox=bbox, verbose=False)
+
+
+def test_ways_and_components(tmp_path):
+    path = str(tmp_path / "extract.osm")
+    nodes = [(node_id, 48.85 + 0.001 * node_id, 2.30) for node_id in range(1, 8)]
+    write_extract(path, nodes, [
+        (1, [1, 2, 3], {"highway": "residential", "oneway": "yes"}),
+        (2, [3, 4], {"highway": "cycleway"}),
+        # Forbidden to bikes, dropped
+        (3, [4, 5], {"highway": "footway"}),
+        (4, [5, 6], {"highway": "residential", "bicycle": "no"}),
+        # Another component, smaller
+        (5, [6, 7], {"highway": "residential"})])
+    graph, edges, _, _ = import_osm(path, verbose=False)
+    assert graph.node_ids.tolist() == [1, 2, 3, 4]
+    # 1 -> 2 -> 3 one way, 3 <-> 4 both ways
+    assert graph.n_edges == 4
+    graph, _, _, _ = import_osm(path, largest_component=False, verbose=False)
+    assert graph.node_ids.tolist() == [1, 2, 3, 4, 6, 7]
@@ -0,0 +1,116 @@
+'''
+Tests of the routes while overrides of the weights are active, on a small grid imported
+from an OSM extract
+'''
+import math
+import threading
+import numpy as np
+import pytest
+
+from application.python_scripts import overrides, routing
+from application.python_scripts.search import NoRouteError, dijkstra
+
+from conftest import GRID_STEP, grid_center
+
+
+@pytest.fixture
+def store(store, monkeypatch):
+    '''
+    Resident store of the grid with a closure in its middle.
+    '''
+    monkeypatch.setattr(overrides, "_OVERRIDES", overrides.WeightOverrides(store))
+    center = grid_center()
+    overrides.get_overrides().add(bbox=[center[0] + 2 * GRID_STEP, center[0] - 2 * GRID_STEP,
+                                        center[1] + 2 * GRID_STEP, center[1] - 2 * GRID_STEP])
+    return store
+
+
+def closure_id() -> str:
+    '''
+    Return the id of the closure of the store fixture.
+    '''
+    return next(iter(overrides.get_overrides().overrides))
+
+
+def test_hierarchy_used_with_overrides(store):
+    assert "ch" in routing.available_engines(store)
+    assert routing.default_engine(store) == "ch"
+    assert store.overridden_ch is not None
+    assert np.isinf(store.overridden_ch.edge_weights).any()
+    assert not np.isinf(store.ch.edge_weights).any()
+
+
+def test_removed_overrides_restore_the_graph(store):
+    original = overrides.get_overrides()._original
+    overridden = store.graph
+    overrides.get_overrides().remove(closure_id())
+    assert store.graph is original["fastest"] and store.profiles == original
+    assert store.overridden_ch is None
+    assert store.version == overrides.get_overrides().base_version
+    assert np.isinf(overridden.weights).sum() > np.isinf(store.graph.weights).sum()
+
+
+def test_snapshot_keeps_its_weights(store):
+    snapshot = store.snapshot()
+    overrides.get_overrides().remove(closure_id())
+    assert snapshot.version != store.version
+    assert snapshot.graph is not store.graph and snapshot.overridden_ch is not None
+    assert np.isinf(snapshot.graph.weights).sum() > np.isinf(store.graph.weights).sum()
+    assert np.array_equal(snapshot.graph.reverse().weights[np.argsort(
+        snapshot.graph.reverse().edge_ids)], snapshot.graph.weights)
+
+
+def test_routes_consistent_while_overrides_change(store):
+    done = threading.Event()
+
+    def toggle():
+        active = overrides.get_overrides()
+        while not done.is_set():
+            override = active.overrides[closure_id()]
+            active.remove(override["id"])
+            active.add(bbox=override["bbox"], override_id=override["id"])
+
+    thread = threading.Thread(target=toggle)
+    thread.start()
+    try:
+        rng = np.random.default_rng(3)
+        for source, target in rng.integers(0, store.graph.n_nodes, size=(100, 2)).tolist():
+            snapshot = store.snapshot()
+            try:
+                expected = dijkstra(snapshot.graph, source, target)[2]
+            except NoRouteError:
+                continue
+            cost = routing.shortest_path(snapshot, source, target)[2]
+            assert math.isclose(cost, expected, rel_tol=1e-4)
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_default_engine_matches_dijkstra_with_overrides(store):
+    graph = store.graph
+    rng = np.random.default_rng(1)
+    for source, target in rng.integers(0, graph.n_nodes, size=(200, 2)).tolist():
+        try:
+            expected = dijkstra(graph, source, target)[2]
+        except NoRouteError:
+            with pytest.raises(NoRouteError):
+                routing.shortest_path(store, source, target)
+            continue
+        cost = routing.shortest_path(store, source, target)[2]
+        assert math.isclose(cost, expected, rel_tol=1e-4)
+
+
+def test_matrix_matches_dijkstra_with_overrides(store):
+    graph = store.graph
+    nodes = np.random.default_rng(2).integers(0, graph.n_nodes, size=20)
+    points = np.column_stack((graph.lat[nodes], graph.lon[nodes])).tolist()
+    durations = routing.matrix(points[:10], points[10:])
+    for i, source in enumerate(nodes[:10].tolist()):
+        for j, target in enumerate(nodes[10:].tolist()):
+            try:
+                expected = dijkstra(graph, source, target)[2]
+            except NoRouteError:
+                expected = float('inf')
+            assert math.isclose(durations[i, j], expected, rel_tol=1e-4) \
+                or durations[i, j] == expected
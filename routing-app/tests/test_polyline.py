@@ -0,0 +1,92 @@
+'''
+Tests of the compact geometry of the routes: encoded polylines and Douglas-Peucker
+simplification
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts.polyline import EARTH_RADIUS, UnknownFormatError, \
+    check_format, compact_route, decode, encode, simplify, zoom_tolerance
+
+
+def random_line(count:int, seed:int=0) -> np.ndarray:
+    '''
+    Return a random walk of [lon, lat] points of about 10 m steps.
+    '''
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 1e-4, size=(count, 2))
+    return np.array([2.35, 48.85]) + np.cumsum(steps, axis=0)
+
+
+def test_encode_reference():
+    # Example of the documentation of the format
+    coordinates = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert encode(coordinates) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert np.allclose(decode("_p~iF~ps|U_ulLnnqC_mqNvxq`@"), coordinates)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_round_trip(seed):
+    rng = np.random.default_rng(seed)
+    coordinates = np.column_stack((rng.uniform(-180, 180, 100), rng.uniform(-90, 90, 100)))
+    decoded = np.array(decode(encode(coordinates)))
+    assert decoded.shape == coordinates.shape
+    assert np.abs(decoded - coordinates).max() <= 0.5e-5 + 1e-9
+
+
+def test_empty_line():
+    assert encode([]) == ""
+    assert decode("") == []
+
+
+@pytest.mark.parametrize("tolerance", [1., 5., 20.])
+def test_simplify_within_tolerance(tolerance):
+    points = random_line(500)
+    kept = simplify(points, tolerance)
+    assert kept[0] == 0 and kept[-1] == len(points) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert len(kept) < len(points)
+    lat0 = math.radians(float(points[:, 1].mean()))
+    xy = EARTH_RADIUS * np.radians(points) * np.array([math.cos(lat0), 1.])
+    # Every dropped point is close to the segment of the kept points around it
+    for first, last in zip(kept[:-1], kept[1:]):
+        a, ab = xy[first], xy[last] - xy[first]
+        inner = xy[first+1:last] - a
+        if len(inner) == 0:
+            continue
+        t = np.clip(inner @ ab / max(float(ab @ ab), 1e-12), 0, 1)
+        assert np.linalg.norm(inner - t[:, None] * ab, axis=1).max() <= tolerance + 1e-9
+
+
+def test_simplify_straight_line():
+    points = np.column_stack((np.linspace(2.3, 2.4, 50), np.full(50, 48.85)))
+    assert simplify(points, 0.1).tolist() == [0, 49]
+    assert simplify(points, 0).tolist() == list(range(50))
+
+
+def test_compact_route():
+    coordinates = random_line(300, seed=1).tolist()
+    route = {"coordinates": coordinates, "elevation_profile": list(range(300)),
+             "alternatives": [{"coordinates": coordinates[:100]}]}
+    assert compact_route(route) is route
+    compact = compact_route(route, "polyline", 15)
+    assert "coordinates" not in compact and route["coordinates"] is coordinates
+    decoded = decode(compact["polyline"])
+    kept = simplify(coordinates, zoom_tolerance(15, float(np.mean(np.array(coordinates)[:, 1]))))
+    assert len(decoded) == len(kept) == len(compact["elevation_profile"])
+    assert compact["elevation_profile"] == kept.tolist()
+    assert "polyline" in compact["alternatives"][0]
+
+
+@pytest.mark.parametrize("route_format, zoom", [("geojson", None), ("polyline", "a"),
+                                                ("polyline", -1), ("coordinates", 25),
+                                                ("polyline", [15])])
+def test_check_format_errors(route_format, zoom):
+    with pytest.raises(UnknownFormatError):
+        check_format(route_format, zoom)
+
+
+def test_check_format():
+    assert check_format("polyline", "12.5") == ("polyline", 12.5)
+    assert check_format("coordinates", None) == ("coordinates", None)
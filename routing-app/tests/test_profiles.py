@@ -0,0 +1,52 @@
+'''
+Tests of the routes of the weight profiles
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts import routing
+from application.python_scripts.search import NoRouteError
+
+from conftest import GRID_STEP, grid_center
+
+
+def node_point(graph, node:int) -> list:
+    '''
+    Return the [lat, lon] of a node.
+    '''
+    return [float(graph.lat[node]), float(graph.lon[node])]
+
+
+@pytest.mark.parametrize("profile", ["fastest", "shortest"])
+def test_estimated_time_is_the_fastest_travel_time(store, profile):
+    graph = store.graph
+    rng = np.random.default_rng(0)
+    for source, target in rng.integers(0, graph.n_nodes, size=(30, 2)).tolist():
+        try:
+            _, edges, _, _ = routing.shortest_path(store, source, target, "dijkstra", profile)
+        except NoRouteError:
+            continue
+        route = routing.get_routing(node_point(graph, source), node_point(graph, target),
+                                    engine="dijkstra", profile=profile)
+        expected = float(graph.weights[edges].sum(dtype=np.float64))
+        assert math.isclose(route["estimated_time"], expected, rel_tol=1e-6, abs_tol=1e-6)
+
+
+@pytest.mark.parametrize("snap", ["node", "edge"])
+def test_shortest_routes_are_not_faster(store, snap):
+    graph = store.graph
+    rng = np.random.default_rng(1)
+    for source, target in rng.integers(0, graph.n_nodes, size=(30, 2)).tolist():
+        start = node_point(graph, source)
+        end = node_point(graph, target)
+        # Start between two nodes of the grid, snapped on an edge with snap="edge"
+        start[0] += 0.3 * GRID_STEP if start[0] < grid_center()[0] else -0.3 * GRID_STEP
+        try:
+            fastest = routing.get_routing(start, end, engine="dijkstra", snap=snap)
+        except NoRouteError:
+            continue
+        shortest = routing.get_routing(start, end, engine="dijkstra", snap=snap,
+                                       profile="shortest")
+        assert shortest["length"] <= fastest["length"] + 1
+        assert shortest["estimated_time"] >= fastest["estimated_time"] * (1 - 1e-6)
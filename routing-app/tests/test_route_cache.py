@@ -0,0 +1,73 @@
+'''
+Tests of the route cache, in memory and on the disk
+'''
+import os
+
+from application.python_scripts import routing
+from application.python_scripts.route_cache import ENTRY_OVERHEAD, RouteCache
+
+from conftest import grid_center
+
+
+def route(points:int=0) -> dict:
+    '''
+    Return a route of a number of points.
+    '''
+    return {"coordinates": [[2.3, 48.8]] * points, "alternatives": []}
+
+
+def test_least_recently_used_routes_are_evicted():
+    cache = RouteCache(max_bytes=3 * ENTRY_OVERHEAD)
+    cache.sync_version("v1")
+    for key in "abc":
+        cache.put(key, route())
+    assert cache.get("a") is not None
+    cache.put("d", route())
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.evictions == 1
+
+
+def test_new_version_empties_the_cache(tmp_path):
+    cache = RouteCache(disk_dir=str(tmp_path))
+    cache.sync_version("v1")
+    cache.put("a", route(), "v1")
+    assert os.listdir(tmp_path) == ["v1"]
+    cache.sync_version("v2")
+    assert cache.get("a") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_disk_cache_is_shared(tmp_path):
+    writer, reader = RouteCache(disk_dir=str(tmp_path)), RouteCache(disk_dir=str(tmp_path))
+    writer.sync_version("v1")
+    reader.sync_version("v1")
+    writer.put("a", route(2), "v1")
+    assert reader.get("a", "v1") == route(2)
+    assert reader.disk_hits == 1
+
+
+def test_route_of_a_previous_version_is_not_served(tmp_path):
+    cache = RouteCache(disk_dir=str(tmp_path))
+    cache.sync_version("v1")
+    # The version changes while the route of v1 is computed
+    cache.sync_version("v2")
+    cache.put("a", route(), "v1")
+    assert cache.get("a", "v2") is None
+    assert len(cache) == 0
+    assert os.listdir(tmp_path) == ["v1"]
+    cache.sync_version("v3")
+    assert os.listdir(tmp_path) == []
+
+
+def test_repeated_routes_are_cached(store):
+    center = list(grid_center())
+    start, end = [center[0] - 0.005, center[1]], [center[0] + 0.005, center[1] + 0.003]
+    first = routing.get_routing(start, end)
+    second = routing.get_routing(start, end)
+    assert not first["cached"] and second["cached"]
+    assert dict(first, cached=None) == dict(second, cached=None)
+    # Another engine is another route
+    assert not routing.get_routing(start, end, engine="dijkstra")["cached"]
+    store.version = "other"
+    assert not routing.get_routing(start, end)["cached"]
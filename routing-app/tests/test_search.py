@@ -0,0 +1,59 @@
+'''
+Tests of the search engines against Dijkstra
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts.search import (NoRouteError, astar, bidirectional_astar,
+                                               dijkstra, single_source, travel_time_bound)
+
+
+def pairs(graph, count:int, seed:int=0) -> list:
+    '''
+    Return random (source, target) pairs of nodes of the graph.
+    '''
+    return np.random.default_rng(seed).integers(0, graph.n_nodes, size=(count, 2)).tolist()
+
+
+def test_travel_time_bound_is_admissible(grid):
+    graph = grid[0]
+    for target in range(0, graph.n_nodes, 37):
+        bound = travel_time_bound(graph, target)
+        costs, _ = single_source(graph.reverse(), target)
+        for v, cost in costs.items():
+            assert bound(v) <= cost
+
+
+@pytest.mark.parametrize("engine", [astar, bidirectional_astar])
+def test_engine_matches_dijkstra(grid, engine):
+    graph = grid[0]
+    for source, target in pairs(graph, 200):
+        try:
+            expected = dijkstra(graph, source, target)
+        except NoRouteError:
+            with pytest.raises(NoRouteError):
+                engine(graph, source, target)
+            continue
+        nodes, edges, cost, _ = engine(graph, source, target)
+        assert math.isclose(cost, expected[2], rel_tol=1e-4)
+        assert nodes[0] == source and nodes[-1] == target and len(edges) == len(nodes) - 1
+
+
+@pytest.mark.parametrize("engine", [dijkstra, astar, bidirectional_astar])
+def test_engine_with_seeds(grid, engine):
+    graph = grid[0]
+    reverse = graph.reverse()
+    offsets, targets, weights = graph.views()
+    r_offsets, r_targets, r_weights = reverse.views()
+    for source, target in pairs(graph, 50, seed=1):
+        # Virtual nodes half way on an edge leaving source and on an edge entering target
+        start = [(targets[offsets[source]], weights[offsets[source]] / 2)]
+        end = [(r_targets[r_offsets[target]], r_weights[r_offsets[target]] / 2)]
+        costs, _ = single_source(graph, start)
+        expected = min(costs.get(node, math.inf) + cost for node, cost in end)
+        if math.isinf(expected):
+            with pytest.raises(NoRouteError):
+                engine(graph, start, end)
+            continue
+        assert math.isclose(engine(graph, start, end)[2], expected, rel_tol=1e-4)
@@ -0,0 +1,71 @@
+'''
+Tests of the snapping of the points on the nodes and the edges of the graph, against a brute
+force search
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts.spatial_index import SpatialIndex
+
+from conftest import GRID_ORIGIN, GRID_SIZE, GRID_STEP
+
+
+@pytest.fixture
+def index(grid) -> SpatialIndex:
+    '''
+    Spatial index of the graph of the grid.
+    '''
+    return SpatialIndex(grid[0])
+
+
+def random_points(count:int, seed:int=0) -> np.ndarray:
+    '''
+    Return random (lat, lon) points in the area of the grid.
+    '''
+    rng = np.random.default_rng(seed)
+    return np.column_stack((GRID_ORIGIN[0] + rng.uniform(0, GRID_SIZE * GRID_STEP, count),
+                            GRID_ORIGIN[1] + rng.uniform(0, GRID_SIZE * GRID_STEP, count)))
+
+
+def test_nearest_nodes(index):
+    points = random_points(200)
+    nodes, distances = index.nearest_nodes(points)
+    xy = index.project(points[:, 0], points[:, 1])
+    brute = np.linalg.norm(xy[:, None, :] - index.xy[None, :, :], axis=2)
+    assert np.allclose(distances, brute.min(axis=1))
+    assert np.allclose(brute[np.arange(len(points)), nodes], brute.min(axis=1))
+
+
+def test_nearest_edges(index):
+    points = random_points(200, seed=1)
+    edges, fractions, distances = index.nearest_edges(points)
+    xy = index.project(points[:, 0], points[:, 1])
+    a, b = index.xy[index.sources], index.xy[index.targets]
+    for point, edge, fraction, distance in zip(xy, edges, fractions, distances):
+        ab = b - a
+        t = np.clip(np.einsum("ij,ij->i", point - a, ab) / np.einsum("ij,ij->i", ab, ab), 0, 1)
+        gaps = np.linalg.norm(a + t[:, None] * ab - point, axis=1)
+        assert math.isclose(distance, gaps.min(), abs_tol=1e-6)
+        assert 0 <= fraction <= 1
+        position = int(np.searchsorted(index.edges, edge))
+        assert math.isclose(gaps[position], gaps.min(), abs_tol=1e-6)
+
+
+def test_virtual_node_costs(index):
+    graph = index.graph
+    points = random_points(50, seed=2)
+    for start, end in zip(index.snap(points, "edge", True), index.snap(points, "edge", False)):
+        weight = float(graph.weights[start.edge])
+        source, target = graph.edge_source(start.edge), int(graph.targets[start.edge])
+        assert math.isclose(dict(start.seeds)[target], (1 - start.fraction) * weight)
+        assert math.isclose(dict(end.seeds)[source], end.fraction * weight)
+        # The start and the end of the same point are on the same edge
+        assert start.edge == end.edge
+        assert math.isclose(index.direct_cost(start, end), 0., abs_tol=1e-9)
+
+
+def test_far_points_are_not_snapped(index):
+    far = [[GRID_ORIGIN[0] - 0.1, GRID_ORIGIN[1]]]
+    assert index.snap(far, "node") == [None]
+    assert index.snap(far, "edge") == [None]
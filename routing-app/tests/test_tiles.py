@@ -0,0 +1,70 @@
+'''
+Tests of the routes on the tiled graph, against Dijkstra on the whole graph
+'''
+import math
+import numpy as np
+import pytest
+
+from application.python_scripts.search import dijkstra
+from application.python_scripts.tiles import TiledGraph, build_tiles
+
+from conftest import GRID_STEP
+
+# Side of the tiles of the tests (degrees), about 5 x 5 nodes of the grid by tile
+TEST_TILE_SIZE = 5 * GRID_STEP
+
+
+@pytest.fixture
+def tiled(grid, tmp_path) -> tuple:
+    '''
+    Tiled graph of the grid, with the global index of each node of the graph.
+    '''
+    graph, edges, bbox = grid
+    path = str(tmp_path / "tiles")
+    build_tiles(graph, edges, bbox, path, tile_size=TEST_TILE_SIZE, verbose=False)
+    tiled = TiledGraph(path)
+    osm_ids = np.empty(graph.n_nodes, dtype=np.int64)
+    for t in range(len(tiled.keys)):
+        tile = tiled.tile(t)
+        osm_ids[tile.node_offset:tile.node_offset+tile.n_own] = tile.graph.node_ids[:tile.n_own]
+    order = np.argsort(osm_ids)
+    global_index = order[np.searchsorted(osm_ids[order], graph.node_ids)]
+    return tiled, global_index
+
+
+def test_tiles_cover_the_graph(grid, tiled):
+    graph = grid[0]
+    tiled, global_index = tiled
+    assert len(tiled.keys) > 4
+    assert sorted(global_index.tolist()) == list(range(graph.n_nodes))
+    assert int(tiled.tile_edge_offsets[-1]) == graph.n_edges
+
+
+def test_routes_across_tiles(grid, tiled):
+    graph = grid[0]
+    tiled, global_index = tiled
+    rng = np.random.default_rng(0)
+    for source, target in rng.integers(0, graph.n_nodes, size=(40, 2)).tolist():
+        _, _, expected, _ = dijkstra(graph, source, target)
+        nodes, edges, cost, _ = tiled.shortest_path(int(global_index[source]),
+                                                    int(global_index[target]))
+        assert math.isclose(cost, expected, rel_tol=1e-5, abs_tol=1e-6)
+        assert nodes[0] == global_index[source] and nodes[-1] == global_index[target]
+        assert len(edges) == len(nodes) - 1
+        # The edges of the unpacked path give its cost
+        weights = 0.
+        for edge in edges:
+            tile = tiled.tile(tiled.tile_of_edge(edge))
+            weights += float(tile.graph.weights[edge - tile.edge_offset])
+        assert math.isclose(weights, cost, rel_tol=1e-5, abs_tol=1e-6)
+
+
+def test_memory_budget(grid, tiled):
+    graph = grid[0]
+    tiled, global_index = tiled
+    tiled = TiledGraph(tiled.path, max_bytes=1)
+    tiled.shortest_path(int(global_index[0]), int(global_index[graph.n_nodes - 1]))
+    stats = tiled.stats()
+    # Only the last tile loaded is kept
+    assert stats["loaded_tiles"] == 1
+    assert stats["evictions"] > 0